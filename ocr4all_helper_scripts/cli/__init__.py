@@ -4,16 +4,35 @@ from ocr4all_helper_scripts.cli.skewestimate import skewestimate_cli
 from ocr4all_helper_scripts.cli.sync_text_equiv import sync_text_equiv_cli
 from ocr4all_helper_scripts.cli.kraken import kraken_cli
 from ocr4all_helper_scripts.cli.calamari_eval_wrapper import calamari_eval_cli
+from ocr4all_helper_scripts.cli.pagedir2pagexml import pagedir2pagexml_cli
+from ocr4all_helper_scripts.cli.pipeline import pipeline_cli
+from ocr4all_helper_scripts.cli.merge_metrics import merge_metrics_cli
+from ocr4all_helper_scripts.cli.sweep import sweep_cli
+from ocr4all_helper_scripts.lib import kernels
+from ocr4all_helper_scripts.utils import logs
 
 import click
 
 
 @click.group()
 @click.version_option()
-def cli(**kwargs):
+@click.option("--kernels", "kernel_backend", type=click.Choice(kernels.BACKENDS), default="auto",
+              envvar="OCR4ALL_KERNELS", show_default=True,
+              help="Backend of the sequential scan kernels of the line segmentation. 'auto' uses the JIT compiled "
+                   "numba kernels if numba is installed and the NumPy kernels otherwise.")
+@click.option("--log-level", type=click.Choice(logs.LEVELS), default="info", envvar="OCR4ALL_LOG_LEVEL",
+              show_default=True,
+              help="Minimum level of the logged messages. Messages about single regions are logged at 'debug'.")
+@click.option("-q", "--quiet", is_flag=True, help="Only log warnings and errors (same as --log-level warning).")
+@click.option("--log-json", is_flag=True, envvar="OCR4ALL_LOG_JSON",
+              help="Log one JSON object per message with its level, time, thread and fields like page and region.")
+def cli(kernel_backend: str, log_level: str, quiet: bool, log_json: bool, **kwargs):
     """
     CLI entrypoint for OCR4all-helper-scripts
     """
+    listener = logs.configure("warning" if quiet else log_level, log_json)
+    click.get_current_context().call_on_close(listener.stop)
+    kernels.use(kernel_backend)
 
 
 cli.add_command(legacyconvert_cli)
@@ -22,3 +41,7 @@ cli.add_command(skewestimate_cli)
 cli.add_command(sync_text_equiv_cli)
 cli.add_command(kraken_cli)
 cli.add_command(calamari_eval_cli)
+cli.add_command(pagedir2pagexml_cli)
+cli.add_command(pipeline_cli)
+cli.add_command(merge_metrics_cli)
+cli.add_command(sweep_cli)
@@ -1,4 +1,5 @@
 from ocr4all_helper_scripts.helpers import kraken_helper
+from ocr4all_helper_scripts.utils import metrics
 
 
 import click
@@ -6,11 +7,22 @@ import click
 
 @click.command("kraken", help="Sync region text equiv elements with textline text equiv content.")
 @click.argument("FILES", nargs=-1, required=True, type=str)
-def kraken_cli(files):
-    helper = kraken_helper.KrakenHelper(files)
+@click.option("--metrics", "metrics_file", type=str, default=None,
+              help="Write a summary of throughput, latencies and worker utilisation of the run to this file. Uses the "
+                   "Prometheus textfile format for files ending with .prom and JSON otherwise.")
+@click.option("--cache", "cache_dir", type=str, default=None, envvar="OCR4ALL_KRAKEN_CACHE",
+              help="Directory caching the raw kraken results by image content, kraken version and options. Images "
+                   "with a cached result aren't segmented again, the postprocessing runs on all results.")
+def kraken_cli(files, metrics_file, cache_dir):
+    run_metrics = metrics.RunMetrics("kraken") if metrics_file else None
+    helper = kraken_helper.KrakenHelper(files, run_metrics, cache_dir)
     helper.run()
     helper.postprocess()
 
+    if run_metrics is not None:
+        run_metrics.finish()
+        run_metrics.write(metrics_file)
+
 
 if __name__ == "__main__":
     kraken_cli()
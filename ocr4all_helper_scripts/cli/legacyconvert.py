@@ -1,16 +1,24 @@
 from ocr4all_helper_scripts.helpers import legacyconvert_helper
 
 from pathlib import Path
+from multiprocessing.pool import ThreadPool
+
 import click
 
 
 @click.command("legacy-convert", help="Convert legacy OCR4all projects to latest.")
 @click.option("-p", "--path", type=str, required=True, help="Path to the OCR4all project.")
-def legacyconvert_cli(path):
-    for xml in sorted(list(Path(path).glob("*.xml"))):
+@click.option("--parallel", type=int, default=1, help="Number of threads parallelly working on pages.")
+def legacyconvert_cli(path, parallel):
+    def convert(xml: Path):
         updated_page = legacyconvert_helper.convert_page(xml)
         legacyconvert_helper.write_xml(xml, updated_page)
 
+    xmls = sorted(Path(path).glob("*.xml"))
+
+    with ThreadPool(processes=max(1, min(parallel, len(xmls)))) as pool:
+        pool.map(convert, xmls)
+
 
 if __name__ == "__main__":
     legacyconvert_cli()
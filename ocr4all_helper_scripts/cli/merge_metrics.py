@@ -0,0 +1,31 @@
+from ocr4all_helper_scripts.utils import metrics
+
+import json
+from pathlib import Path
+
+import click
+
+
+@click.command("merge-metrics", help="Merge the JSON metrics summaries of several runs, e.g. of the shards of a "
+                                     "dataset processed on different nodes, into a single summary including all "
+                                     "failed pages.")
+@click.argument("FILES", nargs=-1, required=True)
+@click.option("-o", "--output", type=str, required=True,
+              help="Output file. Uses the Prometheus textfile format for files ending with .prom and JSON otherwise.")
+def merge_metrics_cli(files, output):
+    summaries = []
+    for file in files:
+        if Path(file).suffix == ".prom":
+            raise click.BadParameter(f"'{file}' is a Prometheus textfile, only JSON summaries can be merged")
+        with Path(file).open("r") as summary_file:
+            summaries.append(json.load(summary_file))
+
+    summary = metrics.merge(summaries)
+    metrics.write_summary(summary, output)
+
+    for failure in summary["failures"]:
+        click.echo(f"FAILED: {failure['page']} ({failure['error']})", err=True)
+
+
+if __name__ == "__main__":
+    merge_metrics_cli()
@@ -0,0 +1,19 @@
+from ocr4all_helper_scripts.helpers import pagedir2pagexml_helper
+
+import click
+
+
+@click.command("pagedir2pagexml", help="Integrate region and line information of legacy page directories into PAGE "
+                                       "XML files.")
+@click.argument("XMLFILES", nargs=-1, required=True, type=str)
+@click.option("--ocrindex", type=int, default=1, help="Index attribute of the OCR text.")
+@click.option("--gtindex", type=int, default=0, help="Index attribute of the ground truth text.")
+@click.option("-o", "--output", type=str, default=None,
+              help="Output directory. (Will overwrite the PAGE XML files if no output directory is given)")
+@click.option("-p", "--parallel", type=int, default=1, help="Number of threads parallelly working on pages.")
+def pagedir2pagexml_cli(xmlfiles, ocrindex, gtindex, output, parallel):
+    pagedir2pagexml_helper.loopfiles(ocrindex, gtindex, list(xmlfiles), output, parallel)
+
+
+if __name__ == "__main__":
+    pagedir2pagexml_cli()
@@ -1,114 +1,185 @@
 from ocr4all_helper_scripts.helpers import pagelineseg_helper
+from ocr4all_helper_scripts.utils import imageutils, runner, scheduling
 
-from pathlib import Path
-import json
-from multiprocessing.pool import ThreadPool
+from typing import Tuple, Union
 
 import click
 
 
+class WorkingScale(click.ParamType):
+    """Working scale of the line segmentation, either "auto" or a float in (0, 1]."""
+    name = "scale"
+
+    def convert(self, value, param, ctx) -> Union[float, str]:
+        if value == "auto":
+            return value
+        try:
+            working_scale = float(value)
+        except (TypeError, ValueError):
+            self.fail(f"'{value}' is neither 'auto' nor a number", param, ctx)
+        if not 0 < working_scale <= 1:
+            self.fail(f"{working_scale} is not between 0 (exclusive) and 1", param, ctx)
+        return working_scale
+
+
+WORKING_SCALE = WorkingScale()
+
+
+def segmentation_options(func):
+    """Adds the line segmentation parameters shared by the pagelineseg and pipeline commands."""
+    options = [
+        click.option("--remove-images", is_flag=True, default=True,
+                     help="Remove ImageRegions from the image before processing TextRegions for TextLines. Can be "
+                          "used if ImageRegions overlap with TextRegions."),
+        click.option("--minscale", type=float, default=5.0,
+                     help="Minimum scale permitted."),
+        click.option("--maxlines", type=int, default=300,
+                     help="Maximum number of lines permitted."),
+        click.option("--threshold", type=float, default=0.2,
+                     help="Baseline threshold."),
+        click.option("--usegauss", is_flag=True, help="Use gaussian instead of uniform."),
+        click.option("-s", "--scale", type=float, default=None,
+                     help="Scale of the input image used for the line segmentation. Will be estimated if not "
+                          "defined, 0 or smaller."),
+        click.option("--hscale", type=float, default=1.0,
+                     help="Non-standard scaling of horizontal parameters."),
+        click.option("--vscale", type=float, default=1.0,
+                     help="Non-standard scaling of vertical parameters."),
+        click.option("--filter-strength", type=float, default=1.0,
+                     help="Strength individual characters are filtered out when creating a textline."),
+        click.option("-m", "--maxskew", type=float, default=2.0,
+                     help="Maximal estimated skew of an image."),
+        click.option("--skewsteps", type=int, default=8,
+                     help="Steps between 0 and +maxskew/-maxskew to estimate the possible skew of a region. Higher "
+                          "values will be more precise but will also take longer."),
+        click.option("-p", "--parallel", type=int, default=1,
+                     help="Number of threads parallelly working on images."),
+        click.option("-x", "--smear-x", type=float, default=2.0,
+                     help="Smearing strength in X direction for the algorithm calculating the textline polygon "
+                          "wrapping all contents."),
+        click.option("-y", "--smear-y", type=float, default=1.0,
+                     help="Smearing strength in Y direction for the algorithm calculating the textline polygon "
+                          "wrapping all contents."),
+        click.option("--growth-x", type=float, default=1.1,
+                     help="Growth in X direction for every iteration of the textline polygon finding. Will speed up "
+                          "the algorithm at the cost of precision."),
+        click.option("--growth-y", type=float, default=1.1,
+                     help="Growth in Y direction for every iteration of the textline polygon finding. Will speed up "
+                          "the algorithm at the cost of precision."),
+        click.option("--fail-save", type=int, default=50,
+                     help="Fail save to counter infinite loops when combining contours to a precise textline. Will "
+                          "connect remaining contours with lines."),
+        click.option("--max-blackseps", type=int, default=0,
+                     help="Maximum amount of black column separators."),
+        click.option("--widen-blackseps", type=int, default=10,
+                     help="Widen black separators (to account for warping)."),
+        click.option("--max-whiteseps", type=int, default=-1,
+                     help="Maximum amount of whitespace column separators."),
+        click.option("--minheight-whiteseps", type=int, default=10,
+                     help="Minimum column height (units=scale)."),
+        click.option("--bounding-rectangle", is_flag=True, default=False,
+                     help="Uses bounding rectangles instead of polygons."),
+        click.option("--working-scale", type=WORKING_SCALE, default="1",
+                     help="Resolution (e.g. 0.5 or 0.25) the scale, line seeds and labels are computed at before the "
+                          "line masks and polygons are refined at full resolution. 'auto' picks it from the scale "
+                          "estimated on a downsampled region. Speeds up high resolution input."),
+        click.option("--shared-preprocessing", is_flag=True, default=False,
+                     help="Binarize the page and estimate its scale once for all regions instead of for every "
+                          "region on its own."),
+        click.option("--region-timeout", type=float, default=None,
+                     help="Time budget in seconds for the line segmentation of a single region. Lines of regions "
+                          "exceeding it fall back to bounding boxes or a single region line."),
+        click.option("--page-timeout", type=float, default=None,
+                     help="Time budget in seconds for the line segmentation of all regions of a page. Remaining "
+                          "regions fall back to a single region line once it is exceeded."),
+        click.option("--polygon-engine", type=click.Choice(["smear", "envelope"]), default="smear",
+                     help="Algorithm calculating the textline polygons. 'smear' iteratively smears the line contents "
+                          "together, 'envelope' builds each polygon in a single pass along the upper and lower "
+                          "outline of the line contents at a fixed cost per line."),
+        click.option("--line-images", "line_images_dir", type=str, default=None,
+                     help="Write the deskewed bi-level (.bin.png) and grayscale (.nrm.png) image of every TextLine, "
+                          "cut out during the line segmentation, and their coordinates (lines.json) into a "
+                          "subdirectory per page of this directory."),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def segmentation_parameters(remove_images: bool, minscale: float, maxlines: int, threshold: float, usegauss: bool,
+                            scale: float, hscale: float, vscale: float, filter_strength: float, maxskew: float,
+                            skewsteps: int, smear_x: float, smear_y: float, growth_x: float, growth_y: float,
+                            fail_save: int, max_blackseps: int, widen_blackseps: int, max_whiteseps: int,
+                            minheight_whiteseps: int, bounding_rectangle: bool, working_scale: Union[float, str],
+                            shared_preprocessing: bool, region_timeout: float, page_timeout: float,
+                            polygon_engine: str, line_images_dir: str) -> dict:
+    """Maps the values of the segmentation_options to the keyword arguments of pagelineseg_helper.pagelineseg."""
+    return dict(scale=scale,
+                vscale=vscale,
+                hscale=hscale,
+                max_blackseps=max_blackseps,
+                widen_blackseps=widen_blackseps,
+                max_whiteseps=max_whiteseps,
+                minheight_whiteseps=minheight_whiteseps,
+                minscale=minscale,
+                maxlines=maxlines,
+                threshold=threshold,
+                smear_strength=(smear_x, smear_y),
+                growth=(growth_x, growth_y),
+                filter_strength=filter_strength,
+                fail_save_iterations=fail_save,
+                maxskew=maxskew,
+                skewsteps=skewsteps,
+                usegauss=usegauss,
+                remove_images=remove_images,
+                bounding_box=bounding_rectangle,
+                # Values of sweep grids don't pass the option type
+                working_scale=WORKING_SCALE.convert(working_scale, None, None),
+                shared_preprocessing=shared_preprocessing,
+                region_timeout=region_timeout,
+                page_timeout=page_timeout,
+                polygon_engine=polygon_engine,
+                line_images_dir=line_images_dir)
+
+
+def load_page(image: str, pagexml: str):
+    """Loads the inputs of a page ahead of its processing. Bi-level images wait for their worker packed to one bit per
+    pixel.
+    """
+    return imageutils.pack_bits(pagelineseg_helper.load_page(pagexml, image, preload=True))
+
+
+def run_dataset(dataset: str, parallel: int, command: str = "pagelineseg", metrics_file: str = None,
+                shard: Tuple[int, int] = None, order: str = "dataset", prefetch: int = 0, write_buffer: int = 0,
+                max_memory: int = 0, profile_dir: str = None, **kwargs):
+    """Runs pagelineseg_helper.pagelineseg with the given keyword arguments on every entry of a dataset file (or the
+    given (index, count) shard of it), see runner.run_dataset.
+    """
+    def process(image, pagexml, path_out, page):
+        page = imageutils.unpack_bits(page) if page is not None else None
+        yield path_out, pagelineseg_helper.pagelineseg(pagexml, image, page=page, **kwargs)
+
+    runner.run_dataset(dataset, parallel, process, load_page, command=command,
+                       bytes_per_pixel=scheduling.PAGELINESEG_BYTES_PER_PIXEL, metrics_file=metrics_file, shard=shard,
+                       order=order, prefetch=prefetch, write_buffer=write_buffer, max_memory=max_memory,
+                       profile_dir=profile_dir)
+
+
 @click.command("pagelineseg",
                help="Line segmentation with regions read from a PAGE xml file")
 @click.option("--dataset", type=str, required=True,
               help="Path to the input dataset in json format with a list of image path, PAGE XML path and optional "
                    "output path. (Will overwrite pagexml if no output path is given)")
-@click.option("--remove-images", is_flag=True, default=True,
-              help="Remove ImageRegions from the image before processing TextRegions for TextLines. Can be used if "
-                   "ImageRegions overlap with TextRegions.")
-@click.option("--minscale", type=float, default=5.0,
-              help="Minimum scale permitted.")
-@click.option("--maxlines", type=int, default=300,
-              help="Maximum number of lines permitted.")
-@click.option("--threshold", type=float, default=0.2,
-              help="Baseline threshold.")
-@click.option("--usegauss", is_flag=True, help="Use gaussian instead of uniform.")
-@click.option("-s", "--scale", type=float, default=None,
-              help="Scale of the input image used for the line segmentation. Will be estimated if not defined, 0 or "
-                   "smaller.")
-@click.option("--hscale", type=float, default=1.0,
-              help="Non-standard scaling of horizontal parameters.")
-@click.option("--vscale", type=float, default=1.0,
-              help="Non-standard scaling of vertical parameters.")
-@click.option("--filter-strength", type=float, default=1.0,
-              help="Strength individual characters are filtered out when creating a textline.")
-@click.option("-m", "--maxskew", type=float, default=2.0,
-              help="Maximal estimated skew of an image.")
-@click.option("--skewsteps", type=int, default=8,
-              help="Steps between 0 and +maxskew/-maxskew to estimate the possible skew of a region. Higher values "
-                   "will be more precise but will also take longer.")
-@click.option("-p", "--parallel", type=int, default=1,
-              help="Number of threads parallelly working on images.")
-@click.option("-x", "--smear-x", type=float, default=2.0,
-              help="Smearing strength in X direction for the algorithm calculating the textline polygon wrapping all "
-                   "contents.")
-@click.option("-y", "--smear-y", type=float, default=1.0,
-              help="Smearing strength in Y direction for the algorithm calculating the textline polygon wrapping all "
-                   "contents.")
-@click.option("--growth-x", type=float, default=1.1,
-              help="Growth in X direction for every iteration of the textline polygon finding. Will speed up the "
-                   "algorithm at the cost of precision.")
-@click.option("--growth-y", type=float, default=1.1,
-              help="Growth in Y direction for every iteration of the textline polygon finding. Will speed up the "
-                   "algorithm at the cost of precision.")
-@click.option("--fail-save", type=int, default=50,
-              help="Fail save to counter infinite loops when combining contours to a precise textline. Will connect "
-                   "remaining contours with lines.")
-@click.option("--max-blackseps", type=int, default=0,
-              help="Maximum amount of black column separators.")
-@click.option("--widen-blackseps", type=int, default=10,
-              help="Widen black separators (to account for warping).")
-@click.option("--max-whiteseps", type=int, default=-1,
-              help="Maximum amount of whitespace column separators.")
-@click.option("--minheight-whiteseps", type=int, default=10,
-              help="Minimum column height (units=scale).")
-@click.option("--bounding-rectangle", is_flag=True, default=False, help="Uses bounding rectangles instead of polygons.")
-def pagelineseg_cli(dataset: str, remove_images: bool, minscale: float, maxlines: int, threshold: float,
-                    usegauss: bool, scale: float, hscale: float, vscale: float, filter_strength: float, maxskew: float,
-                    skewsteps: int, parallel: int, smear_x: float, smear_y: float, growth_x: float, growth_y: float,
-                    fail_save: int, max_blackseps: int, widen_blackseps: int, max_whiteseps: int,
-                    minheight_whiteseps: int, bounding_rectangle: bool):
-    with Path(dataset).open('r') as data_file:
-        dataset = json.load(data_file)
-
-    # Parallel processes for the pagexmllineseg cli
-    def parallel_proc(data):
-        if len(data) == 3:
-            image, pagexml, path_out = data
-        elif len(data) == 2:
-            image, pagexml = data
-            path_out = pagexml
-        else:
-            raise ValueError(f"Invalid data line with length {len(data)} instead of 2 or 3")
-
-        xml_output = pagelineseg_helper.pagelineseg(pagexml, image,
-                                                    scale=scale,
-                                                    vscale=vscale,
-                                                    hscale=hscale,
-                                                    max_blackseps=max_blackseps,
-                                                    widen_blackseps=widen_blackseps,
-                                                    max_whiteseps=max_whiteseps,
-                                                    minheight_whiteseps=minheight_whiteseps,
-                                                    minscale=minscale,
-                                                    maxlines=maxlines,
-                                                    smear_strength=(smear_x, smear_y),
-                                                    growth=(growth_x, growth_y),
-                                                    filter_strength=filter_strength,
-                                                    fail_save_iterations=fail_save,
-                                                    maxskew=maxskew,
-                                                    skewsteps=skewsteps,
-                                                    usegauss=usegauss,
-                                                    remove_images=remove_images,
-                                                    bounding_box=bounding_rectangle)
-
-        with Path(path_out).open("w+") as output_file:
-            pagelineseg_helper.s_print(f"Save annotations into '{path_out}'")
-            output_file.write(xml_output)
-
-    pagelineseg_helper.s_print(f"Process {len(dataset)} images, with {parallel} in parallel")
-
-    # Pool of all parallel processed pagexmllineseg
-    with ThreadPool(processes=min(parallel, len(dataset))) as pool:
-        pool.map(parallel_proc, dataset)
+@click.option("--metrics", "metrics_file", type=str, default=None,
+              help="Write a summary of throughput, latencies and worker utilisation of the run to this file. Uses the "
+                   "Prometheus textfile format for files ending with .prom and JSON otherwise.")
+@runner.run_options
+@segmentation_options
+def pagelineseg_cli(dataset: str, parallel: int, metrics_file: str, shard: Tuple[int, int], order: str,
+                    prefetch: int, write_buffer: int, max_memory: int, profile_dir: str, **kwargs):
+    run_dataset(dataset, parallel, metrics_file=metrics_file, shard=shard, order=order, prefetch=prefetch,
+                write_buffer=write_buffer, max_memory=max_memory, profile_dir=profile_dir,
+                **segmentation_parameters(**kwargs))
 
 
 if __name__ == "__main__":
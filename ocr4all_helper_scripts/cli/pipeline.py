@@ -0,0 +1,30 @@
+from ocr4all_helper_scripts.cli.pagelineseg import segmentation_options, segmentation_parameters, run_dataset
+from ocr4all_helper_scripts.utils import runner
+
+from typing import Tuple
+
+import click
+
+
+@click.command("pipeline",
+               help="Skew estimation and line segmentation of regions read from a PAGE XML file in a single pass per "
+                    "page.")
+@click.option("--dataset", type=str, required=True,
+              help="Path to the input dataset in json format with a list of image path, PAGE XML path and optional "
+                   "output path. (Will overwrite pagexml if no output path is given)")
+@click.option("--from-scratch", is_flag=True,
+              help="Overwrite existing orientation angels, by calculating them from scratch.")
+@click.option("--metrics", "metrics_file", type=str, default=None,
+              help="Write a summary of throughput, latencies and worker utilisation of the run to this file. Uses the "
+                   "Prometheus textfile format for files ending with .prom and JSON otherwise.")
+@runner.run_options
+@segmentation_options
+def pipeline_cli(dataset: str, from_scratch: bool, parallel: int, metrics_file: str, shard: Tuple[int, int],
+                 order: str, prefetch: int, write_buffer: int, max_memory: int, profile_dir: str, **kwargs):
+    run_dataset(dataset, parallel, command="pipeline", metrics_file=metrics_file, shard=shard, order=order,
+                prefetch=prefetch, write_buffer=write_buffer, max_memory=max_memory, profile_dir=profile_dir,
+                skewestimate=True, from_scratch=from_scratch, **segmentation_parameters(**kwargs))
+
+
+if __name__ == "__main__":
+    pipeline_cli()
@@ -1,8 +1,5 @@
 from ocr4all_helper_scripts.helpers import skewestimate_helper
-
-import json
-from pathlib import Path
-from multiprocessing.pool import ThreadPool
+from ocr4all_helper_scripts.utils import runner, scheduling
 
 import click
 
@@ -19,33 +16,27 @@ import click
               help="Steps bewteen 0 and +maxskew/-maxskew to estimate a skew of a region. Higher values will be more "
                    "precise but will also take longer.")
 @click.option("-p", "--parallel", type=int, default=1, help="Number of threads parallelly working on images.")
-def skewestimate_cli(dataset, from_scratch, maxskew, skewsteps, parallel):
-    with Path(dataset).open("r") as data_file:
-        dataset = json.load(data_file)
-
-    # Parallel processes for the pagexmllineseg
-    def parallel_proc(data):
-        if len(data) == 3:
-            image, pagexml, pagexml_out = data
-        elif len(data) == 2:
-            image, pagexml = data
-            pagexml_out = pagexml
-        else:
-            raise ValueError("Invalid data line with length {} "
-                             "instead of 2 or 3".format(len(data)))
-
-        xml_output, _ = skewestimate_helper.pagexmlskewestimate(pagexml, image, from_scratch,
-                                            maxskew, skewsteps)
-        with open(pagexml_out, 'w+') as output_file:
-            skewestimate_helper.s_print("Save annotations into '{}'".format(pagexml_out))
-            output_file.write(xml_output)
-
-    skewestimate_helper.s_print("Process {} images, with {} in parallel"
-            .format(len(dataset), parallel))
-
-    # Pool of all parallel processed pagexmllineseg
-    with ThreadPool(processes=min(parallel, len(dataset))) as pool:
-        pool.map(parallel_proc, dataset)
+@click.option("--reduce", type=click.Choice(["1", "2", "4", "8"]), default="1",
+              help="Decode JPEG images at 1/2, 1/4 or 1/8 of their resolution for the skew estimation. Faster at the "
+                   "cost of precision.")
+@click.option("--metrics", "metrics_file", type=str, default=None,
+              help="Write a summary of throughput, latencies and worker utilisation of the run to this file. Uses the "
+                   "Prometheus textfile format for files ending with .prom and JSON otherwise.")
+@runner.run_options
+def skewestimate_cli(dataset, from_scratch, maxskew, skewsteps, parallel, reduce, metrics_file, shard, order,
+                     prefetch, write_buffer, max_memory, profile_dir):
+    def load(image, pagexml):
+        return skewestimate_helper.load_page(pagexml, image, int(reduce), preload=True)
+
+    def process(image, pagexml, pagexml_out, page):
+        xml_output, _ = skewestimate_helper.pagexmlskewestimate(pagexml, image, from_scratch, maxskew, skewsteps,
+                                                                int(reduce), page)
+        yield pagexml_out, xml_output
+
+    runner.run_dataset(dataset, parallel, process, load, command="skewestimate",
+                       bytes_per_pixel=scheduling.SKEWESTIMATE_BYTES_PER_PIXEL, metrics_file=metrics_file, shard=shard,
+                       order=order, prefetch=prefetch, write_buffer=write_buffer, max_memory=max_memory,
+                       profile_dir=profile_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+from ocr4all_helper_scripts.cli.pagelineseg import load_page, segmentation_options, segmentation_parameters
+from ocr4all_helper_scripts.helpers import pagelineseg_helper
+from ocr4all_helper_scripts.utils import imageutils, runner, scheduling
+
+from copy import deepcopy
+from itertools import product
+from pathlib import Path
+import json
+import logging
+from typing import Dict, List, Tuple
+
+import click
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_grid(grid: str, options: Dict[str, object]) -> List[dict]:
+    """Reads the parameter sets of a sweep from a JSON file, either a list of objects mapping option names to values or
+    an object mapping option names to lists of values, of which all combinations are used. Option names are the names
+    of the segmentation options with hyphens or underscores (e.g. smear-x or smear_x).
+
+    :param options: Values of all segmentation options, used to validate the option names.
+    :return: Parameter sets mapping the option parameter names to values.
+    """
+    with Path(grid).open("r") as grid_file:
+        content = json.load(grid_file)
+
+    if isinstance(content, dict):
+        names = list(content)
+        values = [content[name] if isinstance(content[name], list) else [content[name]] for name in names]
+        parameter_sets = [dict(zip(names, combination)) for combination in product(*values)]
+    elif isinstance(content, list) and all(isinstance(parameter_set, dict) for parameter_set in content):
+        parameter_sets = content
+    else:
+        raise click.BadParameter("Grid has to be a list of objects or an object of lists", param_hint="--grid")
+
+    normalized = []
+    for parameter_set in parameter_sets:
+        parameters = {}
+        for name, value in parameter_set.items():
+            parameter = name.lstrip("-").replace("-", "_")
+            if parameter not in options or parameter == "parallel":
+                raise click.BadParameter(f"Unknown segmentation option '{name}'", param_hint="--grid")
+            parameters[parameter] = value
+        normalized.append(parameters)
+    if not normalized:
+        raise click.BadParameter("Grid holds no parameter sets", param_hint="--grid")
+    return normalized
+
+
+@click.command("sweep",
+               help="Line segmentation of a dataset with every parameter set of a grid. Stages whose inputs are the "
+                    "same for several parameter sets (e.g. cutout, skew estimation, binarization and scale estimation "
+                    "when sweeping --threshold) are only computed once per page.")
+@click.option("--dataset", type=str, required=True,
+              help="Path to the input dataset in json format with a list of image path, PAGE XML path and optional "
+                   "output path. Only the file name of the output path is used.")
+@click.option("--grid", type=str, required=True,
+              help="JSON file with the parameter sets, either a list of objects mapping segmentation options to values "
+                   "(e.g. [{\"threshold\": 0.1}, {\"threshold\": 0.2, \"smear-x\": 3}]) or an object mapping options "
+                   "to lists of values of which all combinations are used. Options missing in a parameter set have "
+                   "the values given on the command line.")
+@click.option("-o", "--output", type=str, required=True,
+              help="Directory the results are written to, into a subdirectory per parameter set. The parameter sets "
+                   "are listed in parameter_sets.json.")
+@click.option("--metrics", "metrics_file", type=str, default=None,
+              help="Write a summary of throughput, latencies, worker utilisation and shared stages of the run to this "
+                   "file. Uses the Prometheus textfile format for files ending with .prom and JSON otherwise.")
+@runner.run_options
+@segmentation_options
+def sweep_cli(dataset: str, grid: str, output: str, parallel: int, metrics_file: str, shard: Tuple[int, int],
+              order: str, prefetch: int, write_buffer: int, max_memory: int, profile_dir: str, **kwargs):
+    parameter_sets = load_grid(grid, dict(kwargs, parallel=parallel))
+    names = ["set_{:03d}".format(n + 1) for n in range(len(parameter_sets))]
+    configurations = {}
+    for name, parameter_set in zip(names, parameter_sets):
+        parameters = segmentation_parameters(**dict(kwargs, **parameter_set))
+        if parameters["line_images_dir"]:
+            parameters["line_images_dir"] = str(Path(parameters["line_images_dir"], name))
+        configurations[name] = parameters
+        Path(output, name).mkdir(parents=True, exist_ok=True)
+    with Path(output, "parameter_sets.json").open("w") as sets_file:
+        json.dump(dict(zip(names, parameter_sets)), sets_file, indent=2)
+
+    def process(image, pagexml, path_out, page):
+        root, im = imageutils.unpack_bits(page) if page is not None else \
+            pagelineseg_helper.load_page(pagexml, image, preload=True)
+        # Results of the stages shared by the parameter sets of this page
+        cache = {}
+        for name, parameters in configurations.items():
+            yield Path(output, name, Path(path_out).name), \
+                pagelineseg_helper.pagelineseg(pagexml, image, page=(deepcopy(root), im), cache=cache, **parameters)
+
+    logger.info("Sweep %s parameter sets", len(configurations))
+    runner.run_dataset(dataset, parallel, process, load_page, command="sweep",
+                       bytes_per_pixel=scheduling.PAGELINESEG_BYTES_PER_PIXEL, metrics_file=metrics_file, shard=shard,
+                       order=order, prefetch=prefetch, write_buffer=write_buffer, max_memory=max_memory,
+                       profile_dir=profile_dir)
+
+
+if __name__ == "__main__":
+    sweep_cli()
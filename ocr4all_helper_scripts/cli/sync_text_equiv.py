@@ -1,5 +1,8 @@
-from typing import Tuple
+from ocr4all_helper_scripts.utils import pagexml
+
+from typing import Dict, List, Tuple
 from pathlib import Path
+from multiprocessing.pool import ThreadPool
 
 import click
 from lxml import etree
@@ -7,45 +10,67 @@ from lxml import etree
 
 @click.command("sync-text-equiv", help="Sync region text equiv elements with textline text equiv content.")
 @click.argument("FILES", nargs=-1, required=True, type=str)
-def sync_text_equiv_cli(files):
-    for file in files:
-        root = etree.parse(str(file)).getroot()
-        ns = {"ns": root.nsmap[None]}
-
-        text_regions = root.xpath(".//ns:TextRegion", namespaces=ns)
-        for text_region in text_regions:
-            gt_text, rec_text = get_text_content(text_region)
-            if gt_text:
-                set_text(ns, text_region, gt_text, "0")
-            if rec_text:
-                set_text(ns, text_region, rec_text, "1")
+@click.option("-p", "--parallel", type=int, default=1, help="Number of threads parallelly working on files.")
+def sync_text_equiv_cli(files, parallel):
+    with ThreadPool(processes=max(1, min(parallel, len(files)))) as pool:
+        pool.map(sync_file, files)
+
+
+def sync_file(file: str) -> bool:
+    """Syncs the region text of a single PAGE XML file and only writes it back if anything changed.
+
+    :param file: Path to the PAGE XML file.
+    :return: Whether the file was rewritten.
+    """
+    root = pagexml.parse(file)
+
+    changed = False
+    for text_region in pagexml.iter_regions(root):
+        gt_text, rec_text = get_text_content(text_region)
+        if gt_text:
+            changed |= set_text(text_region, gt_text, "0")
+        if rec_text:
+            changed |= set_text(text_region, rec_text, "1")
+
+    if changed:
         with Path(file).open("w") as outfile:
             outfile.write(etree.tostring(root, encoding="unicode", pretty_print=True))
+    return changed
 
 
-def set_text(ns: dict, text_region: etree.Element, content: str, index: str):
-    existing_equiv = text_region.xpath(f"./ns:TextEquiv[@index='{index}']", namespaces=ns)
+def set_text(text_region: etree.Element, content: str, index: str) -> bool:
+    """Sets the content of the region TextEquiv with the given index.
+
+    :return: Whether the region was modified.
+    """
+    existing_equiv = pagexml.text_equivs(text_region, index)
     if len(existing_equiv) == 1:
-        existing_equiv[0].find("./{*}Unicode").text = content
+        unicode = pagexml.child(existing_equiv[0], "Unicode")
+        if unicode.text == content:
+            return False
+        unicode.text = content
     else:
         equiv = etree.SubElement(text_region, "TextEquiv")
         equiv.set("index", index)
         unicode = etree.SubElement(equiv, "Unicode")
         unicode.text = content
+    return True
 
 
 def get_text_content(text_region: etree.Element) -> Tuple[str, str]:
-    lines = text_region.findall(".//{*}TextLine")
-    gt_text, rec_text = [], []
-    for line in lines:
-        equiv = line.find("./{*}TextEquiv")
-        if equiv is not None:
-            content = "".join(equiv.find("./{*}Unicode").itertext())
-            if content and equiv.get("index") == "0":
-                gt_text.append(content)
-            elif content and equiv.get("index") == "1":
-                rec_text.append(content)
-    return "\n".join(gt_text), "\n".join(rec_text)
+    """Collects the line texts of a region for the ground truth ("0") and recognition ("1") index in a single
+    traversal.
+    """
+    texts: Dict[str, List[str]] = {"0": [], "1": []}
+    for line in pagexml.iter_lines(text_region):
+        for equiv in pagexml.children(line, "TextEquiv"):
+            index_texts = texts.get(equiv.get("index"))
+            if index_texts is None:
+                continue
+            content = pagexml.unicode_text(equiv)
+            if content:
+                index_texts.append(content)
+    return "\n".join(texts["0"]), "\n".join(texts["1"])
 
 
 if __name__ == "__main__":
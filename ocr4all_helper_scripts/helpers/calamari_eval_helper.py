@@ -1,9 +1,10 @@
+from ocr4all_helper_scripts.utils import pagexml
+
 import subprocess
 from typing import List, Tuple
 from pathlib import Path
 import sys
 
-from lxml import etree
 
 EVAL_DIR = Path("/tmp/eval")
 
@@ -19,20 +20,19 @@ def prepare_filesystem():
 def get_text_content(file: str, skip_empty_gt: bool) -> Tuple[List[str], List[str]]:
     gt, pred = [], []
 
-    root = etree.parse(file).getroot()
-    lines = root.findall(".//{*}TextLine")
-    for line in lines:
-        gt_equiv = [gt_equiv for gt_equiv in line.findall("./{*}TextEquiv") if gt_equiv.get("index") == "0"]
-        pred_equiv = [pred_equiv for pred_equiv in line.findall("./{*}TextEquiv") if pred_equiv.get("index") == "1"]
+    root = pagexml.parse(file)
+    for line in pagexml.iter_lines(root):
+        gt_equiv = pagexml.text_equivs(line, "0")
+        pred_equiv = pagexml.text_equivs(line, "1")
 
         if len(gt_equiv) == 1:
-            gt.append("".join(gt_equiv[0].find("./{*}Unicode").itertext()))
+            gt.append(pagexml.unicode_text(gt_equiv[0]))
         else:
             if skip_empty_gt: continue
             gt.append("")
 
         if len(pred_equiv) == 1:
-            pred.append("".join(pred_equiv[0].find("./{*}Unicode").itertext()))
+            pred.append(pagexml.unicode_text(pred_equiv[0]))
         else:
             pred.append("")
 
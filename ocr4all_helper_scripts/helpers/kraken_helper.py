@@ -1,80 +1,211 @@
+from ocr4all_helper_scripts.utils import metrics, pagexml
+
+from contextlib import nullcontext
+import hashlib
+import json
+import logging
 from pathlib import Path
+import shutil
 import subprocess
-from typing import List
+import time
+from typing import List, Optional
 import sys
 
 from lxml import etree
 
 
+logger = logging.getLogger(__name__)
+
+# Options of the kraken segmentation. Together with the kraken version (which determines the default baseline model)
+# they are part of the cache key of its results.
+KRAKEN_OPTIONS = ["-x"]
+SEGMENT_OPTIONS = ["segment", "-bl"]
+
+
+def kraken_version() -> str:
+    """Returns the version string of the kraken executable or "unknown" if it can't be determined."""
+    try:
+        return subprocess.run(["kraken", "--version"], capture_output=True, text=True).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def file_hash(file: Path) -> str:
+    """Returns the SHA-256 hex digest of the content of a file."""
+    digest = hashlib.sha256()
+    with file.open("rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class KrakenHelper:
-    def __init__(self, files):
+    def __init__(self, files, run_metrics: Optional[metrics.RunMetrics] = None, cache_dir: Optional[str] = None):
         self.files = [Path(file) for file in files]
+        self.run_metrics = run_metrics
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+    @staticmethod
+    def output(file: Path) -> Path:
+        """Returns the PAGE XML file kraken writes the segmentation of an image file to."""
+        return Path(file.parent, f"{file.name.split('.')[0]}.xml")
 
     def run(self):
+        """Segments all image files with kraken. If a cache directory is set, the raw kraken results of images whose
+        content was already segmented by the same kraken version with the same options are restored from the cache and
+        only the remaining images are passed to kraken.
+        """
+        pending = self.files
+        keys = {}
+        if self.cache_dir is not None:
+            version = kraken_version()
+            pending = []
+            for file in self.files:
+                keys[file] = self.cache_key(file, version)
+                hit = self.restore(file, keys[file])
+                if self.run_metrics is not None:
+                    self.run_metrics.record_cache("kraken", hit)
+                if not hit:
+                    pending.append(file)
+            logger.info("Restored %s of %s kraken results from the cache", len(self.files) - len(pending),
+                        len(self.files))
+
+        if not pending:
+            return
+
         files_args = []
-        for file in self.files:
+        for file in pending:
             files_args.append("-i")
             files_args.append(str(file))
-            files_args.append(str(Path(file.parent, f"{file.name.split('.')[0]}.xml")))
+            files_args.append(str(self.output(file)))
 
-        command = ["kraken", "-x", "-v"]
+        command = ["kraken"] + KRAKEN_OPTIONS + ["-v"]
         command.extend(files_args)
-        command.append("segment")
-        command.append("-bl")
-        subprocess.run(command, stderr=sys.stderr, stdout=sys.stdout)
+        command.extend(SEGMENT_OPTIONS)
+        # Outputs of earlier runs are moved aside, so only results written by this run are cached. They are put back
+        # if kraken doesn't write a new result.
+        stale = {}
+        if self.cache_dir is not None:
+            for file in pending:
+                xml = self.output(file)
+                if xml.exists():
+                    stale[file] = Path(xml.parent, f"{xml.name}.stale")
+                    xml.replace(stale[file])
+        try:
+            with self.run_metrics.phase("segmentation") if self.run_metrics else nullcontext():
+                subprocess.run(command, stderr=sys.stderr, stdout=sys.stdout)
+
+            if self.cache_dir is not None:
+                for file in pending:
+                    self.store(file, keys[file])
+        finally:
+            for file, previous in stale.items():
+                if self.output(file).exists():
+                    previous.unlink()
+                else:
+                    previous.replace(self.output(file))
+
+    @staticmethod
+    def cache_key(file: Path, version: str) -> str:
+        """Returns the cache key of the kraken result of an image file, derived from its content, the kraken version
+        and the segmentation options.
+        """
+        key = json.dumps([file_hash(file), version, KRAKEN_OPTIONS, SEGMENT_OPTIONS])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def cache_file(self, key: str) -> Path:
+        return Path(self.cache_dir, key[:2], f"{key}.xml")
+
+    def restore(self, file: Path, key: str) -> bool:
+        """Writes the cached raw kraken result of an image file to its output, referencing the current image file name.
+
+        :return: Whether a cached result was found.
+        """
+        cached = self.cache_file(key)
+        if not cached.exists():
+            return False
+        root = pagexml.parse(cached)
+        page_elem = pagexml.child(root, "Page")
+        if page_elem is not None:
+            page_elem.set("imageFilename", str(file))
+        with self.output(file).open("w") as outfile:
+            outfile.write(etree.tostring(root, encoding="unicode", pretty_print=True))
+        return True
+
+    def store(self, file: Path, key: str):
+        """Copies the raw kraken result of an image file into the cache, if kraken wrote one."""
+        xml = self.output(file)
+        if not xml.exists():
+            return
+        cached = self.cache_file(key)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        # Copy to a temporary file first, so concurrent runs never read a partially written result
+        partial = cached.with_suffix(f".{time.time_ns()}.tmp")
+        shutil.copyfile(xml, partial)
+        partial.replace(cached)
 
     def postprocess(self):
         """Fixes several non-valid PAGE XML entries produced by kraken in the currently used version.
 
         """
         for file in self.files:
-            xml = Path(file.parent, f"{file.name.split('.')[0]}.xml")
+            with metrics.page(self.run_metrics, str(file)):
+                self.postprocess_file(file)
+
+    def postprocess_file(self, file: Path):
+        """Fixes the kraken PAGE XML output of a single image file.
+
+        """
+        xml = self.output(file)
 
-            if not xml.exists():
-                continue
+        if not xml.exists():
+            return
 
-            root = etree.parse(str(xml)).getroot()
+        root = pagexml.parse(xml)
 
-            self.merge_duplicate_regions(root)
+        self.merge_duplicate_regions(root)
 
-            text_regions = root.findall(".//{*}TextRegion")
-            ro = list()
+        text_regions = list(pagexml.iter_regions(root))
+        ro = list()
+        metrics.count("regions", len(text_regions))
 
-            for idx, text_region in enumerate(text_regions):
-                coords = text_region.find("./{*}Coords")
-                points = coords.get("points")
-                if "-" in points:
-                    points = points.replace("-", "")
-                    coords.set("points", points)
+        for idx, text_region in enumerate(text_regions):
+            coords = pagexml.child(text_region, "Coords")
+            points = coords.get("points")
+            if "-" in points:
+                points = points.replace("-", "")
+                coords.set("points", points)
 
-                if text_region.get("context") is None and coords.get("points").startswith("0,0"):
-                    self.shrink_full_page_region(text_region)
+            if text_region.get("context") is None and coords.get("points").startswith("0,0"):
+                self.shrink_full_page_region(text_region)
 
-                new_id = f"r_{str(idx).zfill(4)}"
-                text_region.set("id", new_id)
-                ro.append(f"r_{str(idx).zfill(4)}")
+            new_id = f"r_{str(idx).zfill(4)}"
+            text_region.set("id", new_id)
+            ro.append(f"r_{str(idx).zfill(4)}")
 
-                for line in text_region.findall("./{*}TextLine"):
-                    line_coords = line.find("./{*}Coords")
-                    line_points = line_coords.get("points")
-                    if "-" in line_points:
-                        line_points = line_points.replace("-", "")
-                        line_coords.set("points", line_points)
+            text_lines = list(pagexml.children(text_region, "TextLine"))
+            metrics.count("lines", len(text_lines))
+            for line in text_lines:
+                line_coords = pagexml.child(line, "Coords")
+                line_points = line_coords.get("points")
+                if "-" in line_points:
+                    line_points = line_points.replace("-", "")
+                    line_coords.set("points", line_points)
 
-            self.create_reading_order(root, ro)
-            with xml.open("w") as outfile:
-                outfile.write(etree.tostring(root, encoding="unicode", pretty_print=True))
+        self.create_reading_order(root, ro)
+        with xml.open("w") as outfile:
+            outfile.write(etree.tostring(root, encoding="unicode", pretty_print=True))
 
     @staticmethod
     def merge_duplicate_regions(root: etree.Element):
-        text_regions_ids = [elem.get("id") for elem in root.findall(".//{*}TextRegion")]
-        duplicate_ids = set([_id for _id in text_regions_ids if text_regions_ids.count(_id) > 1])
+        regions_by_id = {}
+        for elem in pagexml.iter_regions(root):
+            regions_by_id.setdefault(elem.get("id"), []).append(elem)
 
-        for duplicate_id in duplicate_ids:
-            duplicate_elems = [elem for elem in root.findall(".//{*}TextRegion") if elem.get("id") == duplicate_id]
+        for duplicate_elems in regions_by_id.values():
             original_elem = duplicate_elems[0]
             for duplicate_elem in duplicate_elems[1:]:
-                textlines = duplicate_elem.findall(".//{*}TextLine")
+                textlines = list(pagexml.iter_lines(duplicate_elem))
                 for textline in textlines:
                     original_elem.append(textline)
                 duplicate_elem.getparent().remove(duplicate_elem)
@@ -86,10 +217,10 @@ class KrakenHelper:
         region.
 
         """
-        region_coord = text_region.find("./{*}Coords")
+        region_coord = pagexml.child(text_region, "Coords")
 
-        textline = text_region.find("./{*}TextLine")
-        textline_coord = textline.find("./{*}Coords")
+        textline = pagexml.child(text_region, "TextLine")
+        textline_coord = pagexml.child(textline, "Coords")
 
         region_coord.set("points", textline_coord.get("points"))
 
@@ -98,7 +229,7 @@ class KrakenHelper:
         """Creates ReadingOrder element from existing order in XML tree as kraken doesn't create this itself.
 
         """
-        page_elem = root.find("./{*}Page")
+        page_elem = pagexml.child(root, "Page")
 
         reading_order_element = etree.Element("ReadingOrder")
         ordered_group_element = etree.SubElement(reading_order_element, "OrderedGroup")
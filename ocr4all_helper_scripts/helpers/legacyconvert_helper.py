@@ -1,16 +1,14 @@
+from ocr4all_helper_scripts.utils import pagexml
+from ocr4all_helper_scripts.utils.fileutils import index_directory
+
+import logging
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import List, Optional, Tuple
 
 from lxml import etree
 
 
-def get_namespace(tree: etree.Element) -> Dict[str, str]:
-    """Automatically extracts Page XML namespace
-
-    :param tree: Base Page XML file representing the page.
-    :return: Namespace dictionary.
-    """
-    return {"p": tree.nsmap[None]}
+logger = logging.getLogger(__name__)
 
 
 def convert_page(xml: Path) -> etree.Element:
@@ -20,8 +18,7 @@ def convert_page(xml: Path) -> etree.Element:
     :param xml: Base Page XML file representing the page.
     :return: XML tree enriched with all necessary information from the legacy directories.
     """
-    tree = etree.parse(str(xml)).getroot()
-    ns = get_namespace(tree)
+    tree = pagexml.parse(xml)
     page_dir = Path(xml.parent, xml.stem)
 
     line_counter = 1
@@ -33,15 +30,16 @@ def convert_page(xml: Path) -> etree.Element:
         region["line_coords"], region["pred"], region["gt"], region["bin"], region["nrm"] = process_lines(
             Path(page_dir, _region), region["offset"])
 
-    for idx, region in enumerate(tree.xpath(".//p:TextRegion", namespaces=ns)):
+    for idx, region in enumerate(list(pagexml.iter_regions(tree))):
         try:
             region_data = regions_data[idx]
         except IndexError as e:
-            print(f"Warning: No corresponding data found for region {region.attrib['id']} in page {xml.name}. Skipping...")
+            logger.warning("No corresponding data found for region %s in page %s. Skipping...", region.attrib['id'],
+                           xml.name)
             continue
 
-        region_text_equiv = region.xpath("./p:TextEquiv", namespaces=ns)
-        region_coords = region.find("./p:Coords", namespaces=ns).attrib["points"]
+        region_text_equiv = pagexml.text_equivs(region)
+        region_coords = pagexml.child(region, "Coords").attrib["points"]
 
         if region_text_equiv:
             region.remove(region_text_equiv[0])
@@ -83,25 +81,37 @@ def convert_page(xml: Path) -> etree.Element:
     return tree
 
 
+def read_files(files: List[Optional[Path]]) -> List[Optional[str]]:
+    """Reads a batch of text files.
+
+    :param files: Files to read, None entries are passed through.
+    :return: Content of the files in the same order.
+    """
+    contents = []
+    for file in files:
+        if file is None:
+            contents.append(None)
+            continue
+        with open(file, "r") as fp:
+            contents.append(fp.read())
+    return contents
+
+
 def get_regions_data(path: Path) -> List[dict]:
     """Gets base data for a region in a page.
 
     :param path: Path to the region directory.
     :return: List of dictionaries holding base region data.
     """
-    regions = list()
-
-    for region in sorted(path.glob("./*.offset")):
-        region_dict = dict()
+    index = index_directory(path)
+    regions = sorted(region for region, suffixes in index.items() if "offset" in suffixes)
 
-        with region.open("r") as file:
-            (x, y) = file.read().split(",")
-            region_dict["name"] = str(region.stem)
-            region_dict["offset"] = (int(x), int(y))
+    regions_data = list()
+    for region, content in zip(regions, read_files([index[region]["offset"] for region in regions])):
+        (x, y) = content.split(",")
+        regions_data.append({"name": region, "offset": (int(x), int(y))})
 
-        regions.append(region_dict)
-
-    return regions
+    return regions_data
 
 
 def process_lines(path: Path, offset: Tuple[int, int]) -> Tuple[list, list, list, list, list]:
@@ -111,48 +121,33 @@ def process_lines(path: Path, offset: Tuple[int, int]) -> Tuple[list, list, list
     :param offset: Region offset for calculating actual coordinates of the lines.
     :return: Information about line coordinates, prediction and ground truth text and binary and greyscale images.
     """
+    index = index_directory(path)
+
+    lines = []
+    for line in sorted(index):
+        if "coords" in index[line] or len(index) == 1:
+            lines.append(line)
+
+    coord_files = [index[line].get("coords") for line in lines]
+    prediction_files = [index[line].get("pred.txt") for line in lines]
+    gt_files = [index[line].get("gt.txt") for line in lines]
 
-    lines = set()
+    contents = read_files(coord_files + prediction_files + gt_files)
+    coord_contents = contents[:len(lines)]
+    prediction = contents[len(lines):2 * len(lines)]
+    gt = contents[2 * len(lines):]
 
     line_coords = []
-    prediction = []
-    gt = []
-    bin_imgs = []
-    nrm_imgs = []
-
-    for line in path.glob("*"):
-        lines.add(line.name.split(".")[0])
-
-    for line in lines:
-        file_base = Path(path, line)
-
-        line_coord = file_base.with_suffix(".coords")
-        if line_coord.is_file():
-            with line_coord.open("r") as coord_file:
-                (y_min, x_min, y_max, x_max) = coord_file.read().split(",")
-                line_coords.append(calc_bbox([max(0, int(y_min) + offset[1]), max(0, int(x_min) + offset[0]),
-                                              max(0, int(y_max) + offset[1]), max(0, int(x_max) + offset[0])]))
-        elif not line_coord.is_file() and len(lines) == 1:
+    for coord_content in coord_contents:
+        if coord_content is None:
             line_coords.append(None)
-        else:
             continue
+        (y_min, x_min, y_max, x_max) = coord_content.split(",")
+        line_coords.append(calc_bbox([max(0, int(y_min) + offset[1]), max(0, int(x_min) + offset[0]),
+                                      max(0, int(y_max) + offset[1]), max(0, int(x_max) + offset[0])]))
 
-        prediction_file = file_base.with_suffix(".pred.txt")
-        if prediction_file.is_file():
-            with prediction_file.open("r") as pred_file:
-                prediction.append("".join(pred_file.read()))
-        else:
-            prediction.append(None)
-
-        gt_file = file_base.with_suffix(".gt.txt")
-        if gt_file.is_file():
-            with gt_file.open("r") as pred_file:
-                gt.append("".join(pred_file.read()))
-        else:
-            gt.append(None)
-
-        bin_imgs.append(file_base.with_suffix(".bin.png"))
-        nrm_imgs.append(file_base.with_suffix(".nrm.png"))
+    bin_imgs = [Path(path, f"{line}.bin.png") for line in lines]
+    nrm_imgs = [Path(path, f"{line}.nrm.png") for line in lines]
 
     return line_coords, prediction, gt, bin_imgs, nrm_imgs
 
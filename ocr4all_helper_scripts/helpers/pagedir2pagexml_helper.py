@@ -4,225 +4,256 @@
 Created on Mon Dec 18 10:40:26 2017
 @author: anb51nh
 """
+from ocr4all_helper_scripts.utils import pagexml
+from ocr4all_helper_scripts.utils.fileutils import index_directory
 
-from os import path
-from glob import glob
+import logging
+from pathlib import Path
 from time import gmtime, strftime
-from math import sin, cos, radians
-import argparse
+from typing import Dict, List, Optional, Tuple
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
 from lxml import etree
 from PIL import Image
 
 
+logger = logging.getLogger(__name__)
+
+
+def get_image_size(imgpath: Path) -> Tuple[int, int]:
+    """Reads the size of an image from its header without decoding the pixel data.
+    """
+    with Image.open(imgpath) as img:
+        return img.size
+
+
+def rotate_coords(coords: np.ndarray, angle: float, size: Tuple[int, int]) -> np.ndarray:
+    """Rotates an array of (x, y) coordinates by angle (in degrees) around the center of an image of the given size.
+    """
+    center = np.array(size) / 2
+    a = np.radians(-angle)
+    rotation = np.array([[np.cos(a), -np.sin(a)],
+                         [np.sin(a), np.cos(a)]])
+    return np.round((coords - center) @ rotation + center).astype(int)
+
+
+def find_region_segment(region_type: str, coords: List[Tuple[int, int]],
+                        page_index: Dict[str, Dict[str, Path]]) -> dict:
+    """Finds the region image in the page directory index whose rectangle contains all region coordinates.
+
+    :return: Dictionary holding offset, size and path of the region segment, empty if no segment contains the
+    coordinates or there are none.
+    """
+    if not coords:
+        return {}
+    points = np.array(coords)
+    for base in sorted(page_index):
+        suffixes = page_index[base]
+        if not base.endswith(region_type) or "png" not in suffixes or "offset" not in suffixes:
+            continue
+        size = get_image_size(suffixes["png"])
+        with suffixes["offset"].open() as f:
+            offset = tuple([int(x) for x in f.read().split(",")])
+        # check if coordinates fit in region rectangle
+        if np.all((points >= offset) & (points <= np.add(offset, size))):
+            return {"offset": offset, "size": size, "path": Path(suffixes["png"].parent, base),
+                    "angle_file": suffixes.get("angle")}
+    return {}
+
+
+def collect_lines(region_id: str, segment: dict, angle: float) -> Dict[str, dict]:
+    """Collects coordinates, OCR and ground truth text of all lines in a region segment directory.
+    """
+    lines = {}
+    index = index_directory(segment["path"])
+    line_names = sorted(name for name, suffixes in index.items() if "coords" in suffixes)
+    if not line_names:
+        return lines
+
+    boxes = []
+    for name in line_names:
+        with index[name]["coords"].open() as f:
+            boxes.append([int(x) for x in f.read().split(",")])
+    # boxes: [(x1, y1, x2, y2),...], cf. kraken segmenter
+    boxes = np.array(boxes)[:, [1, 0, 3, 2]]
+    coords = np.stack([boxes[:, [0, 1]], boxes[:, [2, 1]], boxes[:, [2, 3]], boxes[:, [0, 3]]], axis=1)
+
+    # rotate line coordinates
+    if angle:
+        coords = rotate_coords(coords.reshape(-1, 2), angle, segment["size"]).reshape(coords.shape)
+
+    # relative to absolute coordinates
+    coords = coords + segment["offset"]
+
+    for n, name in enumerate(line_names):
+        lid = '{}_{:03d}'.format(region_id, n + 1)
+        lines[lid] = {"coords": [tuple(c) for c in coords[n].tolist()]}
+        if "pred.txt" in index[name]:
+            with index[name]["pred.txt"].open(encoding="utf-8") as f:
+                lines[lid]["ocr"] = f.read().strip()
+        if "gt.txt" in index[name]:
+            with index[name]["gt.txt"].open(encoding="utf-8") as f:
+                lines[lid]["gt"] = f.read().strip()
+    return lines
+
+
+def set_text_equiv(parent: etree.Element, text: str, index: Optional[int] = None):
+    """Sets the Unicode content of the (indexed) TextEquiv child of parent, creating missing elements.
+    """
+    textequivxml = None
+    for equiv in pagexml.text_equivs(parent, index):
+        textequivxml = equiv
+        break
+    if textequivxml is None:
+        attrib = {"index": str(index)} if index is not None else {}
+        textequivxml = etree.SubElement(parent, "TextEquiv", attrib=attrib)
+    unicodexml = pagexml.child(textequivxml, "Unicode")
+    if unicodexml is None:
+        unicodexml = etree.SubElement(textequivxml, "Unicode")
+    unicodexml.text = text
+
+
+def pagexmlcombine(ocrindex: int, gtindex: int, xmlfile: str, output: str):
+    """Combines a PAGE XML file with the region and line information of its legacy page directory.
 
-def pagexmlcombine(ocrindex, gtindex, xmlfile, output):
+    :param ocrindex: Index attribute of the OCR text.
+    :param gtindex: Index attribute of the ground truth text.
+    :param xmlfile: PAGE XML file of the page.
+    :param output: Output file.
+    """
+    xmlfile = Path(xmlfile).absolute()
+    pagename = xmlfile.stem
+    thispagedir = Path(xmlfile.parent, pagename)
+    commentsfile = Path(xmlfile.parent, 'comments', pagename + '.txt')
 
-    xmlfile = path.abspath(xmlfile)
-    pagedir = path.split(xmlfile)[0]    
-    commentsdir = path.join(path.split(xmlfile)[0], 'comments')
-    pagename = path.splitext(path.basename(xmlfile))[0]
-    
-    thispagedir = path.join(pagedir,pagename)
-    commentsfile = path.join(commentsdir, pagename + '.txt')
-    
     # load xml
-    root = etree.parse(xmlfile).getroot()
-    ns = {"ns":root.nsmap[None]}
-    
-    #convert point notation (older PageXML versions)
-    for c in root.xpath("//ns:Coords[not(@points)]", namespaces=ns):
+    root = pagexml.parse(xmlfile)
+
+    # convert point notation (older PageXML versions)
+    for c in pagexml.xpath("//p:Coords[not(@points)]", root)(root):
         cc = []
-        for point in c.xpath("./ns:Point", namespaces=ns):
+        for point in list(pagexml.children(c, "Point")):
             cx = point.attrib["x"]
             cy = point.attrib["y"]
             c.remove(point)
-            cc.append(cx+","+cy)
-        c.attrib["points"] = " ".join(cc)    
-    
+            cc.append(cx + "," + cy)
+        c.attrib["points"] = " ".join(cc)
+
+    page_index = index_directory(thispagedir)
+
     # combine data in coordmap dict
-    textregions = root.xpath('//ns:TextRegion', namespaces=ns)
+    regions = {r.attrib["id"]: r for r in pagexml.iter_regions(root)}
     coordmap = {}
-    for r in textregions:
-        rid = r.attrib["id"]
-        coordmap[rid] = {"type":r.attrib["type"]}
-        
+    for rid, r in regions.items():
+        coordmap[rid] = {"type": r.attrib["type"]}
+
         # coordinates
         coordmap[rid]["coords"] = []
-        for c in r.xpath("./ns:Coords", namespaces=ns) + r.xpath("./Coords"):
+        for c in pagexml.children(r, "Coords"):
             coordstrings = [x.split(",") for x in c.attrib["points"].split()]
-            coordmap[rid]["coords"] += [(int(x[0]), int(x[1])) for x in coordstrings ]
-            
+            coordmap[rid]["coords"] += [(int(x[0]), int(x[1])) for x in coordstrings]
+        if not coordmap[rid]["coords"]:
+            logger.warning("Region %s of %s has no coordinates, skipping it", rid, xmlfile.name,
+                           extra={"page": pagename, "region": rid})
+            del coordmap[rid]
+            continue
+
         # find region dir, offset and size
-        for imgf in glob(thispagedir + "/*" + coordmap[rid]["type"] + ".png"):
-            if not "offset" in coordmap[rid]:
-                size = Image.open(imgf).size
-                offsetp = path.splitext(imgf)[0] + ".offset"
-                with open(offsetp) as f:
-                    offset = tuple([int(x) for x in f.read().split(",")])
-                # check if coordinates fit in region rectangle
-                fit = all([offset[0]<=c[0]<=offset[0]+size[0] \
-                         and  offset[1]<=c[1]<=offset[1]+size[1] \
-                    for c in coordmap[rid]["coords"]])
-                if fit:
-                    coordmap[rid]["offset"] = offset
-                    coordmap[rid]["size"] = size
-                    coordmap[rid]["path"] = path.splitext(imgf)[0]
-        if not "path" in coordmap[rid]:
-            raise ValueError("Segment for region " + rid + " not found in pagedir "+thispagedir+"!")
-            
+        segment = find_region_segment(coordmap[rid]["type"], coordmap[rid]["coords"], page_index)
+        if not segment:
+            raise ValueError(f"Segment for region {rid} not found in pagedir {thispagedir}!")
+        coordmap[rid].update(segment)
+
         # angle
-        if path.isfile(coordmap[rid]["path"] + ".angle"):
-            with open(coordmap[rid]["path"] + ".angle") as f:
+        if segment["angle_file"] is not None:
+            with segment["angle_file"].open() as f:
                 coordmap[rid]["angle"] = float(f.read())
         else:
             coordmap[rid]["angle"] = 0.0
-            
-        
+
         # lines
-        coordmap[rid]["lines"] = {}
-        for n, l in enumerate(sorted(glob(coordmap[rid]["path"]+"/*.coords"))):
-            lpath = path.splitext(l)[0]
-            lid = '{}_{:03d}'.format(rid, n + 1)
-            coordmap[rid]["lines"][lid] = {}
-            with open(l) as f:
-                b = f.read().split(",")
-            b = [int(x) for x in b] 
-            b = [b[1], b[0], b[3], b[2]] # boxes: [(x1, y1, x2, y2),...], cf. kraken segmenter
-            coords = [(b[0],b[1]),(b[2],b[1]),(b[2],b[3]),(b[0],b[3])]
-            
-            # rotate line coordinates 
-            if coordmap[rid]["angle"]:
-                newcoords = []
-                center = tuple([x/2 for x in coordmap[rid]["size"]])
-                a = radians(- coordmap[rid]["angle"])
-                for c in coords:
-                    x = c[0] - center[0]
-                    y = c[1] - center[1]
-                    x =  x*cos(a) + y*sin(a)
-                    y = -x*sin(a) + y*cos(a)
-                    x = round(x + center[0])
-                    y = round(y + center[1])
-                    newcoords.append((x,y))
-                coords = newcoords
-            
-            # relative to absolute coordinates
-            coords = [(x[0]+coordmap[rid]["offset"][0], x[1]+coordmap[rid]["offset"][1]) for x in coords]
-            coordmap[rid]["lines"][lid]["coords"] = coords
-            
-            # ocr text
-            for fpath in glob(lpath + ".pred.txt"):
-                with open(fpath, encoding='utf-8') as f:
-                    coordmap[rid]["lines"][lid]["ocr"] =  f.read().strip()
-                
-            # gt text
-            for fpath in glob(lpath + ".gt.txt"):
-                with open(fpath, encoding='utf-8') as f:
-                    coordmap[rid]["lines"][lid]["gt"] =  f.read().strip()
-                    
+        coordmap[rid]["lines"] = collect_lines(rid, segment, coordmap[rid]["angle"])
+
     # start writing coordmap back to xml
     for rid in sorted(coordmap):
-        textregion = root.find('.//ns:TextRegion[@id="'+rid+'"]', namespaces=ns)
+        textregion = regions[rid]
         regiontext = []
 
         # angle
         if coordmap[rid]["angle"]:
             textregion.attrib["orientation"] = str(-1 * coordmap[rid]["angle"])
+
         # lines
-        for lid in coordmap[rid]["lines"]:
-            linexml = textregion.find('./ns:TextLine[@id="'+lid+'"]', namespaces=ns)
+        textlines = {line.get("id"): line for line in pagexml.children(textregion, "TextLine")}
+        for lid, line in coordmap[rid]["lines"].items():
+            linexml = textlines.get(lid)
             if linexml is None:
-                linexml = etree.SubElement(textregion, "TextLine", attrib={"id":lid})
+                linexml = etree.SubElement(textregion, "TextLine", attrib={"id": lid})
             # coords
-            coordsxml = linexml.find('./ns:Coords', namespaces=ns)
+            coordsxml = pagexml.child(linexml, "Coords")
             if coordsxml is None:
                 coordsxml = etree.SubElement(linexml, "Coords")
-            coordsxml.attrib["points"] = " ".join(str(x[0])+","+str(x[1]) \
-                            for x in coordmap[rid]["lines"][lid]["coords"])
-            
+            coordsxml.attrib["points"] = " ".join(f"{x},{y}" for x, y in line["coords"])
+
             # text
-            if "ocr" in coordmap[rid]["lines"][lid]:
-                textequivxml = linexml.find('./ns:TextEquiv[@index="'+str(ocrindex)+'"]', namespaces=ns)
-                if textequivxml is None:
-                    textequivxml = etree.SubElement(linexml, "TextEquiv", attrib={"index":str(ocrindex)})
-                unicodexml = textequivxml.find('./ns:Unicode', namespaces=ns)
-                if unicodexml is None:
-                    unicodexml = etree.SubElement(textequivxml, "Unicode")
-                unicodexml.text = coordmap[rid]["lines"][lid]["ocr"]
-            if "gt" in coordmap[rid]["lines"][lid]:
-                textequivxml = linexml.find('./ns:TextEquiv[@index="'+str(gtindex)+'"]', namespaces=ns)
-                if textequivxml is None:
-                    textequivxml = etree.SubElement(linexml, "TextEquiv", attrib={"index":str(gtindex)})
-                unicodexml = textequivxml.find('./ns:Unicode', namespaces=ns)
-                if unicodexml is None:
-                    unicodexml = etree.SubElement(textequivxml, "Unicode")
-                unicodexml.text = coordmap[rid]["lines"][lid]["gt"]
-            
-        # region text collect
-        for lid in coordmap[rid]["lines"]:
-            if "gt" in coordmap[rid]["lines"][lid]:
-                regiontext.append(coordmap[rid]["lines"][lid]["gt"])
-            elif "ocr" in coordmap[rid]["lines"][lid]:
-                regiontext.append(coordmap[rid]["lines"][lid]["ocr"])
-            else:
-                regiontext.append("")
-                    
+            if "ocr" in line:
+                set_text_equiv(linexml, line["ocr"], ocrindex)
+            if "gt" in line:
+                set_text_equiv(linexml, line["gt"], gtindex)
+
+            # region text collect
+            regiontext.append(line.get("gt", line.get("ocr", "")))
+
         # region text insert
-        textequivxml = textregion.find('./ns:TextEquiv', namespaces=ns)
-        if textequivxml is None:
-            textequivxml = etree.SubElement(textregion, "TextEquiv")
-        unicodexml = textequivxml.find('./ns:Unicode', namespaces=ns)
-        if unicodexml is None:
-            unicodexml = etree.SubElement(textequivxml, "Unicode")
-        unicodexml.text = "\n".join(regiontext)
-    
+        set_text_equiv(textregion, "\n".join(regiontext))
+
     # timestamp
-    lastchange = root.find('.//ns:LastChange', namespaces=ns)
+    lastchange = next(pagexml.iter_elements(root, "LastChange"))
     lastchange.text = strftime("%Y-%m-%dT%H:%M:%S", gmtime())
-    
+
     # comments
-    if path.isfile(commentsfile):
-        metadata = root.find('.//ns:Metadata', namespaces=ns)
-        commentsxml = metadata.find('./ns:Comments', namespaces=ns)
+    if commentsfile.is_file():
+        metadata = next(pagexml.iter_elements(root, "Metadata"))
+        commentsxml = pagexml.child(metadata, "Comments")
         if commentsxml is None:
             commentsxml = etree.SubElement(metadata, "Comments")
-        with open(commentsfile) as f:
+        with commentsfile.open() as f:
             commentsxml.text = f.read()
-    
+
     # update version
     xmlcontent = etree.tounicode(root.getroottree()).replace(
-             "http://schema.primaresearch.org/PAGE/gts/pagecontent/2010-03-19",
-             "http://schema.primaresearch.org/PAGE/gts/pagecontent/2017-07-15"
-            ).replace(
-             "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15",
-             "http://schema.primaresearch.org/PAGE/gts/pagecontent/2017-07-15"                    
-            )
+        "http://schema.primaresearch.org/PAGE/gts/pagecontent/2010-03-19",
+        "http://schema.primaresearch.org/PAGE/gts/pagecontent/2017-07-15"
+    ).replace(
+        "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15",
+        "http://schema.primaresearch.org/PAGE/gts/pagecontent/2017-07-15"
+    )
     xmlcontent = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>' + xmlcontent
-    
+
     # write file
-    with open(path.abspath(output), "w", encoding='utf-8') as f:
+    with Path(output).absolute().open("w", encoding='utf-8') as f:
         f.write(xmlcontent)
-        
-        
-        
-def loopfiles(ocrindex, gtindex, xmlfiles, output):
-    """
-        Takes a bunch of PageXML files and integrates information retrieved from
-        a subfolder called 'Pages' in the same directory.
+
+
+def loopfiles(ocrindex: int, gtindex: int, xmlfiles: List[str], output: Optional[str] = None, parallel: int = 1):
+    """Takes a bunch of PageXML files and integrates information retrieved from the page directory with the same
+    name in the same directory.
+
+    :param ocrindex: Index attribute of the OCR text.
+    :param gtindex: Index attribute of the ground truth text.
+    :param xmlfiles: PAGE XML files to process.
+    :param output: Output directory. Input files will be overwritten if not given.
+    :param parallel: Number of threads parallelly working on pages.
     """
-    if xmlfiles:
-        for xmlfile in xmlfiles:
-            pagexmlcombine(ocrindex, gtindex, xmlfile, output)
-
-def main():
-    parser = argparse.ArgumentParser("""
-    XML output generation tool
-    """)
-    parser.add_argument('-ocrx','--ocrindex',type=int,default=1,help='Index attribute of the OCR text.')
-    parser.add_argument('-gtx','--gtindex',type=int,default=0,help='Index attribute of the ground truth text.')
-    parser.add_argument('-o','--output', type=str, help='Output directory')
-    parser.add_argument('xmlfiles',nargs='+')
-    args = parser.parse_args()
-    loopfiles(args.ocrindex, args.gtindex, args.xmlfiles, args.output)
-
-if __name__ == '__main__':
-    main()
+    if not xmlfiles:
+        return
+    if output:
+        Path(output).mkdir(parents=True, exist_ok=True)
+
+    def combine(xmlfile):
+        outfile = Path(output, Path(xmlfile).name) if output else xmlfile
+        pagexmlcombine(ocrindex, gtindex, xmlfile, outfile)
+
+    with ThreadPool(processes=max(1, min(parallel, len(xmlfiles)))) as pool:
+        pool.map(combine, xmlfiles)
@@ -10,18 +10,21 @@
 # kraken:
 #   https://github.com/mittagessen/kraken
 
-from ocr4all_helper_scripts.lib import imgmanipulate, morph, sl, pseg, nlbin
+from ocr4all_helper_scripts.helpers import skewestimate_helper
+from ocr4all_helper_scripts.lib import imgmanipulate, kernels, morph, sl, pseg, nlbin
 from ocr4all_helper_scripts.utils.datastructures import Record
-from ocr4all_helper_scripts.utils import pageutils, imageutils
+from ocr4all_helper_scripts.utils import logs, pageutils, pagexml, imageutils, metrics
+from ocr4all_helper_scripts.utils.timeutils import BudgetExceeded, Deadline
 
 from pathlib import Path
-import sys
-from typing import List, Tuple
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import logging
 
 import numpy as np
 from skimage.measure import find_contours, approximate_polygon
 from skimage.draw import line_aa
+from scipy import ndimage
 from scipy.ndimage.filters import gaussian_filter, uniform_filter
 import math
 
@@ -30,20 +33,12 @@ from PIL import Image, ImageChops
 from shapely.geometry import Polygon
 
 
-# Add printing for every thread
-from threading import Lock
-
-s_print_lock = Lock()
+logger = logging.getLogger(__name__)
 
 logging.getLogger('shapely.geos').setLevel(logging.CRITICAL)
 
-def s_print(*args, **kwargs):
-    with s_print_lock:
-        print(*args, **kwargs)
-
-
-def s_print_error(*objs):
-    s_print("ERROR: ", *objs, file=sys.stderr)
+# Smallest scale in pixels at working resolution the automatic working scale may downsample to
+MIN_WORKING_SCALE = 10
 
 
 def compute_lines(segmentation: np.ndarray,
@@ -52,17 +47,23 @@ def compute_lines(segmentation: np.ndarray,
                   growth: Tuple[float, float],
                   max_iterations: int,
                   filter_strength: float,
-                  bounding_box: bool) -> List[Record]:
+                  bounding_box: bool,
+                  deadline: Optional[Deadline] = None,
+                  polygon_engine: str = "smear") -> List[Record]:
     """Given a line segmentation map, computes a list of tuples consisting of 2D slices and masked images.
     Implementation derived from ocropy with changes to allow extracting the line coords/polygons.
+    Once the deadline expired, the remaining lines fall back to their bounding boxes.
+    The polygon_engine "smear" iteratively smears the line mask, "envelope" builds each polygon in a single pass.
     """
+    if deadline is None:
+        deadline = Deadline()
     lobjects = morph.find_objects(segmentation)
     lines = []
     for i, o in enumerate(lobjects):
         if o is None:
             continue
         if sl.dim1(o) < 2 * scale * filter_strength or sl.dim0(o) < scale * filter_strength:
-            s_print(f"Filter strength of {filter_strength} too high. Skipping detected line object...")
+            logger.debug("Filter strength of %s too high. Skipping detected line object...", filter_strength)
             continue
         mask = (segmentation[o] == i + 1)
         if np.amax(mask) == 0:
@@ -73,7 +74,14 @@ def compute_lines(segmentation: np.ndarray,
         result.bounds = o
         polygon = []
         if ((segmentation[o] != 0) == (segmentation[o] != i + 1)).any() and not bounding_box:
-            ppoints = approximate_smear_polygon(mask, smear_strength, growth, max_iterations)
+            try:
+                if polygon_engine == "envelope":
+                    deadline.check()
+                    ppoints = approximate_envelope_polygon(mask, smear_strength)
+                else:
+                    ppoints = approximate_smear_polygon(mask, smear_strength, growth, max_iterations, deadline)
+            except BudgetExceeded:
+                ppoints = []
             ppoints = ppoints[1:] if ppoints else []
             polygon = [(o[1].start + x, o[0].start + y) for x, y in ppoints]
         if not polygon:
@@ -108,6 +116,64 @@ def compute_gradmaps(binary: np.array, scale: float, vscale: float = 1.0, hscale
     return bottom, top, boxmap
 
 
+def ink_array(im: Image) -> np.ndarray:
+    """Converts a bi-level image into an int array with 1 for ink (dark) and 0 for background pixels.
+    """
+    # Bilevel images are unpacked straight into a 0/1 array instead of converting them to 'L' first
+    a = np.array(im, dtype=np.uint8)
+
+    binary = np.array(a > 0.5 * (np.amin(a) + np.amax(a)), 'i')
+    return 1 - binary
+
+
+def binarize_page(im: Image) -> Image:
+    """Binarizes a whole page once, so that regions can be cut out of the shared result instead of binarizing each
+    region on its own. Bi-level images are returned unchanged.
+    """
+    if imageutils.is_bilevel(im):
+        return im
+    return Image.fromarray(nlbin.adaptive_binarize(np.array(im.convert("L"))).astype(bool))
+
+
+def estimate_page_scale(im: Image) -> Optional[float]:
+    """Estimates the scale of a bi-level page once for all its regions.
+    """
+    scale = pseg.estimate_scale(ink_array(im))
+    return scale if np.isfinite(scale) else None
+
+
+def working_factor(binary: np.ndarray, scale: float = None, working_scale: Union[float, str] = 1.0) -> int:
+    """Determines the integer factor a binary image is downsampled by for computing line seeds and labels. In "auto"
+    mode the largest power of two is chosen which keeps the scale at working resolution above MIN_WORKING_SCALE, with
+    the scale being estimated on a downsampled copy if not given.
+    """
+    if working_scale != "auto":
+        if not 0 < float(working_scale) <= 1:
+            raise ValueError(f"Working scale has to be 'auto' or between 0 (exclusive) and 1, got {working_scale}")
+        return max(1, int(round(1 / float(working_scale))))
+    if not scale:
+        scale = 2 * pseg.estimate_scale(downsample_binary(binary, 2))
+    factor = 1
+    while scale / (2 * factor) >= MIN_WORKING_SCALE:
+        factor *= 2
+    return factor
+
+
+def downsample_binary(binary: np.ndarray, factor: int) -> np.ndarray:
+    """Downsamples a binary image by an integer factor, keeping every block which contains foreground pixels.
+    """
+    height, width = binary.shape
+    padded = np.zeros((-(-height // factor) * factor, -(-width // factor) * factor), binary.dtype)
+    padded[:height, :width] = binary
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).max(axis=(1, 3))
+
+
+def upsample_labels(labels: np.ndarray, factor: int, shape: Tuple[int, int]) -> np.ndarray:
+    """Projects a label image computed at 1/factor resolution back onto an image of the given shape.
+    """
+    return labels[np.arange(shape[0])[:, None] // factor, np.arange(shape[1])[None, :] // factor]
+
+
 def boundary(contour: np.ndarray) -> List[np.float64]:
     """Calculates boundary of contour
     """
@@ -120,9 +186,13 @@ def boundary(contour: np.ndarray) -> List[np.float64]:
 
 
 def approximate_smear_polygon(line_mask: np.ndarray, smear_strength: Tuple[float, float] = (1.0, 2.0),
-                              growth: Tuple[float, float] = (1.1, 1.1), max_iterations: int = 50):
+                              growth: Tuple[float, float] = (1.1, 1.1), max_iterations: int = 50,
+                              deadline: Optional[Deadline] = None):
     """Approximate a single polygon around high pixels in a mask, via smearing
+    Raises BudgetExceeded if the deadline expires before the contours are smeared together.
     """
+    if deadline is None:
+        deadline = Deadline()
     padding = 1
     work_image = np.pad(np.copy(line_mask), pad_width=padding, mode='constant', constant_values=False)
 
@@ -146,35 +216,15 @@ def approximate_smear_polygon(line_mask: np.ndarray, smear_strength: Tuple[float
 
             # Smear image in x and y direction
             height, width = work_image.shape
-            gaps_current_x = [float('Inf')] * height
-            for x in range(width):
-                gap_current_y = float('Inf')
-                for y in range(height):
-                    if work_image[y, x]:
-                        # Entered Contour
-                        gap_current_x = gaps_current_x[y]
-
-                        if gap_current_y < smear_distance_y and gap_current_y > 0:
-                            # Draw over
-                            work_image[y - gap_current_y:y, x] = True
-
-                        if gap_current_x < smear_distance_x and gap_current_x > 0:
-                            # Draw over
-                            work_image[y, x - gap_current_x:x] = True
-
-                        gap_current_y = 0
-                        gaps_current_x[y] = 0
-                    else:
-                        # Entered/Still in Gap
-                        gap_current_y += 1
-                        gaps_current_x[y] += 1
+            kernels.smear(work_image, smear_distance_x, smear_distance_y, deadline.check)
             # Find contours of current smear
             contours = find_contours(work_image, 0.5, fully_connected="low")
 
             # Failsave if contours can't be smeared together after x iterations
             # Draw lines between the extreme points of each contour in order
             if iteration >= max_iterations and len(contours) > 1:
-                s_print(f"Start fail save, since precise line generation took too many iterations ({max_iterations}).")
+                logger.debug("Start fail save, since precise line generation took too many iterations (%s).",
+                             max_iterations)
                 extreme_points = []
                 for contour in contours:
                     sorted_x = sorted(contour, key=lambda c: c[0])
@@ -207,72 +257,207 @@ def approximate_smear_polygon(line_mask: np.ndarray, smear_strength: Tuple[float
     return []
 
 
+def approximate_envelope_polygon(line_mask: np.ndarray, smear_strength: Tuple[float, float] = (1.0, 2.0)):
+    """Approximate a single polygon around high pixels in a mask in a single pass, via the upper and lower envelope
+    of the high pixels. The envelopes are taken over blocks of columns sized from the median width of the mask
+    components (like the first smearing iteration) with empty columns interpolated, so the rectilinear polygon along
+    them wraps all high pixels.
+    """
+    columns = np.flatnonzero(line_mask.any(axis=0))
+    if len(columns) == 0:
+        return []
+
+    labels, _ = ndimage.label(line_mask, structure=np.ones((3, 3)))
+    widths = sorted(o[1].stop - o[1].start for o in ndimage.find_objects(labels))
+    block = max(1, math.ceil(widths[len(widths) // 2] * smear_strength[0]))
+
+    height = line_mask.shape[0]
+    xs = np.arange(columns[0], columns[-1] + 1)
+    top = np.floor(np.interp(xs, columns, np.argmax(line_mask[:, columns], axis=0))).astype(int)
+    bottom = np.ceil(np.interp(xs, columns, height - np.argmax(line_mask[::-1, columns], axis=0))).astype(int)
+
+    starts = np.arange(0, len(xs), block)
+    edges = np.append(xs[starts], xs[-1] + 1)
+    top = np.minimum.reduceat(top, starts)
+    bottom = np.maximum.reduceat(bottom, starts)
+
+    def chain(values):
+        # Rectilinear chain from the left to the right edge along the y values of the blocks
+        points = [(edges[0], values[0])]
+        for step in np.flatnonzero(np.diff(values)) + 1:
+            points.extend([(edges[step], values[step - 1]), (edges[step], values[step])])
+        points.append((edges[-1], values[-1]))
+        return points
+
+    polygon = chain(top) + chain(bottom)[::-1]
+    return [(int(x), int(y)) for x, y in polygon + polygon[:1]]
+
+
+def extract_line_image(ink: np.ndarray, gray: np.ndarray, bounds: Tuple[slice, slice], mask: np.ndarray = None,
+                       pad: int = 3, expand: int = 3) -> Record:
+    """Cuts a line out of the deskewed ink array and grayscale array of its region like ocropy's extract_masked. The
+    line's bounds are padded by pad pixels and everything outside of its mask (dilated by expand pixels) is whitened,
+    which removes the ink of neighbouring lines. The whole bounds are kept if no mask is given.
+
+    :return: Record with the bi-level (binary) and grayscale (gray) line image and the box (x0, y0, x1, y1) they were
+             cut out of.
+    """
+    y0, x0 = max(0, bounds[0].start - pad), max(0, bounds[1].start - pad)
+    y1, x1 = min(ink.shape[0], bounds[0].stop + pad), min(ink.shape[1], bounds[1].stop + pad)
+    window = (slice(y0, y1), slice(x0, x1))
+
+    keep = np.ones((y1 - y0, x1 - x0), dtype=bool)
+    if mask is not None:
+        keep[:] = False
+        keep[bounds[0].start - y0:bounds[0].stop - y0, bounds[1].start - x0:bounds[1].stop - x0] = mask
+        if expand:
+            keep = morph.r_dilation(keep, expand)
+
+    gray_line = gray[window]
+    return Record(binary=Image.fromarray(~(ink[window].astype(bool) & keep)),
+                  gray=Image.fromarray(np.where(keep, gray_line, np.amax(gray_line)).astype(np.uint8)),
+                  box=(x0, y0, x1, y1))
+
+
+def region_line_image(im: Image, gray: Image, orientation: float) -> Record:
+    """Returns the line image of a line covering a whole region, i.e. the whole bi-level region image and its grayscale
+    version, rotated like segment rotates the region for the line segmentation.
+    """
+    ink = ink_array(im.rotate(-orientation, expand=True, fillcolor="white"))
+    gray = np.array(gray.convert("L").rotate(-orientation, expand=True, fillcolor="white"))
+    return extract_line_image(ink, gray, (slice(0, ink.shape[0]), slice(0, ink.shape[1])), pad=0)
+
+
+def cached(cache: Optional[dict], key: tuple, compute: Callable[[], Any], packed: bool = False) -> Any:
+    """Returns the result of compute for key from cache, computing and storing it on a miss. Keys hold all inputs of a
+    stage, i.e. the key of the stage before and the parameters of the stage itself, so runs with different parameters
+    share the stages whose inputs match. Results must not be modified. Just computes the result if cache is None.
+
+    If packed is set, the arrays and mode '1' images of the result are stored with one bit per pixel and every hit
+    returns new copies of them (see imageutils.pack_bits). The arrays of such stages must only hold 0/1 values.
+    """
+    if cache is None:
+        return compute()
+    hit = key in cache
+    metrics.cache_lookup("stages", hit)
+    if hit:
+        return imageutils.unpack_bits(cache[key]) if packed else cache[key]
+    result = compute()
+    cache[key] = imageutils.pack_bits(result) if packed else result
+    return result
+
+
 def segment(im: Image, scale: float = None, max_blackseps: int = 0, widen_blackseps: int = 10, max_whiteseps: int = 3,
             minheight_whiteseps: int = 10, filter_strength: float = 1.0,
             smear_strength: Tuple[float, float] = (1.0, 2.0), growth: Tuple[float, float] = (1.1, 1.1),
             orientation: int = 0, fail_save_iterations: int = 50, vscale: float = 1.0, hscale: float = 1.0,
             minscale: float = 5.0, maxlines: int = 300, threshold: float = 0.2, usegauss: bool = False,
-            bounding_box: bool = False):
+            bounding_box: bool = False, working_scale: Union[float, str] = 1.0, deadline: Optional[Deadline] = None,
+            polygon_engine: str = "smear", gray: Image = None, line_images: Optional[List[Record]] = None,
+            cache: Optional[dict] = None, cache_key: tuple = ()):
     """
     Segments a page into text lines.
     Segments a page into text lines and returns the absolute coordinates of
     each line in reading order.
+    If working_scale is below 1 (or "auto"), scale, line seeds and labels are computed on a downsampled copy of the
+    binarized image and only the resulting line masks and polygons are computed at full resolution.
+    If the deadline expires while the line polygons are approximated, the remaining lines fall back to their bounding
+    boxes. BudgetExceeded is raised if it expires in one of the stages before.
+    If line_images is given, the deskewed image of each returned line is appended to it (see extract_line_image), cut
+    out of the region's ink and its grayscale version gray (or im if no grayscale version is given).
+    If a cache is given, the results of the stages before the line polygons are looked up in it by cache_key and the
+    parameters they depend on (see cached).
     """
+    if deadline is None:
+        deadline = Deadline()
 
-    colors = im.getcolors(2)
-    if (im.mode not in ['1', "L"]) and not (colors is not None and len(colors) == 2):
+    if im.mode != "L" and not imageutils.is_bilevel(im):
         raise ValueError('Image is not bi-level')
 
-    # rotate input image for vertical lines
-    im_rotated = im.rotate(-orientation, expand=True, fillcolor="white")
+    def prepare():
+        # rotate input image for vertical lines
+        im_rotated = im.rotate(-orientation, expand=True, fillcolor="white")
 
-    a = np.array(im_rotated.convert('L')) if im_rotated.mode == '1' else np.array(im_rotated)
+        binary = ink_array(im_rotated)
 
-    binary = np.array(a > 0.5 * (np.amin(a) + np.amax(a)), 'i')
-    binary = 1 - binary
+        factor = working_factor(binary, scale, working_scale)
+        full_binary = binary
+        if factor > 1:
+            binary = downsample_binary(binary, factor)
 
-    if not scale:
-        scale = pseg.estimate_scale(binary)
-    if scale < minscale:
-        s_print_error(f"scale ({scale}) less than --minscale; skipping")
+        return im_rotated.size, full_binary, binary, factor, scale / factor if scale else pseg.estimate_scale(binary)
+
+    prepare_key = cache_key + ("prepare", orientation, scale, working_scale)
+    rotated_size, full_binary, binary, factor, scale = cached(cache, prepare_key, prepare, packed=True)
+    if scale * factor < minscale:
+        logger.warning("scale (%s) less than --minscale; skipping", scale * factor)
         return
 
-    binary = pseg.remove_hlines(binary, scale)
-    # emptyish images will cause exceptions here.
-    try:
-        colseps, binary = pseg.compute_colseps(binary,
-                                               scale,
-                                               max_blackseps,
-                                               widen_blackseps,
-                                               max_whiteseps,
-                                               minheight_whiteseps)
-    except ValueError:
+    def separate_columns():
+        # emptyish images will cause exceptions here.
+        try:
+            return pseg.compute_colseps(pseg.remove_hlines(binary, scale),
+                                        scale,
+                                        max_blackseps,
+                                        widen_blackseps,
+                                        max_whiteseps,
+                                        minheight_whiteseps)
+        except ValueError:
+            return None
+
+    colseps_key = prepare_key + ("colseps", max_blackseps, widen_blackseps, max_whiteseps, minheight_whiteseps)
+    separated = cached(cache, colseps_key, separate_columns, packed=True)
+    if separated is None:
         return []
+    colseps, binary = separated
+
+    deadline.check()
+    gradmaps_key = colseps_key + ("gradmaps", vscale, hscale, usegauss)
+    bottom, top, boxmap = cached(cache, gradmaps_key,
+                                 lambda: compute_gradmaps(binary, scale, vscale, hscale, usegauss))
+    deadline.check()
 
-    bottom, top, boxmap = compute_gradmaps(binary, scale, vscale, hscale, usegauss)
-    seeds = pseg.compute_line_seeds(binary, bottom, top, colseps, scale, threshold=threshold)
-    llabels1 = morph.propagate_labels(boxmap, seeds, conflict=0)
-    spread = morph.spread_labels(seeds, maxdist=scale)
-    llabels = np.where(llabels1 > 0, llabels1, spread * binary)
-    segmentation = llabels * binary
+    def label_lines():
+        seeds = pseg.compute_line_seeds(binary, bottom, top, colseps, scale, threshold=threshold)
+        deadline.check()
+        llabels1 = morph.propagate_labels(boxmap, seeds, conflict=0)
+        spread = morph.spread_labels(seeds, maxdist=scale)
+        llabels = np.where(llabels1 > 0, llabels1, spread * binary)
+        return llabels * binary
+
+    segmentation = cached(cache, gradmaps_key + ("labels", threshold), label_lines)
 
     if np.amax(segmentation) > maxlines:
-        s_print_error(f"too many lines {np.amax(segmentation)}")
+        logger.warning("too many lines %s", np.amax(segmentation))
         return
 
+    if factor > 1:
+        # Project the labels back onto the full resolution pixels, which weren't removed as lines or separators
+        segmentation = upsample_labels(segmentation, factor, full_binary.shape) * full_binary
+        scale = scale * factor
+
+    deadline.check()
     lines_and_polygons = compute_lines(segmentation,
                                        smear_strength,
                                        scale,
                                        growth,
                                        fail_save_iterations,
                                        filter_strength,
-                                       bounding_box)
+                                       bounding_box,
+                                       deadline,
+                                       polygon_engine)
+
+    if line_images is not None:
+        gray_rotated = np.array((gray if gray is not None else im).convert("L")
+                                .rotate(-orientation, expand=True, fillcolor="white"))
+        line_images.extend(extract_line_image(full_binary, gray_rotated, record.bounds, record.mask)
+                           for record in lines_and_polygons)
 
     # Translate each point back to original
-    delta_x = (im_rotated.width - im.width) / 2
-    delta_y = (im_rotated.height - im.height) / 2
-    center_x = im_rotated.width / 2
-    center_y = im_rotated.height / 2
+    delta_x = (rotated_size[0] - im.width) / 2
+    delta_y = (rotated_size[1] - im.height) / 2
+    center_x = rotated_size[0] / 2
+    center_y = rotated_size[1] / 2
 
     def translate_back(point):
         # rotate point around center
@@ -289,46 +474,96 @@ def segment(im: Image, scale: float = None, max_blackseps: int = 0, widen_blacks
     return [[translate_back(p) for p in record.polygon] for record in lines_and_polygons]
 
 
-def pagelineseg(xmlfile: str,
-                imgpath: str,
-                scale: float = None,
-                vscale: float = 1.0,
-                hscale: float = 1.0,
-                max_blackseps: int = 0,
-                widen_blackseps: int = 10,
-                max_whiteseps: int = -1,
-                minheight_whiteseps: int = 10,
-                minscale: float = 5.0,
-                maxlines: int = 300,
-                smear_strength: Tuple[float, float] = (1.0, 2.0),
-                growth: Tuple[float, float] = (1.1, 1.1),
-                filter_strength: float = 1.0,
-                fail_save_iterations: int = 50,
-                maxskew: float = 2.0,
-                skewsteps: int = 8,
-                usegauss: bool = False,
-                remove_images: bool = False,
-                bounding_box: bool = False):
-    name = Path(imgpath).name.split(".")[0]
-    s_print(f"""Start process for '{name}'
-        |- Image: '{imgpath}'
-        |- Annotations: '{xmlfile}' """)
-
-    root = pageutils.get_root(xmlfile)
+def log_orientation(name: str, region: str, orientation: float, maxskew: float, skewsteps: int):
+    logger.debug("Skew estimate between +/-%s in %s steps. Estimated %s°", maxskew, skewsteps, orientation,
+                 extra={"page": name, "region": region, "orientation": orientation})
+
+
+def segment_page(root: etree.Element,
+                 im: Image,
+                 name: str = "",
+                 scale: float = None,
+                 vscale: float = 1.0,
+                 hscale: float = 1.0,
+                 max_blackseps: int = 0,
+                 widen_blackseps: int = 10,
+                 max_whiteseps: int = -1,
+                 minheight_whiteseps: int = 10,
+                 minscale: float = 5.0,
+                 maxlines: int = 300,
+                 threshold: float = 0.2,
+                 smear_strength: Tuple[float, float] = (1.0, 2.0),
+                 growth: Tuple[float, float] = (1.1, 1.1),
+                 filter_strength: float = 1.0,
+                 fail_save_iterations: int = 50,
+                 maxskew: float = 2.0,
+                 skewsteps: int = 8,
+                 usegauss: bool = False,
+                 remove_images: bool = False,
+                 bounding_box: bool = False,
+                 skewestimate: bool = False,
+                 from_scratch: bool = False,
+                 working_scale: Union[float, str] = 1.0,
+                 shared_preprocessing: bool = False,
+                 region_timeout: float = None,
+                 page_timeout: float = None,
+                 polygon_engine: str = "smear",
+                 line_images: Optional[Dict[str, Record]] = None,
+                 cache: Optional[dict] = None):
+    """Replaces the TextLines of all TextRegions in a parsed PAGE XML tree by the lines segmented in the page image.
+
+    If shared_preprocessing is set, the page is binarized and its scale is estimated once. All regions are cut out of
+    the binarized page and segmented with the page scale (unless a scale is given) instead of binarizing and
+    estimating the scale of every region on its own.
+
+    If skewestimate is set, the orientation of every region is estimated and written like the skewestimate command
+    does (regions with an existing orientation are only re-estimated if from_scratch is set) on the same cutout that is
+    used for the line segmentation afterwards.
+
+    region_timeout and page_timeout limit the time (in seconds) spent on the line segmentation of a single region
+    (including its cutout, skew estimation and binarization) and of all regions of the page. Lines of a region exceeding
+    its budget fall back to their bounding boxes, or to a single line covering the region if no lines were found yet.
+    Regions starting after the page budget is used up get a single region line right away, without skew estimation
+    (keeping a stored orientation) and binarization. Degraded regions and the page are marked in their custom attribute.
+
+    If line_images is given, the deskewed bi-level and grayscale image of every TextLine is added to it by line id (see
+    extract_line_image), together with its region id, orientation, the offset of the region cutout in the page and its
+    points. Lines covering a whole region get the image of the whole deskewed region.
+
+    If a cache is given, the results of the preprocessing, cutout, skew estimation and binarization as well as of the
+    stages of segment are shared with other calls on the same page image using the same cache (see cached). This way a
+    parameter sweep only computes each stage once for every distinct set of its inputs. The image isn't modified then.
+    """
+    page_deadline = Deadline(page_timeout)
+    degraded_regions = 0
 
-    s_print(f"[{name}] Retrieve TextRegions")
+    logger.debug("Retrieve TextRegions", extra={"page": name})
 
     pageutils.convert_point_notation(root)
 
     coordmap = pageutils.construct_coordmap(root)
+    textregions = {textregion.get("id"): textregion for textregion in pagexml.iter_regions(root)}
 
-    s_print(f"[{name}] Extract Textlines from TextRegions")
+    logger.debug("Extract Textlines from TextRegions", extra={"page": name})
 
-    im = Image.open(imgpath)
     width, height = im.size
 
-    if remove_images:
-        imageutils.remove_images(im, root)
+    def preprocess():
+        page_im, page_scale = im, scale
+        if remove_images:
+            # Cached pages are shared with other runs, so images are only removed from a copy
+            page_im = page_im.copy() if cache is not None else page_im
+            imageutils.remove_images(page_im, root)
+        gray_page = page_im
+        if shared_preprocessing:
+            page_im = binarize_page(page_im)
+            if not scale:
+                page_scale = estimate_page_scale(page_im)
+                logger.debug("Estimated page scale %s", page_scale, extra={"page": name, "scale": page_scale})
+        return page_im, gray_page, page_scale
+
+    page_key = ("page", remove_images, shared_preprocessing, scale)
+    im, gray_page, scale = cached(cache, page_key, preprocess, packed=True)
 
     pageutils.remove_existing_textlines(root)
 
@@ -338,57 +573,111 @@ def pagelineseg(xmlfile: str,
         if len(region_coords) < 3:
             continue
 
-        cropped, [min_x, min_y, max_x, max_y] = imgmanipulate.cutout(im, region_coords)
-
-        if coordmap[coord].get("orientation"):
+        # The budget of the region includes its cutout, skew estimation and binarization
+        region_deadline = Deadline(region_timeout, parent=page_deadline)
+        region_key = page_key + ("region", coord)
+        # Regions starting after the budget is used up fall back to a single region line right away. They skip skew
+        # estimation and binarization and are only cut out for their line image.
+        started = not region_deadline.expired()
+        if started or line_images is not None:
+            cropped, [min_x, min_y, max_x, max_y] = cached(cache, region_key + ("cutout",),
+                                                           lambda: imgmanipulate.cutout(im, region_coords), packed=True)
+        else:
+            cropped = None
+        textregion = textregions[coord]
+        metrics.count("regions")
+
+        def estimate_orientation():
+            return skewestimate_helper.estimate_orientation(cropped, maxskew, skewsteps)
+
+        skew_key = region_key + ("skew", maxskew, skewsteps)
+        if not started:
+            orientation = coordmap[coord].get("orientation") or 0.0
+        elif skewestimate and (from_scratch or "orientation" not in coordmap[coord]):
+            orientation = cached(cache, skew_key, estimate_orientation)
+            textregion.set('orientation', str(orientation))
+            log_orientation(name, coord, orientation, maxskew, skewsteps)
+        elif coordmap[coord].get("orientation"):
             orientation = coordmap[coord]['orientation']
         else:
-            orientation = -1 * nlbin.estimate_skew(cropped, 0, maxskew=maxskew,
-                                                   skewsteps=skewsteps)
-            s_print(f"[{name}] Skew estimate between +/-{maxskew} in {skewsteps} steps. Estimated {orientation}°")
+            orientation = cached(cache, skew_key, estimate_orientation)
+            log_orientation(name, coord, orientation, maxskew, skewsteps)
 
+        region_images = [] if line_images is not None else None
         if cropped is not None:
+            gray = cropped if gray_page is im or line_images is None else \
+                cached(cache, region_key + ("gray cutout",), lambda: imgmanipulate.cutout(gray_page, region_coords)[0])
+
+        if cropped is not None and started:
             # Check whether cropped are is completely white or black and skip if true
             if not cropped.getbbox() or not ImageChops.invert(cropped).getbbox():
-                s_print(f"[{name}] Skipping fully black / white region...")
+                logger.debug("Skipping fully black / white region...", extra={"page": name, "region": coord})
                 continue
 
-            colors = cropped.getcolors(2)
-            if not (colors is not None and len(colors) == 2):
-                cropped = Image.fromarray(nlbin.adaptive_binarize(np.array(cropped)).astype(np.uint8))
+            if not imageutils.is_bilevel(cropped):
+                cropped = Image.fromarray(cached(cache, region_key + ("binarize",), lambda: nlbin.adaptive_binarize(
+                    np.array(cropped)).astype(np.uint8), packed=True))
             if coordmap[coord]["type"] == "drop-capital":
                 lines = [1]
+            elif region_deadline.expired():
+                lines = []
             else:
-                lines = segment(cropped,
-                                scale=scale,
-                                max_blackseps=max_blackseps,
-                                widen_blackseps=widen_blackseps,
-                                max_whiteseps=max_whiteseps,
-                                minheight_whiteseps=minheight_whiteseps,
-                                filter_strength=filter_strength,
-                                smear_strength=smear_strength,
-                                growth=growth,
-                                orientation=orientation,
-                                fail_save_iterations=fail_save_iterations,
-                                vscale=vscale,
-                                hscale=hscale,
-                                minscale=minscale,
-                                maxlines=maxlines,
-                                usegauss=usegauss,
-                                bounding_box=bounding_box)
-
+                try:
+                    with logs.context(page=name, region=coord):
+                        lines = segment(cropped,
+                                        scale=scale,
+                                        max_blackseps=max_blackseps,
+                                        widen_blackseps=widen_blackseps,
+                                        max_whiteseps=max_whiteseps,
+                                        minheight_whiteseps=minheight_whiteseps,
+                                        filter_strength=filter_strength,
+                                        smear_strength=smear_strength,
+                                        growth=growth,
+                                        orientation=orientation,
+                                        fail_save_iterations=fail_save_iterations,
+                                        vscale=vscale,
+                                        hscale=hscale,
+                                        minscale=minscale,
+                                        maxlines=maxlines,
+                                        threshold=threshold,
+                                        usegauss=usegauss,
+                                        bounding_box=bounding_box,
+                                        working_scale=working_scale,
+                                        deadline=region_deadline,
+                                        polygon_engine=polygon_engine,
+                                        gray=gray,
+                                        line_images=region_images,
+                                        cache=cache,
+                                        cache_key=region_key)
+                except BudgetExceeded:
+                    lines = []
         else:
             lines = []
 
+        if region_deadline.exceeded:
+            degraded_regions += 1
+            fallback = "bbox" if lines else "region"
+            reason = "page-timeout" if page_deadline.expired() else "region-timeout"
+            pageutils.add_custom(textregion, "lineseg", fallback=fallback, reason=reason)
+            metrics.count("degraded_regions")
+            logger.warning("Line segmentation exceeded its time budget (%s), falling back to %s", reason,
+                           "bounding boxes" if lines else "a single region line",
+                           extra={"page": name, "region": coord, "reason": reason, "fallback": fallback})
+
         # Interpret whole region as TextLine if no TextLines are found
         if not lines or len(lines) == 0:
             coord_str = " ".join([f"{x},{y}" for x, y in region_coords])
-            textregion = root.find(f'.//{{*}}TextRegion[@id="{coord}"]')
             if orientation:
                 textregion.set('orientation', str(orientation))
             linexml = etree.SubElement(textregion, "TextLine",
                                        attrib={"id": "{}_l{:03d}".format(coord, coord_idx + 1)})
             etree.SubElement(linexml, "Coords", attrib={"points": coord_str})
+            metrics.count("lines")
+            if line_images is not None and cropped is not None:
+                line_image = region_line_image(cropped, gray, orientation)
+                line_image.__dict__.update(region=coord, orientation=orientation, offset=(min_x, min_y),
+                                           points=coord_str)
+                line_images[linexml.get("id")] = line_image
         else:
             for poly_idx, poly in enumerate(lines):
                 if coordmap[coord]["type"] == "drop-capital":
@@ -398,15 +687,179 @@ def pagelineseg(xmlfile: str,
                     sanitized_coords = pageutils.sanitize(line_coords, Polygon(region_coords), width, height)
                     coord_str = " ".join([f"{int(x)},{int(y)}" for x, y in sanitized_coords])
 
-                textregion = root.find(f'.//{{*}}TextRegion[@id="{coord}"]')
                 if orientation:
                     textregion.set('orientation', str(orientation))
                 linexml = etree.SubElement(textregion, "TextLine",
                                            attrib={"id": "{}_l{:03d}".format(coord, poly_idx + 1)})
                 etree.SubElement(linexml, "Coords", attrib={"points": coord_str})
+                if line_images is not None:
+                    line_image = region_images[poly_idx] if poly_idx < len(region_images) \
+                        else region_line_image(cropped, gray, orientation)
+                    line_image.__dict__.update(region=coord, orientation=orientation, offset=(min_x, min_y),
+                                               points=coord_str)
+                    line_images[linexml.get("id")] = line_image
+            metrics.count("lines", len(lines))
+
+    if degraded_regions:
+        page = pagexml.child(root, "Page")
+        if page is not None:
+            pageutils.add_custom(page, "lineseg", degraded_regions=degraded_regions)
+
+
+def segment_tree(page: Union[etree._Element, etree._ElementTree],
+                 image: Union[Image.Image, np.ndarray],
+                 copy: bool = True,
+                 **kwargs) -> etree.Element:
+    """Segments the lines of a page held in memory, without reading or writing any files.
+
+    :param page: Parsed PAGE XML document as element tree or any of its elements.
+    :param image: Page image as PIL image or array, see imageutils.as_image.
+    :param copy: Segment a copy of the document instead of modifying it in place. The image is never modified.
+    :param kwargs: Parameters of the line segmentation, see segment_page.
+    :return: Root of the segmented document, which can be serialized with serialize_page.
+    """
+    root = pagexml.as_root(page, copy)
+    im = imageutils.as_image(image)
+    if kwargs.get("remove_images") and im is image and kwargs.get("cache") is None:
+        # Images are only removed from a copy, as long as the stage cache doesn't already take care of it
+        im = im.copy()
+    segment_page(root, im, **kwargs)
+    return root
+
+
+def line_geometry(root: etree.Element) -> List[Record]:
+    """Returns the TextLines of a segmented document in document order as records of their id, the id and
+    orientation (None if not set) of their region and their points as (x, y) tuples.
+    """
+    lines = []
+    for region in pagexml.iter_regions(root):
+        orientation = region.get("orientation")
+        for line in pagexml.children(region, "TextLine"):
+            lines.append(Record(id=line.get("id"),
+                                region=region.get("id"),
+                                orientation=float(orientation) if orientation is not None else None,
+                                points=[(x, y) for x, y in pagexml.coords_points(line)]))
+    return lines
+
+
+def segment_lines(page: Union[etree._Element, etree._ElementTree],
+                  image: Union[Image.Image, np.ndarray],
+                  **kwargs) -> List[Record]:
+    """Segments the lines of a page held in memory like segment_tree, leaving the given document untouched, and
+    returns their geometry (see line_geometry).
+    """
+    return line_geometry(segment_tree(page, image, copy=True, **kwargs))
+
 
-    s_print(f"[{name}] Generate new PAGE XML with text lines")
-    xmlstring = etree.tounicode(root.getroottree()).replace(
+def serialize_page(root: etree.Element) -> str:
+    """Serializes a segmented PAGE XML tree, updating legacy namespaces to the latest PAGE XML version.
+    """
+    return etree.tounicode(root.getroottree()).replace(
         "http://schema.primaresearch.org/PAGE/gts/pagecontent/2010-03-19",
         "http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15")
-    return xmlstring
+
+
+def write_line_images(line_images: Dict[str, Record], directory: Path):
+    """Writes the line images collected by segment_page into directory as <line id>.bin.png (bi-level) and
+    <line id>.nrm.png (grayscale). Their coordinates are written to lines.json: per line id the region id, the region
+    orientation, the offset of the region cutout in the page, the box (x0, y0, x1, y1) the line image was cut out of in
+    the deskewed region cutout and the points of the TextLine in the page.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    coords = {}
+    for line_id, line_image in line_images.items():
+        line_image.binary.save(Path(directory, f"{line_id}.bin.png"))
+        line_image.gray.save(Path(directory, f"{line_id}.nrm.png"))
+        coords[line_id] = {"region": line_image.region,
+                           "orientation": float(line_image.orientation or 0),
+                           "offset": [int(v) for v in line_image.offset],
+                           "box": [int(v) for v in line_image.box],
+                           "points": line_image.points}
+    with Path(directory, "lines.json").open("w") as coords_file:
+        json.dump(coords, coords_file, indent=2)
+
+
+def load_page(xmlfile: str, imgpath: str, preload: bool = False) -> Tuple[etree.Element, Image.Image]:
+    """Parses the PAGE XML file and opens the image of a page, see imageutils.load_image.
+    """
+    return pageutils.get_root(xmlfile), imageutils.load_image(imgpath, preload)
+
+
+def pagelineseg(xmlfile: str,
+                imgpath: str,
+                scale: float = None,
+                vscale: float = 1.0,
+                hscale: float = 1.0,
+                max_blackseps: int = 0,
+                widen_blackseps: int = 10,
+                max_whiteseps: int = -1,
+                minheight_whiteseps: int = 10,
+                minscale: float = 5.0,
+                maxlines: int = 300,
+                threshold: float = 0.2,
+                smear_strength: Tuple[float, float] = (1.0, 2.0),
+                growth: Tuple[float, float] = (1.1, 1.1),
+                filter_strength: float = 1.0,
+                fail_save_iterations: int = 50,
+                maxskew: float = 2.0,
+                skewsteps: int = 8,
+                usegauss: bool = False,
+                remove_images: bool = False,
+                bounding_box: bool = False,
+                skewestimate: bool = False,
+                from_scratch: bool = False,
+                working_scale: Union[float, str] = 1.0,
+                shared_preprocessing: bool = False,
+                region_timeout: float = None,
+                page_timeout: float = None,
+                polygon_engine: str = "smear",
+                page: Tuple[etree.Element, Image.Image] = None,
+                line_images_dir: str = None,
+                cache: Optional[dict] = None):
+    """Segments the lines of all regions of a page and returns the resulting PAGE XML. page can hold the already loaded
+    (root, image) tuple of the page as returned by load_page. If line_images_dir is set, the line images of the page are
+    written to its subdirectory named after the image (see write_line_images). cache is passed on to segment_page.
+    """
+    name = Path(imgpath).name.split(".")[0]
+    logger.info("Start process for image '%s' with annotations '%s'", imgpath, xmlfile,
+                extra={"page": name, "image": imgpath, "pagexml": xmlfile})
+
+    root, im = page if page is not None else load_page(xmlfile, imgpath)
+    line_images = {} if line_images_dir else None
+
+    segment_page(root, im, name,
+                 scale=scale,
+                 vscale=vscale,
+                 hscale=hscale,
+                 max_blackseps=max_blackseps,
+                 widen_blackseps=widen_blackseps,
+                 max_whiteseps=max_whiteseps,
+                 minheight_whiteseps=minheight_whiteseps,
+                 minscale=minscale,
+                 maxlines=maxlines,
+                 threshold=threshold,
+                 smear_strength=smear_strength,
+                 growth=growth,
+                 filter_strength=filter_strength,
+                 fail_save_iterations=fail_save_iterations,
+                 maxskew=maxskew,
+                 skewsteps=skewsteps,
+                 usegauss=usegauss,
+                 remove_images=remove_images,
+                 bounding_box=bounding_box,
+                 skewestimate=skewestimate,
+                 from_scratch=from_scratch,
+                 working_scale=working_scale,
+                 shared_preprocessing=shared_preprocessing,
+                 region_timeout=region_timeout,
+                 page_timeout=page_timeout,
+                 polygon_engine=polygon_engine,
+                 line_images=line_images,
+                 cache=cache)
+
+    if line_images is not None:
+        logger.debug("Write %s line images", len(line_images), extra={"page": name})
+        write_line_images(line_images, Path(line_images_dir, name))
+
+    logger.debug("Generate new PAGE XML with text lines", extra={"page": name})
+    return serialize_page(root)
@@ -1,56 +1,94 @@
 # -*- coding: utf-8 -*-
 # Skew estimate script for regions of images with PAGE xml.
 from lxml import etree
+import numpy as np
 from PIL import Image
 from ocr4all_helper_scripts.lib import imgmanipulate, nlbin
+from ocr4all_helper_scripts.utils import imageutils, metrics, pagexml
 
+import logging
 import os
+from typing import Dict, Optional, Tuple, Union
 
 
-# Add printing for every thread
-from threading import Lock
-s_print_lock = Lock()
+logger = logging.getLogger(__name__)
 
 
-def s_print(*args, **kwargs):
-    with s_print_lock:
-        print(*args, **kwargs)
+def estimate_orientation(cropped: Image, maxskew: float = 2, skewsteps: int = 8) -> float:
+    """Estimates the orientation of a cropped region as used for the orientation attribute of a PAGE XML region.
+    """
+    return -1*nlbin.estimate_skew(cropped, 0, maxskew=maxskew, skewsteps=skewsteps)
 
 
-def pagexmlskewestimate(xmlfile: str, imgpath: str, from_scratch: bool = False, maxskew: int = 2, skewsteps: int = 8):
-    name = os.path.splitext(os.path.split(imgpath)[-1])[0]
-    s_print(f"""Start process for '{name}'
-        |- Image: '{imgpath}'
-        |- Annotations: '{xmlfile}' """)
+def load_page(xmlfile: str, imgpath: str, reduce: int = 1,
+              preload: bool = False) -> Tuple[etree.Element, Image.Image, Tuple[float, float]]:
+    """Parses the PAGE XML file and opens the image of a page for the skew estimation, with JPEG images being decoded
+    at reduced resolution (see imageutils.draft).
+
+    :return: Root of the PAGE XML, image and factors between the original and the reduced image size.
+    """
+    im = imageutils.load_image(imgpath)
+    factors = imageutils.draft(im, reduce)
+    if preload:
+        im.load()
+    return pagexml.parse(xmlfile), im, factors
 
-    im = Image.open(imgpath)
-    root = etree.parse(xmlfile).getroot()
-    ns = {"ns": root.nsmap[None]}
 
-    regions = root.xpath('//ns:TextRegion', namespaces=ns)
+def skewestimate_page(root: etree.Element, im: Image, name: str = "", from_scratch: bool = False, maxskew: float = 2,
+                      skewsteps: int = 8, factors: Tuple[float, float] = (1.0, 1.0)):
+    """Sets the orientation attribute of all TextRegions of a parsed PAGE XML tree (only of those without one unless
+    from_scratch is set) to the orientation estimated in the page image. factors are the factors between the size of
+    the image the coordinates refer to and the size of im, see imageutils.draft.
+    """
+    factor_x, factor_y = factors
+    regions = list(pagexml.iter_regions(root))
     for n, region in enumerate(regions):
-        s_print(f"[{name}] Calculate skew of {n}/{len(regions)}")
+        logger.debug("Calculate skew of %s/%s", n, len(regions), extra={"page": name, "region": region.get("id")})
 
         # Read coords
-        for c in region.xpath("./ns:Coords", namespaces=ns) + region.xpath("./Coords"):
-            coords = []
-            if "points" in c.attrib:
-                coordstrings = [x.split(",") for x in c.attrib["points"].split()]
-                coords += [[int(x[0]), int(x[1])] for x in coordstrings]
-            else:
-                for point in c.xpath("./ns:Point", namespaces=ns):
-                    cx = point.attrib["x"]
-                    cy = point.attrib["y"]
-                    coords.append([int(cx), int(cy)])
+        coords = pagexml.coords_points(region)
 
         # Read orientation
         if len(coords) > 2 and ('orientation' not in region.attrib or from_scratch):
-            cropped, _ = imgmanipulate.cutout(im, coords)
-            orientation = -1*nlbin.estimate_skew(cropped, 0, maxskew=maxskew,
-                                                 skewsteps=skewsteps)
+            cropped, _ = imgmanipulate.cutout(im, [[int(x / factor_x), int(y / factor_y)] for x, y in coords])
+            orientation = estimate_orientation(cropped, maxskew, skewsteps)
             region.set('orientation', str(orientation))
+            metrics.count("regions")
+
+
+def skewestimate_tree(page: Union[etree._Element, etree._ElementTree], image: Union[Image.Image, np.ndarray],
+                      from_scratch: bool = False, maxskew: float = 2, skewsteps: int = 8,
+                      copy: bool = True) -> etree.Element:
+    """Estimates the orientations of the regions of a page held in memory, without reading or writing any files.
+
+    :param page: Parsed PAGE XML document as element tree or any of its elements.
+    :param image: Page image as PIL image or array, see imageutils.as_image.
+    :param copy: Update a copy of the document instead of modifying it in place.
+    :return: Root of the updated document.
+    """
+    root = pagexml.as_root(page, copy)
+    skewestimate_page(root, imageutils.as_image(image), from_scratch=from_scratch, maxskew=maxskew,
+                      skewsteps=skewsteps)
+    return root
+
+
+def region_orientations(root: etree.Element) -> Dict[str, Optional[float]]:
+    """Returns the orientation of every TextRegion of a document by id (None for regions without one)."""
+    return {region.get("id"): float(region.get("orientation")) if region.get("orientation") is not None else None
+            for region in pagexml.iter_regions(root)}
+
+
+def pagexmlskewestimate(xmlfile: str, imgpath: str, from_scratch: bool = False, maxskew: int = 2, skewsteps: int = 8,
+                        reduce: int = 1, page: Tuple[etree.Element, Image.Image, Tuple[float, float]] = None):
+    name = os.path.splitext(os.path.split(imgpath)[-1])[0]
+    logger.info("Start process for image '%s' with annotations '%s'", imgpath, xmlfile,
+                extra={"page": name, "image": imgpath, "pagexml": xmlfile})
+
+    root, im, factors = page if page is not None else load_page(xmlfile, imgpath, reduce)
+
+    skewestimate_page(root, im, name, from_scratch, maxskew, skewsteps, factors)
 
-    s_print(f"[{name}] Add all orientations in annotation file")
+    logger.debug("Add all orientations in annotation file", extra={"page": name})
     xmlstring = etree.tounicode(root.getroottree())
-    no_lines_segm = int(root.xpath("count(//TextLine)"))
+    no_lines_segm = int(pagexml.xpath("count(//p:TextLine)", root)(root))
     return xmlstring, no_lines_segm
@@ -10,9 +10,14 @@ def cutout(im, coords):
         return None
     maskim = Image.new('1', im.size, 0)
     ImageDraw.Draw(maskim).polygon(coords, outline=1, fill=1)
-    new = Image.new(im.mode, im.size, "white")
-    masked = Image.composite(im, new, maskim)
     rectangle = [min([p[0] for p in coords]), min([p[1] for p in coords]), max([p[0] for p in coords]),
                  max([p[1] for p in coords])]
-    cropped = masked.crop(rectangle)
+    # Composite only the cropped rectangle instead of the whole page. Areas outside of the page stay black.
+    size = (rectangle[2] - rectangle[0], rectangle[3] - rectangle[1])
+    new = Image.new(im.mode, size, 0)
+    inside = (max(0, -rectangle[0]), max(0, -rectangle[1]),
+              min(size[0], im.width - rectangle[0]), min(size[1], im.height - rectangle[1]))
+    if inside[0] < inside[2] and inside[1] < inside[3]:
+        new.paste("white", inside)
+    cropped = Image.composite(im.crop(rectangle), new, maskim.crop(rectangle))
     return cropped, rectangle
@@ -0,0 +1,241 @@
+# Sequential scan kernels of the line segmentation with an optional numba backend.
+#
+# The backend is selected with the OCR4ALL_KERNELS environment variable or the --kernels option of the cli:
+#   auto   numba if it is installed, numpy otherwise (default)
+#   numba  JIT compiled kernels, falls back to numpy with a warning if numba isn't installed
+#   numpy  plain NumPy/Python implementations
+# Both backends return equal results.
+
+import logging
+import os
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "numba", "numpy")
+
+_backend = "numpy"
+
+# Gap length of runs without any high pixel yet, larger than any smear distance
+_NO_GAP = np.iinfo(np.int64).max // 2
+
+
+def use(backend: str):
+    """Selects the kernel backend, see BACKENDS."""
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "numba" and numba is None:
+        logger.warning("numba is not installed, falling back to numpy kernels")
+    _backend = "numba" if backend in ("auto", "numba") and numba is not None else "numpy"
+
+
+def backend() -> str:
+    return _backend
+
+
+def smear(work_image: np.ndarray, smear_distance_x: int, smear_distance_y: int,
+          check: Optional[Callable[[], None]] = None):
+    """Closes vertical gaps shorter than smear_distance_y and horizontal gaps shorter than smear_distance_x between
+    high pixels of a boolean image in place. check is called once per column by the numpy kernel.
+    """
+    if _backend == "numba":
+        if check is not None:
+            check()
+        _smear_jit(work_image, smear_distance_x, smear_distance_y)
+    else:
+        _smear_numpy(work_image, smear_distance_x, smear_distance_y, check)
+
+
+def _smear_numpy(work_image, smear_distance_x, smear_distance_y, check=None):
+    height, width = work_image.shape
+    gaps_current_x = [float('Inf')] * height
+    for x in range(width):
+        if check is not None:
+            check()
+        gap_current_y = float('Inf')
+        for y in range(height):
+            if work_image[y, x]:
+                # Entered Contour
+                gap_current_x = gaps_current_x[y]
+
+                if gap_current_y < smear_distance_y and gap_current_y > 0:
+                    # Draw over
+                    work_image[y - gap_current_y:y, x] = True
+
+                if gap_current_x < smear_distance_x and gap_current_x > 0:
+                    # Draw over
+                    work_image[y, x - gap_current_x:x] = True
+
+                gap_current_y = 0
+                gaps_current_x[y] = 0
+            else:
+                # Entered/Still in Gap
+                gap_current_y += 1
+                gaps_current_x[y] += 1
+
+
+def _smear_loops(work_image, smear_distance_x, smear_distance_y):
+    height, width = work_image.shape
+    gaps_current_x = np.full(height, _NO_GAP, np.int64)
+    for x in range(width):
+        gap_current_y = _NO_GAP
+        for y in range(height):
+            if work_image[y, x]:
+                gap_current_x = gaps_current_x[y]
+                if 0 < gap_current_y < smear_distance_y:
+                    for yy in range(y - gap_current_y, y):
+                        work_image[yy, x] = True
+                if 0 < gap_current_x < smear_distance_x:
+                    for xx in range(x - gap_current_x, x):
+                        work_image[y, xx] = True
+                gap_current_y = 0
+                gaps_current_x[y] = 0
+            else:
+                gap_current_y += 1
+                gaps_current_x[y] += 1
+
+
+def line_seeds(bmarked: np.ndarray, tmarked: np.ndarray, scale: float) -> np.ndarray:
+    """Marks the line seeds of every column between baseline candidates (bmarked) and the next x-height candidate
+    (tmarked) above them, cf. pseg.compute_line_seeds.
+    """
+    if _backend == "numba":
+        return _line_seeds_jit(np.ascontiguousarray(bmarked, np.bool_), np.ascontiguousarray(tmarked, np.bool_),
+                               float(scale))
+    return _line_seeds_numpy(bmarked, tmarked, scale)
+
+
+def _line_seeds_numpy(bmarked, tmarked, scale):
+    seeds = np.zeros(bmarked.shape, 'i')
+    delta = max(3, int(scale/2))
+    for x in range(bmarked.shape[1]):
+        transitions = sorted([(y, 1) for y in np.flatnonzero(bmarked[:, x])] +
+                             [(y, 0) for y in np.flatnonzero(tmarked[:, x])])[::-1]
+        transitions += [(0, 0)]
+        for l in range(len(transitions)-1):
+            y0, s0 = transitions[l]
+            if s0 == 0:
+                continue
+            seeds[y0-delta:y0, x] = 1
+            y1, s1 = transitions[l+1]
+            if s1 == 0 and (y0-y1) < 5*scale:
+                seeds[y1:y0, x] = 1
+    return seeds
+
+
+def _line_seeds_loops(bmarked, tmarked, scale):
+    height, width = bmarked.shape
+    seeds = np.zeros((height, width), np.int32)
+    delta = max(3, int(scale / 2))
+    ys = np.empty(2 * height + 1, np.int64)
+    states = np.empty(2 * height + 1, np.int64)
+    for x in range(width):
+        # Transitions in descending order of (y, state), terminated by (0, 0)
+        n = 0
+        for y in range(height - 1, -1, -1):
+            if bmarked[y, x]:
+                ys[n] = y
+                states[n] = 1
+                n += 1
+            if tmarked[y, x]:
+                ys[n] = y
+                states[n] = 0
+                n += 1
+        ys[n] = 0
+        states[n] = 0
+        for l in range(n):
+            y0 = ys[l]
+            if states[l] == 0:
+                continue
+            # Same bounds as the slice seeds[y0-delta:y0, x], including a wrapped negative start
+            start = y0 - delta
+            if start < 0:
+                start = max(0, start + height)
+            for y in range(start, y0):
+                seeds[y, x] = 1
+            y1 = ys[l + 1]
+            if states[l + 1] == 0 and (y0 - y1) < 5 * scale:
+                for y in range(y1, y0):
+                    seeds[y, x] = 1
+    return seeds
+
+
+def topsort(order: np.ndarray) -> List[int]:
+    """Given a binary array defining a partial order (o[i,j]==True means i<j), compute a topological sort.
+    """
+    if _backend == "numba":
+        return _topsort_jit(np.ascontiguousarray(order, np.bool_)).tolist()
+    return _topsort_numpy(order)
+
+
+def _topsort_numpy(order):
+    n = len(order)
+    visited = np.zeros(n)
+    L = []
+
+    def visit(k):
+        if visited[k]:
+            return
+        visited[k] = 1
+        for l in np.flatnonzero(order[:, k]):
+            visit(l)
+        L.append(k)
+
+    for k in range(n):
+        visit(k)
+
+    return L
+
+
+def _topsort_loops(order):
+    # Iterative version of the depth first search of _topsort_numpy, which visits in the same order
+    n = order.shape[0]
+    visited = np.zeros(n, np.bool_)
+    result = np.empty(n, np.int64)
+    stack = np.empty(n, np.int64)
+    child = np.empty(n, np.int64)
+    count = 0
+    for k in range(n):
+        if visited[k]:
+            continue
+        visited[k] = True
+        depth = 0
+        stack[0] = k
+        child[0] = 0
+        while depth >= 0:
+            node = stack[depth]
+            pushed = False
+            while child[depth] < n:
+                l = child[depth]
+                child[depth] += 1
+                if order[l, node] and not visited[l]:
+                    visited[l] = True
+                    depth += 1
+                    stack[depth] = l
+                    child[depth] = 0
+                    pushed = True
+                    break
+            if not pushed:
+                result[count] = node
+                count += 1
+                depth -= 1
+    return result[:count]
+
+
+if numba is not None:
+    _smear_jit = numba.njit(cache=True)(_smear_loops)
+    _line_seeds_jit = numba.njit(cache=True)(_line_seeds_loops)
+    _topsort_jit = numba.njit(cache=True)(_topsort_loops)
+
+try:
+    use(os.environ.get("OCR4ALL_KERNELS", "auto"))
+except ValueError as e:
+    logger.warning("%s, using numpy kernels", e)
@@ -6,27 +6,61 @@
 # This also allows to use the function in python3 and and remove unneeded
 # dependencies like matplotlib.
 
+from math import ceil
+
+from scipy import sparse
 from scipy.ndimage import filters, measurements, morphology
-from numpy import array, zeros, argsort, amax, amin, unique
+from numpy import arange, array, asarray, bincount, diff, full, maximum, minimum, ones, repeat, tile, zeros, argsort, \
+    amax, amin
 
 
-def select_regions(binary, f, min=0, nbest=100000):
+def select_regions(binary, f, min=0, nbest=100000, vectorized=False):
     """Given a scoring function f over slice tuples (as returned by
     find_objects), keeps at most nbest regions whose scores is higher
-    than min."""
+    than min.
+
+    If vectorized, f is instead called once with a tuple of slices whose
+    starts and stops are arrays holding the bounds of all regions (see
+    bounds), so it has to compute the scores elementwise like sl.dim0 or
+    sl.dim1. This avoids creating a slice tuple and calling f per region."""
     labels, n = label(binary)
-    objects = find_objects(labels)
-    scores = [f(o) for o in objects]
+    if vectorized:
+        scores = asarray(f(bounds(labels, n)))
+    else:
+        scores = asarray([f(o) for o in find_objects(labels)])
+    # same data type as a list of the scores of single slices
+    scores = scores.astype('int64' if scores.dtype.kind in "iu" else 'float64')
     best = argsort(scores)
-    keep = zeros(len(objects)+1, 'i')
+    keep = zeros(n+1, 'i')
     if nbest > 0:
-        for i in best[-nbest:]:
-            if scores[i] <= min:
-                continue
-            keep[i+1] = 1
+        best = best[-nbest:]
+        keep[best[scores[best] > min]+1] = 1
     return keep[labels]
 
 
+def bounds(labels, n=None):
+    """Returns the bounding boxes of the labels 1 to n (amax(labels) if not
+    given) as a tuple of a row and a column slice, whose starts and stops are
+    arrays holding the bounds of every label. Unlike find_objects, no slice
+    objects are created per label. Missing labels get empty bounds."""
+    labels = asarray(labels)
+    if n is None:
+        n = int(amax(labels)) if labels.size else 0
+    h, w = labels.shape
+    flat = labels.ravel()
+    labelled = flat != 0
+    values = flat[labelled]
+    rows = repeat(arange(h, dtype='i'), w)[labelled]
+    columns = tile(arange(w, dtype='i'), h)[labelled]
+    result = []
+    for positions, size in ((rows, h), (columns, w)):
+        starts, stops = full(n+1, size, 'i'), zeros(n+1, 'i')
+        minimum.at(starts, values, positions)
+        maximum.at(stops, values, positions+1)
+        result.append(slice(minimum(starts[1:], stops[1:]), stops[1:]))
+    return tuple(result)
+
+
 def r_dilation(image, size, origin=0):
     """Dilation with rectangular structuring element using maximum_filter"""
     return filters.maximum_filter(image, size, origin=origin)
@@ -57,76 +91,85 @@ def rb_opening(image, size, origin=0):
     return rb_dilation(image, size, origin=origin)
 
 
+def _normalize(image, kinds):
+    """Returns image as an array, converted to int32 once if its data type
+    isn't of one of the given kinds."""
+    image = asarray(image)
+    return image if image.dtype.kind in kinds else image.astype('int32')
+
+
 def find_objects(image, **kw):
     """Redefine the scipy.ndimage.measurements.find_objects function to
-    work with a wider range of data types.  The default function
-    is inconsistent about the data types it accepts on different
-    platforms."""
-    try:
-        return measurements.find_objects(image, **kw)
-    except:
-        pass
-    types = ["int32", "uint32", "int64", "uint64", "int16", "uint16"]
-    for t in types:
-        try:
-            return measurements.find_objects(array(image, dtype=t), **kw)
-        except:
-            pass
-    # let it raise the same exception as before
-    return measurements.find_objects(image, **kw)
+    work with a wider range of data types (bool and float images are
+    converted to int32)."""
+    return measurements.find_objects(_normalize(image, "iu"), **kw)
 
 
 def label(image, **kw):
     """Redefine the scipy.ndimage.measurements.label function to
-    work with a wider range of data types.  The default function
-    is inconsistent about the data types it accepts on different
-    platforms."""
-    try:
-        return measurements.label(image, **kw)
-    except:
-        pass
-    types = ["int32", "uint32", "int64", "uint64", "int16", "uint16"]
-    for t in types:
-        try:
-            return measurements.label(array(image, dtype=t), **kw)
-        except:
-            pass
-    # let it raise the same exception as before
-    return measurements.label(image, **kw)
+    work with a wider range of data types (non-numeric images are
+    converted to int32)."""
+    return measurements.label(_normalize(image, "biuf"), **kw)
 
 
 def propagate_labels(image, labels, conflict=0):
     """Given an image and a set of labels, apply the labels
     to all the regions in the image that overlap a label.
     Assign the value `conflict` to any labels that have a conflict."""
-    rlabels, _ = label(image)
-    cors = correspondences(rlabels, labels)
-    outputs = zeros(amax(rlabels)+1, 'i')
-    oops = -(1 << 30)
-    for o, i in cors.T:
-        if outputs[o] != 0:
-            outputs[o] = oops
-        else:
-            outputs[o] = i
-    outputs[outputs == oops] = conflict
+    rlabels, n = label(image)
+    labels = asarray(labels)
+    # only labelled pixels can assign a label to a region
+    labelled = labels != 0
+    if labelled.any():
+        regions, values = correspondences(rlabels[labelled], labels[labelled])
+    else:
+        regions, values = zeros(0, 'i'), zeros(0, 'i')
+    counts = bincount(regions, minlength=n+1)
+    outputs = zeros(n+1, 'i')
+    outputs[regions] = values
+    outputs[counts > 1] = conflict
     outputs[0] = 0
     return outputs[rlabels]
 
 
 def correspondences(labels1, labels2):
     """Given two labeled images, compute an array giving the correspondences
-    between labels in the two images."""
-    q = 100000
+    between labels in the two images (sorted by the labels of labels1, then
+    labels2).
+
+    The label pairs of all pixels are collected as a sparse matrix, whose
+    conversion to CSR merges duplicate pairs with a counting sort instead of
+    sorting the pairs of all pixels."""
+    labels1, labels2 = asarray(labels1).ravel(), asarray(labels2).ravel()
     assert amin(labels1) >= 0 and amin(labels2) >= 0
-    assert amax(labels2) < q
-    combo = labels1*q+labels2
-    result = unique(combo)
-    result = array([result//q, result % q])
-    return result
+    pairs = sparse.csr_matrix((ones(len(labels1), 'b'), (labels1, labels2)),
+                              shape=(int(amax(labels1))+1, int(amax(labels2))+1))
+    pairs.sum_duplicates()
+    return array([repeat(arange(pairs.shape[0]), diff(pairs.indptr)), pairs.indices])
+
+
+def spread_labels(labels, maxdist=9999999, tile_size=512):
+    """Spread the given labels to the background (up to a distance of maxdist).
+
+    The distance transform and its index arrays are computed per tile of the image, extended by maxdist on each side,
+    instead of for the whole image at once, as labels further away can't spread into the tile. This keeps the memory
+    beyond the result close to the size of a tile, with the same result as a transform of the whole image."""
+    margin = int(ceil(maxdist))
+    tile_size = max(tile_size, 4 * margin)
+    h, w = labels.shape
+    spread = zeros(labels.shape, labels.dtype)
+    for y0 in range(0, h, tile_size):
+        for x0 in range(0, w, tile_size):
+            y1, x1 = min(h, y0 + tile_size), min(w, x0 + tile_size)
+            wy0, wx0 = max(0, y0 - margin), max(0, x0 - margin)
+            window = labels[wy0:min(h, y1 + margin), wx0:min(w, x1 + margin)]
+            if not window.any():
+                continue
+            spread[y0:y1, x0:x1] = _spread_window(window, maxdist)[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+    return spread
 
 
-def spread_labels(labels, maxdist=9999999):
-    """Spread the given labels to the background"""
+def _spread_window(labels, maxdist):
     distances, features = morphology.distance_transform_edt(labels == 0, return_distances=1, return_indices=1)
     indexes = features[0]*labels.shape[1]+features[1]
     spread = labels.ravel()[indexes.ravel()].reshape(*labels.shape)
@@ -15,6 +15,8 @@ from PIL import Image
 def estimate_skew(flat, bignore=0.1, maxskew=2, skewsteps=8):
     """Estimate skew angle of a scanned line and rotate accordingly. Ported method from ocropy
     """
+    if flat.mode == "1":
+        flat = flat.convert("L")
     d0, d1 = flat.size
     o0, o1 = int(bignore*d0), int(bignore*d1)  # border ignore
     flat = np.amax(flat)-flat
@@ -8,7 +8,7 @@
 # dependencies like matplotlib.
 import numpy as np
 from scipy.ndimage.filters import gaussian_filter, uniform_filter, maximum_filter
-from ocr4all_helper_scripts.lib import morph, sl
+from ocr4all_helper_scripts.lib import kernels, morph, sl
 
 
 def compute_colseps(binary, scale, max_blackseps, widen_blackseps, max_whiteseps, minheight_whiteseps):
@@ -56,7 +56,7 @@ def compute_colseps_conv(binary, scale=1.0, minheight_whiteseps=10, max_whitesep
     seps = np.minimum(thresh, maximum_filter(grad, (int(scale), int(5*scale))))
     seps = maximum_filter(seps, (int(2*scale), 1))
     # select only the biggest column separators
-    seps = morph.select_regions(seps, sl.dim0, min=minheight_whiteseps*scale, nbest=max_whiteseps)
+    seps = morph.select_regions(seps, sl.dim0, min=minheight_whiteseps*scale, nbest=max_whiteseps, vectorized=True)
     return seps
 
 
@@ -68,8 +68,8 @@ def compute_separators_morph(binary, scale, max_blackseps=0, widen_blackseps=10)
     thick = morph.r_dilation(binary, (d0, d1))
     vert = morph.rb_opening(thick, (10*scale, 1))
     vert = morph.r_erosion(vert, (d0//2, widen_blackseps))
-    vert = morph.select_regions(vert, sl.dim1, min=3, nbest=2*max_blackseps)
-    vert = morph.select_regions(vert, sl.dim0, min=20*scale, nbest=max_blackseps)
+    vert = morph.select_regions(vert, sl.dim1, min=3, nbest=2*max_blackseps, vectorized=True)
+    vert = morph.select_regions(vert, sl.dim0, min=20*scale, nbest=max_blackseps, vectorized=True)
     return vert
 
 
@@ -133,22 +133,7 @@ def topsort(order):
     """Given a binary array defining a partial order (o[i,j]==True means i<j),
     compute a topological sort.  This is a quick and dirty implementation
     that works for up to a few thousand elements."""
-    n = len(order)
-    visited = np.zeros(n)
-    L = []
-
-    def visit(k):
-        if visited[k]:
-            return
-        visited[k] = 1
-        for l in find(order[:, k]):
-            visit(l)
-        L.append(k)
-
-    for k in range(n):
-        visit(k)
-
-    return L  # [::-1]
+    return kernels.topsort(order)  # [::-1]
 
 
 def find(condition):
@@ -169,19 +154,7 @@ def compute_line_seeds(binary, bottom, top, colseps, scale, threshold=0.2, vscal
     tmarked = maximum_filter(top == maximum_filter(top, (vrange, 0)), (2, 2))
     tmarked = tmarked*(top > t*np.amax(top)*t/2)*(1-colseps)
     tmarked = maximum_filter(tmarked, (1, 20))
-    seeds = np.zeros(binary.shape, 'i')
-    delta = max(3, int(scale/2))
-    for x in range(bmarked.shape[1]):
-        transitions = sorted([(y, 1) for y in find(bmarked[:, x])]+[(y, 0) for y in find(tmarked[:, x])])[::-1]
-        transitions += [(0, 0)]
-        for l in range(len(transitions)-1):
-            y0, s0 = transitions[l]
-            if s0 == 0:
-                continue
-            seeds[y0-delta:y0, x] = 1
-            y1, s1 = transitions[l+1]
-            if s1 == 0 and (y0-y1) < 5*scale:
-                seeds[y1:y0, x] = 1
+    seeds = kernels.line_seeds(bmarked, tmarked, scale)
     seeds = maximum_filter(seeds, (1, int(1+scale)))
     seeds = seeds*(1-colseps)
     seeds, _ = morph.label(seeds)
@@ -0,0 +1,54 @@
+"""Benchmark of the label algebra of lib/morph against the previous implementations in morph_reference.
+
+Run with: python -m ocr4all_helper_scripts.tests.benchmark_morph [--height H] [--width W] [--seeds N]
+
+The image is random noise, which has about as many connected components as a page full of speckle, and the labels are
+single seed pixels like the line seeds propagated by pseg. Both implementations are checked to return equal results.
+"""
+import time
+
+import click
+import numpy as np
+
+from ocr4all_helper_scripts.lib import morph, sl
+from ocr4all_helper_scripts.tests import morph_reference
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    """Returns the result and the best wall time in seconds of repeat calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+@click.command()
+@click.option("--height", type=int, default=6000, show_default=True, help="Height of the benchmark image.")
+@click.option("--width", type=int, default=4000, show_default=True, help="Width of the benchmark image.")
+@click.option("--seeds", type=int, default=3000, show_default=True, help="Number of labelled seed pixels.")
+@click.option("--repeat", type=int, default=3, show_default=True, help="Runs per function, the best is reported.")
+def benchmark_morph(height: int, width: int, seeds: int, repeat: int):
+    rng = np.random.default_rng(0)
+    image = rng.random((height, width)) < 0.3
+    labels = np.zeros((height, width), 'i')
+    labels[rng.integers(0, height, seeds), rng.integers(0, width, seeds)] = np.arange(1, seeds + 1)
+    rlabels, n = morph.label(image)
+    click.echo(f"{height}x{width} image with {n} components and {seeds} seeds")
+
+    cases = [
+        ("propagate_labels", (image, labels), {"conflict": 0}, {}),
+        ("correspondences", (rlabels, labels), {}, {}),
+        ("select_regions", (image, sl.dim0), {"min": 2}, {"vectorized": True}),
+    ]
+    for name, args, kwargs, options in cases:
+        expected, reference_seconds = timed(getattr(morph_reference, name), *args, repeat=repeat, **kwargs)
+        result, seconds = timed(getattr(morph, name), *args, repeat=repeat, **kwargs, **options)
+        if not np.array_equal(result, expected):
+            raise click.ClickException(f"{name} differs from the reference implementation")
+        click.echo(f"{name:>18}: {reference_seconds:7.3f} s -> {seconds:7.3f} s ({reference_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark_morph()
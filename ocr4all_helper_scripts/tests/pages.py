@@ -0,0 +1,49 @@
+"""Synthetic pages for the tests of the line segmentation and the skew estimation."""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from lxml import etree
+from PIL import Image, ImageDraw, ImageFont
+
+NAMESPACE = "http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"
+
+# (x0, y0, x1, y1) of the text regions r1 to r3
+REGIONS = [(10, 10, 390, 130), (10, 140, 390, 260), (10, 270, 390, 390)]
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def region_points(x0: int, y0: int, x1: int, y1: int) -> str:
+    return f"{x0},{y0} {x1},{y0} {x1},{y1} {x0},{y1}"
+
+
+def synthetic_page(rotation: float = 0.0, orientations: Optional[Dict[str, float]] = None,
+                   image_region: Optional[Tuple[int, int, int, int]] = None,
+                   seed: int = 0) -> Tuple[etree.Element, Image.Image]:
+    """Returns a PAGE XML document with three text regions and a noisy grayscale page image of 400x400 pixels with
+    four lines of random words in every region, rotated by rotation degrees.
+
+    :param orientations: Orientation attributes of the regions by id.
+    :param image_region: (x0, y0, x1, y1) of an ImageRegion added to the document.
+    """
+    rng = np.random.default_rng(seed)
+    font = ImageFont.load_default(size=18)
+    text = Image.new("L", (400, 400), 255)
+    draw = ImageDraw.Draw(text)
+    for x0, y0, x1, y1 in REGIONS:
+        for top in range(y0 + 8, y1 - 24, 28):
+            words = " ".join("".join(rng.choice(list(LETTERS), rng.integers(2, 9))) for _ in range(10))
+            draw.text((x0 + 8, top), words[:38], fill=0, font=font)
+    ink = np.asarray(text.rotate(rotation, fillcolor=255)) < 128
+    image = np.where(ink, rng.integers(20, 60, ink.shape), rng.integers(200, 240, ink.shape)).astype(np.uint8)
+
+    orientations = orientations or {}
+    regions = "".join(f'<TextRegion id="r{n + 1}" type="paragraph"'
+                      + (f' orientation="{orientations[f"r{n + 1}"]}"' if f"r{n + 1}" in orientations else "")
+                      + f'><Coords points="{region_points(*region)}"/></TextRegion>'
+                      for n, region in enumerate(REGIONS))
+    if image_region is not None:
+        regions += f'<ImageRegion id="i1"><Coords points="{region_points(*image_region)}"/></ImageRegion>'
+    root = etree.fromstring(f'<PcGts xmlns="{NAMESPACE}"><Page imageFilename="page.png" imageWidth="400" '
+                            f'imageHeight="400">{regions}</Page></PcGts>')
+    return root, Image.fromarray(image)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ocr4all_helper_scripts.utils import imageutils
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 7), (8, 8), (13, 17), (5, 64)])
+@pytest.mark.parametrize("dtype", [bool, np.uint8, np.int32])
+def test_packed_array_round_trip(shape, dtype):
+    array = (np.random.default_rng(0).random(shape) < 0.5).astype(dtype)
+
+    packed = imageutils.PackedBits.from_array(array)
+    unpacked = packed.unpack()
+
+    assert packed.nbytes == shape[0] * ((shape[1] + 7) // 8)
+    assert unpacked.dtype == array.dtype
+    np.testing.assert_array_equal(unpacked, array)
+
+
+@pytest.mark.parametrize("size", [(1, 1), (7, 3), (17, 13), (64, 5)])
+def test_packed_image_round_trip(size):
+    array = np.random.default_rng(1).random(size[::-1]) < 0.5
+    image = Image.fromarray(array)
+
+    unpacked = imageutils.PackedBits.from_image(image).unpack()
+
+    assert unpacked.mode == "1" and unpacked.size == size
+    np.testing.assert_array_equal(np.asarray(unpacked), array)
+
+
+def test_pack_bits_of_nested_values():
+    mask = np.eye(5, dtype=np.uint8)
+    image = Image.fromarray(np.eye(4, dtype=bool))
+    gray = Image.new("L", (3, 3), 7)
+    value = ((image, gray), [mask, mask], 1.5, None)
+
+    packed = imageutils.pack_bits(value)
+    unpacked = imageutils.unpack_bits(packed)
+
+    assert isinstance(packed[0][0], imageutils.PackedBits) and packed[0][1] is gray
+    assert packed[1][0] is packed[1][1]
+    assert isinstance(unpacked[1], list) and unpacked[1][0] is unpacked[1][1]
+    np.testing.assert_array_equal(unpacked[1][0], mask)
+    np.testing.assert_array_equal(np.asarray(unpacked[0][0]), np.eye(4, dtype=bool))
+    assert unpacked[0][1] is gray and unpacked[2:] == (1.5, None)
+
+
+def test_is_bilevel():
+    assert imageutils.is_bilevel(Image.new("1", (2, 2)))
+    two_colors = Image.fromarray(np.array([[0, 255], [255, 0]], np.uint8))
+    assert imageutils.is_bilevel(two_colors)
+    assert not imageutils.is_bilevel(Image.fromarray(np.array([[0, 128], [255, 0]], np.uint8)))
@@ -0,0 +1,92 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from ocr4all_helper_scripts.utils import iostages
+
+
+def test_prefetcher_keeps_order():
+    prefetcher = iostages.Prefetcher(lambda entry: entry * 2, depth=2, workers=1)
+    results = []
+    for entry, loading in prefetcher.feed(range(10)):
+        results.append((entry, loading.result()))
+        prefetcher.release()
+    prefetcher.close()
+
+    assert results == [(n, 2 * n) for n in range(10)]
+
+
+def test_prefetcher_limits_pages_ahead():
+    loaded = []
+    prefetcher = iostages.Prefetcher(loaded.append, depth=2, workers=1)
+    fed = []
+
+    def feed():
+        for entry, _ in prefetcher.feed(range(10)):
+            fed.append(entry)
+
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    # depth pages ahead of the single page in progress
+    assert fed == [0, 1, 2]
+    prefetcher.release()
+    time.sleep(0.1)
+    assert fed == [0, 1, 2, 3]
+    for _ in range(10):
+        prefetcher.release()
+    thread.join()
+    prefetcher.close()
+    assert loaded == list(range(10))
+
+
+def test_prefetcher_propagates_errors():
+    def load(entry):
+        if entry == 1:
+            raise OSError("unreadable")
+        return entry
+
+    prefetcher = iostages.Prefetcher(load, depth=1, workers=1)
+    loadings = []
+    for entry, loading in prefetcher.feed(range(3)):
+        loadings.append(loading)
+        prefetcher.release()
+    prefetcher.close()
+
+    assert loadings[0].result() == 0 and loadings[2].result() == 2
+    with pytest.raises(OSError, match="unreadable"):
+        loadings[1].result()
+
+
+def test_async_writer_writes_in_order(tmp_path):
+    writer = iostages.AsyncWriter(max_bytes=200)
+    written = []
+    path = Path(tmp_path, "out.txt")
+    for n in range(20):
+        writer.write(str(path), f"content {n}", on_write=lambda n=n: written.append(n))
+
+    assert writer.close() == []
+    assert path.read_text() == "content 19"
+    assert written == list(range(20))
+
+
+def test_async_writer_collects_errors(tmp_path):
+    writer = iostages.AsyncWriter(max_bytes=2 ** 20)
+    writer.write(str(Path(tmp_path, "a.txt")), "a", tag="page a")
+    writer.write(str(Path(tmp_path, "missing", "b.txt")), "b", tag="page b")
+    writer.write(str(Path(tmp_path, "c.txt")), "c")
+
+    errors = writer.close()
+
+    assert [(tag, type(error)) for tag, error in errors] == [("page b", FileNotFoundError)]
+    assert Path(tmp_path, "a.txt").read_text() == "a" and Path(tmp_path, "c.txt").read_text() == "c"
+
+
+def test_async_writer_accepts_content_larger_than_buffer(tmp_path):
+    writer = iostages.AsyncWriter(max_bytes=1)
+    writer.write(str(Path(tmp_path, "big.txt")), "x" * 1000)
+
+    assert writer.close() == []
+    assert Path(tmp_path, "big.txt").read_text() == "x" * 1000
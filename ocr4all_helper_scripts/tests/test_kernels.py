@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from ocr4all_helper_scripts.lib import kernels
+
+
+def random_mask(rng, shape, density):
+    return rng.random(shape) < density
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_smear_loops_equal_numpy(seed):
+    rng = np.random.default_rng(seed)
+    image = random_mask(rng, tuple(rng.integers(1, 40, 2)), rng.uniform(0.02, 0.3))
+    distance_x, distance_y = rng.integers(0, 12, 2)
+
+    expected = image.copy()
+    kernels._smear_numpy(expected, distance_x, distance_y)
+    smeared = image.copy()
+    kernels._smear_loops(smeared, distance_x, distance_y)
+
+    np.testing.assert_array_equal(smeared, expected)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_line_seeds_loops_equal_numpy(seed):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 60, 2))
+    bmarked = random_mask(rng, shape, rng.uniform(0.01, 0.2))
+    tmarked = random_mask(rng, shape, rng.uniform(0.01, 0.2))
+    # Small scales make seeds start above the top of the image, which wraps like the slice of the numpy kernel
+    scale = rng.uniform(0.5, 20)
+
+    np.testing.assert_array_equal(kernels._line_seeds_loops(bmarked, tmarked, scale),
+                                  kernels._line_seeds_numpy(bmarked, tmarked, scale))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_topsort_loops_equal_numpy(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 30))
+    order = random_mask(rng, (n, n), rng.uniform(0, 0.3))
+    if seed % 2:
+        # Partial orders as computed by pseg.reading_order have no cycles
+        order = np.triu(order, 1)[np.ix_(*[rng.permutation(n)] * 2)]
+
+    assert kernels._topsort_loops(order).tolist() == kernels._topsort_numpy(order)
+
+
+@pytest.mark.skipif(kernels.numba is None, reason="numba is not installed")
+def test_jit_equal_numpy():
+    rng = np.random.default_rng(0)
+    image = random_mask(rng, (50, 70), 0.1)
+    expected = image.copy()
+    kernels._smear_numpy(expected, 5, 7)
+    smeared = image.copy()
+    kernels._smear_jit(smeared, 5, 7)
+    np.testing.assert_array_equal(smeared, expected)
+
+    bmarked, tmarked = random_mask(rng, (50, 70), 0.05), random_mask(rng, (50, 70), 0.05)
+    np.testing.assert_array_equal(kernels._line_seeds_jit(bmarked, tmarked, 6.0),
+                                  kernels._line_seeds_numpy(bmarked, tmarked, 6.0))
+
+    order = np.triu(random_mask(rng, (25, 25), 0.2), 1)
+    assert kernels._topsort_jit(order).tolist() == kernels._topsort_numpy(order)
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        kernels.use("fortran")
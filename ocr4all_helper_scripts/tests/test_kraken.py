@@ -0,0 +1,114 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from ocr4all_helper_scripts.helpers import kraken_helper
+from ocr4all_helper_scripts.utils import pagexml
+
+NAMESPACE = "http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"
+
+
+class FakeKraken:
+    """Stands in for the kraken executable and writes a PAGE XML result for every input image, except for the image
+    names in skip."""
+
+    def __init__(self, monkeypatch, version="kraken, version 4.3.13"):
+        self.calls = []
+        self.skip = set()
+        self.version = version
+        monkeypatch.setattr(kraken_helper, "kraken_version", lambda: self.version)
+        monkeypatch.setattr(kraken_helper.subprocess, "run", self.run)
+
+    def run(self, command, **kwargs):
+        inputs = [(Path(command[n + 1]), Path(command[n + 2])) for n, arg in enumerate(command) if arg == "-i"]
+        self.calls.append([image.name for image, _ in inputs])
+        for image, xml in inputs:
+            if image.name not in self.skip:
+                # Coarse mtime granularity or clock skew may date the result before the run
+                xml.write_text(f'<PcGts xmlns="{NAMESPACE}"><Page imageFilename="{image}" version="{self.version}">'
+                               f'<TextRegion id="{image.stem}"/></Page></PcGts>')
+                os.utime(xml, (0, 0))
+
+
+def write_images(directory: Path, contents: dict) -> list:
+    images = []
+    for name, content in contents.items():
+        image = Path(directory, name)
+        image.write_bytes(content)
+        images.append(image)
+    return images
+
+
+@pytest.fixture
+def kraken(monkeypatch):
+    return FakeKraken(monkeypatch)
+
+
+def run(images, cache_dir):
+    kraken_helper.KrakenHelper(images, cache_dir=str(cache_dir)).run()
+
+
+def test_cache_miss_segments_and_stores(tmp_path, kraken):
+    images = write_images(tmp_path, {"a.png": b"a", "b.png": b"b"})
+
+    run(images, tmp_path / "cache")
+
+    assert kraken.calls == [["a.png", "b.png"]]
+    assert len(list((tmp_path / "cache").glob("*/*.xml"))) == 2
+    assert not list(tmp_path.glob("*.stale"))
+
+
+def test_cache_hit_restores_without_kraken(tmp_path, kraken):
+    images = write_images(tmp_path, {"a.png": b"a", "b.png": b"b"})
+    run(images, tmp_path / "cache")
+    for image in images:
+        kraken_helper.KrakenHelper.output(image).unlink()
+
+    # The same content under another name is a hit as well
+    images += write_images(tmp_path, {"c.png": b"a"})
+    run(images, tmp_path / "cache")
+
+    assert kraken.calls == [["a.png", "b.png"]]
+    for image in images:
+        page = pagexml.child(pagexml.parse(kraken_helper.KrakenHelper.output(image)), "Page")
+        assert page.get("imageFilename") == str(image)
+
+
+def test_cache_misses_on_changed_content_and_version(tmp_path, kraken):
+    images = write_images(tmp_path, {"a.png": b"a", "b.png": b"b"})
+    run(images, tmp_path / "cache")
+
+    write_images(tmp_path, {"b.png": b"changed"})
+    run(images, tmp_path / "cache")
+    kraken.version = "kraken, version 5.0"
+    run(images, tmp_path / "cache")
+
+    assert kraken.calls == [["a.png", "b.png"], ["b.png"], ["a.png", "b.png"]]
+
+
+def test_stale_outputs_are_not_cached(tmp_path, kraken):
+    images = write_images(tmp_path, {"a.png": b"a", "b.png": b"b"})
+    stale = kraken_helper.KrakenHelper.output(images[0])
+    stale.write_text("stale")
+    kraken.skip = {"a.png"}
+
+    run(images, tmp_path / "cache")
+
+    # The earlier output is kept, but only the result of b is cached
+    assert stale.read_text() == "stale"
+    assert len(list((tmp_path / "cache").glob("*/*.xml"))) == 1
+    kraken.skip = set()
+    run(images, tmp_path / "cache")
+    assert kraken.calls == [["a.png", "b.png"], ["a.png"]]
+    assert stale.read_text() != "stale"
+    assert not list(tmp_path.glob("*.stale"))
+
+
+def test_without_cache_dir(tmp_path, kraken):
+    images = write_images(tmp_path, {"a.png": b"a"})
+
+    kraken_helper.KrakenHelper(images).run()
+    kraken_helper.KrakenHelper(images).run()
+
+    assert kraken.calls == [["a.png"], ["a.png"]]
@@ -0,0 +1,105 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from ocr4all_helper_scripts.utils import logs
+
+logger = logging.getLogger("ocr4all_helper_scripts.tests")
+
+
+@pytest.fixture
+def configure():
+    """Configures the package logger like the commands do and restores it afterwards. The returned function stops the
+    listener, which writes all queued records."""
+    package = logging.getLogger(logs.PACKAGE_LOGGER)
+    state = package.handlers, package.level, package.propagate
+    listeners = []
+
+    def start(*args, **kwargs):
+        listeners.append(logs.configure(*args, **kwargs))
+        return lambda: listeners.pop().stop()
+
+    yield start
+    for listener in listeners:
+        listener.stop()
+    package.handlers, package.level, package.propagate = state
+
+
+def test_levels_and_streams(configure, capsys):
+    stop = configure("info")
+    logger.debug("hidden")
+    logger.info("progress")
+    logger.warning("degraded")
+    logger.error("failed")
+    stop()
+
+    out, err = capsys.readouterr()
+    assert out == "progress\n"
+    assert err == "WARNING: degraded\nERROR: failed\n"
+
+
+def test_quiet_level(configure, capsys):
+    stop = configure("warning")
+    logger.info("progress")
+    logger.warning("degraded")
+    stop()
+
+    assert capsys.readouterr() == ("", "WARNING: degraded\n")
+
+
+def test_arguments_are_only_formatted_when_logged(configure, capsys):
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted below the level")
+
+    stop = configure("info")
+    logger.debug("value %s", Expensive())
+    stop()
+
+    assert capsys.readouterr() == ("", "")
+
+
+def test_context_fields(configure, capsys):
+    stop = configure("debug")
+    with logs.context(page="p1"):
+        logger.info("page")
+        with logs.context(region="r1"):
+            logger.debug("region")
+            logger.info("other region", extra={"region": "r2"})
+    logger.info("outside")
+    stop()
+
+    assert capsys.readouterr().out.splitlines() == ["[p1] page", "[p1:r1] region", "[p1:r2] other region", "outside"]
+
+
+def test_context_is_per_thread(configure, capsys):
+    stop = configure("info")
+    with logs.context(page="p1"):
+        thread = threading.Thread(target=logger.info, args=("other thread",))
+        thread.start()
+        thread.join()
+    stop()
+
+    assert capsys.readouterr().out == "other thread\n"
+
+
+def test_json_output(configure, capsys):
+    stop = configure("info", json_output=True)
+    with logs.context(page="p1"):
+        logger.info("saved %s", "out.xml", extra={"output": "out.xml"})
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            logger.error("failed", exc_info=True)
+    stop()
+
+    out, err = capsys.readouterr()
+    saved = json.loads(out)
+    assert saved["level"] == "info" and saved["message"] == "saved out.xml"
+    assert saved["page"] == "p1" and saved["output"] == "out.xml"
+    assert saved["logger"] == "ocr4all_helper_scripts.tests" and "thread" in saved and "time" in saved
+    failed = json.loads(err)
+    assert failed["level"] == "error" and "ValueError: broken" in failed["message"]
+
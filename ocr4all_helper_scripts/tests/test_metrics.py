@@ -0,0 +1,57 @@
+import pytest
+
+from ocr4all_helper_scripts.utils import metrics
+
+
+def run_summary(command, shard, pages, workers=2):
+    """Returns the summary of a run processing pages given as (name, regions, lines, error) tuples."""
+    run = metrics.RunMetrics(command, workers, shard)
+    for name, regions, lines, error in pages:
+        try:
+            with run.page(name):
+                metrics.count("regions", regions)
+                metrics.count("lines", lines)
+                metrics.cache_lookup("stages", regions > 1)
+                if error:
+                    raise RuntimeError(error)
+        except RuntimeError:
+            pass
+    with run.phase("load"):
+        pass
+    run.finish()
+    return run.summary()
+
+
+def test_merge():
+    first = run_summary("pagelineseg", "1/2", [("a", 2, 10, None), ("b", 1, 3, "broken")])
+    second = run_summary("pagelineseg", "2/2", [("c", 3, 7, None)], workers=3)
+
+    merged = metrics.merge([first, second])
+
+    assert merged["command"] == "pagelineseg"
+    assert merged["workers"] == 5
+    assert merged["wall_seconds"] == max(first["wall_seconds"], second["wall_seconds"])
+    assert (merged["pages"], merged["regions"], merged["lines"]) == (3, 6, 20)
+    assert merged["failed_pages"] == 1
+    assert merged["failures"] == [{"page": "b", "error": "RuntimeError: broken"}]
+    assert merged["caches"]["stages"]["hits"] == 2 and merged["caches"]["stages"]["misses"] == 1
+    assert merged["phases_seconds"]["load"] == pytest.approx(first["phases_seconds"]["load"] +
+                                                             second["phases_seconds"]["load"])
+    assert [shard["shard"] for shard in merged["shards"]] == ["1/2", "2/2"]
+    assert sorted(page["page"] for page in merged["slowest_pages"]) == ["a", "b", "c"]
+    assert sorted(merged["page_seconds"]) == sorted(first["page_seconds"] + second["page_seconds"])
+
+
+def test_merge_of_single_summary_is_unchanged():
+    summary = run_summary("skewestimate", None, [("a", 1, 0, None)])
+
+    assert metrics.merge([summary]) == summary
+
+
+def test_write_summary(tmp_path):
+    summary = run_summary("pagelineseg", None, [("a", 2, 10, None)])
+
+    metrics.write_summary(summary, str(tmp_path / "run.prom"))
+
+    text = (tmp_path / "run.prom").read_text()
+    assert 'ocr4all_lines_processed{command="pagelineseg"} 10' in text
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from ocr4all_helper_scripts.lib import morph, sl
+from ocr4all_helper_scripts.tests import morph_reference
+
+
+def random_seeds(rng, shape, count, grid=1):
+    labels = np.zeros(shape, 'i')
+    ys = rng.integers(0, shape[0] // grid, count) * grid
+    xs = rng.integers(0, shape[1] // grid, count) * grid
+    labels[ys, xs] = rng.integers(1, 9, count)
+    return labels
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("grid", [1, 4])
+def test_spread_labels_equal_untiled(seed, grid):
+    # Seeds on a grid leave many pixels at equal distance from two labels
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(grid, 120, 2))
+    labels = random_seeds(rng, shape, int(rng.integers(1, 30)), grid)
+    maxdist = rng.choice([1, 2.5, 3, 7, 11.2])
+
+    # The smallest tiles (4 * maxdist) put tile borders all over the image
+    np.testing.assert_array_equal(morph.spread_labels(labels, maxdist, tile_size=1),
+                                  morph_reference.spread_labels(labels.copy(), maxdist))
+
+
+def test_spread_labels_tie_across_tile_border():
+    # Both labels are 5 px from the pixels of column 24, the border between the first two tiles
+    labels = np.zeros((30, 60), 'i')
+    labels[10, 19] = 1
+    labels[10, 29] = 2
+    labels[20, 24] = 3
+
+    spread = morph.spread_labels(labels, 6, tile_size=1)
+
+    np.testing.assert_array_equal(spread, morph_reference.spread_labels(labels.copy(), 6))
+    assert spread[10, 23] == 1 and spread[10, 25] == 2
+
+
+def test_spread_labels_skips_empty_tiles():
+    labels = np.zeros((200, 200), 'i')
+    labels[5, 5] = 4
+
+    spread = morph.spread_labels(labels, 3, tile_size=1)
+
+    np.testing.assert_array_equal(spread, morph_reference.spread_labels(labels.copy(), 3))
+    assert not spread[20:].any()
+
+
+def random_image(rng, shape, density):
+    return rng.random(shape) < density
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("f", [sl.dim0, sl.dim1])
+def test_select_regions_equal_reference(seed, f):
+    rng = np.random.default_rng(seed)
+    image = random_image(rng, tuple(rng.integers(1, 80, 2)), rng.uniform(0.05, 0.6))
+    threshold, nbest = rng.integers(0, 4), rng.integers(0, 20)
+
+    expected = morph_reference.select_regions(image, f, min=threshold, nbest=nbest)
+    np.testing.assert_array_equal(morph.select_regions(image, f, min=threshold, nbest=nbest), expected)
+    np.testing.assert_array_equal(morph.select_regions(image, f, min=threshold, nbest=nbest, vectorized=True),
+                                  expected)
+
+
+def test_select_regions_calls_f_per_region():
+    image = np.zeros((10, 10), bool)
+    image[1:3, 1:5] = True
+    image[5:9, 7] = True
+    calls = []
+
+    def area(s):
+        calls.append(s)
+        return sl.area(s)
+
+    selected = morph.select_regions(image, area, min=4)
+
+    np.testing.assert_array_equal(selected[1:3, 1:5], 1)
+    assert selected.sum() == 8
+    assert calls == morph.find_objects(morph.label(image)[0])
+
+
+def test_bounds_equal_find_objects():
+    rng = np.random.default_rng(0)
+    labels, n = morph.label(random_image(rng, (60, 70), 0.4))
+    rows, columns = morph.bounds(labels)
+
+    objects = morph.find_objects(labels)
+    assert len(objects) == n == len(rows.start)
+    assert [(o[0].start, o[0].stop, o[1].start, o[1].stop) for o in objects] == \
+        list(zip(rows.start, rows.stop, columns.start, columns.stop))
+
+
+@pytest.mark.parametrize("dtype", [bool, "uint8", "int16", "int64", "float32"])
+def test_label_and_find_objects_equal_reference(dtype):
+    rng = np.random.default_rng(0)
+    image = random_image(rng, (50, 40), 0.4).astype(dtype)
+
+    labels, n = morph.label(image)
+    expected_labels, expected_n = morph_reference.label(image)
+    assert n == expected_n
+    np.testing.assert_array_equal(labels, expected_labels)
+    assert morph.find_objects(labels.astype(dtype)) == morph_reference.find_objects(labels.astype(dtype))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_correspondences_equal_reference(seed):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 80, 2))
+    labels1 = morph.label(random_image(rng, shape, 0.5))[0]
+    labels2 = random_seeds(rng, shape, int(rng.integers(1, 200)))
+
+    np.testing.assert_array_equal(morph.correspondences(labels1, labels2),
+                                  morph_reference.correspondences(labels1, labels2))
+
+
+def test_correspondences_of_many_labels():
+    rng = np.random.default_rng(0)
+    labels1 = rng.integers(0, 100000, 5000).astype('i')
+    labels2 = rng.integers(0, 50, 5000).astype('i')
+
+    np.testing.assert_array_equal(morph.correspondences(labels1, labels2),
+                                  morph_reference.correspondences(labels1, labels2))
+
+
+def test_correspondences_of_many_equal_pairs():
+    labels1 = np.zeros(1000, 'i')
+    labels2 = np.ones(1000, 'i')
+
+    np.testing.assert_array_equal(morph.correspondences(labels1, labels2), [[0], [1]])
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("conflict", [0, -1])
+def test_propagate_labels_equal_reference(seed, conflict):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 80, 2))
+    image = random_image(rng, shape, rng.uniform(0.1, 0.7))
+    labels = random_seeds(rng, shape, int(rng.integers(0, 100)))
+
+    np.testing.assert_array_equal(morph.propagate_labels(image, labels, conflict),
+                                  morph_reference.propagate_labels(image, labels, conflict))
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+from PIL import Image
+
+from ocr4all_helper_scripts.helpers import pagedir2pagexml_helper
+from ocr4all_helper_scripts.utils import pagexml
+from ocr4all_helper_scripts.utils.fileutils import index_directory
+
+PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<PcGts xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2017-07-15">
+  <Metadata><Creator/><Created/><LastChange/></Metadata>
+  <Page imageFilename="page.png" imageWidth="100" imageHeight="100">
+    <TextRegion id="r1" type="paragraph"><Coords points="10,10 50,10 50,30 10,30"/></TextRegion>
+    <TextRegion id="r2" type="paragraph"><Coords points=""/></TextRegion>
+  </Page>
+</PcGts>
+"""
+
+
+def write_project(directory: Path) -> Path:
+    """Writes a page with a legacy page directory holding one region segment with one line."""
+    xmlfile = Path(directory, "page.xml")
+    xmlfile.write_text(PAGE)
+    page_dir = Path(directory, "page")
+    Path(page_dir, "0001__000__paragraph").mkdir(parents=True)
+    Image.new("1", (40, 20)).save(Path(page_dir, "0001__000__paragraph.png"))
+    Path(page_dir, "0001__000__paragraph.offset").write_text("10,10")
+    # y1,x1,y2,x2 relative to the segment
+    Path(page_dir, "0001__000__paragraph", "01.coords").write_text("2,0,12,40")
+    Path(page_dir, "0001__000__paragraph", "01.pred.txt").write_text("text\n")
+    return xmlfile
+
+
+def test_find_region_segment(tmp_path):
+    write_project(tmp_path)
+    index = index_directory(Path(tmp_path, "page"))
+
+    segment = pagedir2pagexml_helper.find_region_segment("paragraph", [(10, 10), (50, 30)], index)
+
+    assert segment["offset"] == (10, 10) and segment["size"] == (40, 20)
+    assert pagedir2pagexml_helper.find_region_segment("paragraph", [(10, 10), (51, 30)], index) == {}
+    assert pagedir2pagexml_helper.find_region_segment("heading", [(10, 10)], index) == {}
+
+
+def test_find_region_segment_without_coords(tmp_path):
+    write_project(tmp_path)
+    index = index_directory(Path(tmp_path, "page"))
+
+    assert pagedir2pagexml_helper.find_region_segment("paragraph", [], index) == {}
+
+
+def test_loopfiles_creates_output_directory(tmp_path):
+    xmlfile = write_project(tmp_path)
+    output = Path(tmp_path, "out", "nested")
+
+    pagedir2pagexml_helper.loopfiles(1, 0, [str(xmlfile)], str(output))
+
+    root = pagexml.parse(Path(output, "page.xml"))
+    lines = list(pagexml.iter_lines(root))
+    assert [line.get("id") for line in lines] == ["r1_001"]
+    assert pagexml.child(lines[0], "Coords").get("points") == "10,12 50,12 50,22 10,22"
+    assert pagexml.text_equivs(lines[0], 1)[0][0].text == "text"
+    # the region without coordinates is left as it is
+    assert not list(pagexml.children(pagexml.xpath("//p:TextRegion[@id='r2']", root)(root)[0], "TextLine"))
@@ -0,0 +1,189 @@
+import click
+import numpy as np
+import pytest
+from lxml import etree
+from PIL import Image
+from skimage.draw import polygon2mask
+
+from ocr4all_helper_scripts.cli.pagelineseg import WORKING_SCALE
+from ocr4all_helper_scripts.helpers import pagelineseg_helper, skewestimate_helper
+from ocr4all_helper_scripts.lib import nlbin
+from ocr4all_helper_scripts.tests.pages import synthetic_page
+from ocr4all_helper_scripts.utils import imageutils, pagexml
+
+
+@pytest.mark.parametrize("value, expected", [("auto", "auto"), ("1", 1.0), ("0.25", 0.25), (0.5, 0.5)])
+def test_working_scale_accepts_auto_and_fractions(value, expected):
+    assert WORKING_SCALE.convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["foo", "", None, "0", "-0.5", "1.5"])
+def test_working_scale_rejects_invalid_values(value):
+    with pytest.raises(click.BadParameter):
+        WORKING_SCALE.convert(value, None, None)
+
+
+@pytest.mark.parametrize("working_scale, factor", [(1, 1), (0.5, 2), (0.25, 4), (0.3, 3)])
+def test_working_factor(working_scale, factor):
+    assert pagelineseg_helper.working_factor(np.zeros((10, 10)), working_scale=working_scale) == factor
+
+
+@pytest.mark.parametrize("working_scale", [0, -1, 2])
+def test_working_factor_rejects_invalid_scales(working_scale):
+    with pytest.raises(ValueError):
+        pagelineseg_helper.working_factor(np.zeros((10, 10)), working_scale=working_scale)
+
+
+def test_expired_page_deadline_skips_region_work(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("called after the page deadline expired")
+
+    monkeypatch.setattr(nlbin, "adaptive_binarize", fail)
+    monkeypatch.setattr(skewestimate_helper, "estimate_orientation", fail)
+    monkeypatch.setattr(pagelineseg_helper, "segment", fail)
+    root, image = synthetic_page(orientations={"r2": 1.5})
+
+    segmented = pagelineseg_helper.segment_tree(root, image, page_timeout=1e-9, skewestimate=True)
+
+    regions = list(pagexml.iter_regions(segmented))
+    assert [len(list(pagexml.children(region, "TextLine"))) for region in regions] == [1, 1, 1]
+    assert [region.get("custom") for region in regions] == ["lineseg {fallback:region;reason:page-timeout;}"] * 3
+    assert [region.get("orientation") for region in regions] == [None, "1.5", None]
+    assert pagexml.coords_points(pagexml.child(regions[0], "TextLine")) == [[10, 10], [390, 10], [390, 130], [10, 130]]
+
+
+def test_expired_page_deadline_still_extracts_line_images(monkeypatch):
+    monkeypatch.setattr(nlbin, "adaptive_binarize", None)
+    root, image = synthetic_page(orientations={"r2": 1.5})
+    line_images = {}
+
+    pagelineseg_helper.segment_tree(root, image, page_timeout=1e-9, line_images=line_images)
+
+    assert sorted(line_images) == ["r1_l001", "r2_l002", "r3_l003"]
+    assert line_images["r2_l002"].orientation == 1.5
+    assert line_images["r1_l001"].binary.size[0] > 350
+
+
+def line_mask(rng, shape, baseline, gap=0.3):
+    """Returns a mask of letter-like blobs with gaps in between along baseline(x), with random ascenders and
+    descenders."""
+    mask = np.zeros(shape, bool)
+    x = int(rng.integers(0, 10))
+    while x < shape[1] - 12:
+        width = int(rng.integers(2, 12))
+        y = int(baseline(x))
+        mask[max(0, y - int(rng.integers(4, 15))):y + int(rng.integers(0, 6)), x:x + width] = True
+        x += width + (int(rng.integers(1, 15)) if rng.random() < gap else 0)
+    return mask
+
+
+def covered_pixels(polygon, shape):
+    # Polygon points are pixel corners, so a pixel is covered if its center lies inside
+    rows = [y - 0.5 for x, y in polygon]
+    cols = [x - 0.5 for x, y in polygon]
+    return polygon2mask(shape, np.stack([rows, cols], axis=1))
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("baseline", [lambda x: 40,
+                                      lambda x: 20 + 0.15 * x,
+                                      lambda x: 40 + 15 * np.sin(x / 30)],
+                         ids=["straight", "skewed", "curved"])
+@pytest.mark.parametrize("smear_strength", [(1.0, 2.0), (3.0, 2.0), (0.1, 2.0)])
+def test_envelope_polygon_covers_line(seed, baseline, smear_strength):
+    mask = line_mask(np.random.default_rng(seed), (80, 300), baseline)
+
+    polygon = pagelineseg_helper.approximate_envelope_polygon(mask, smear_strength)
+
+    assert polygon[0] == polygon[-1]
+    assert not (mask & ~covered_pixels(polygon, mask.shape)).any()
+
+
+def test_envelope_polygon_of_single_pixel_and_empty_mask():
+    mask = np.zeros((5, 5), bool)
+    assert pagelineseg_helper.approximate_envelope_polygon(mask) == []
+
+    mask[2, 3] = True
+    polygon = pagelineseg_helper.approximate_envelope_polygon(mask)
+    np.testing.assert_array_equal(covered_pixels(polygon, mask.shape), mask)
+
+
+def test_segment_tree_equals_file_based_helper(tmp_path):
+    root, image = synthetic_page()
+    etree.ElementTree(root).write(str(tmp_path / "page.xml"))
+    image.save(tmp_path / "page.png")
+
+    expected = pagelineseg_helper.pagelineseg(str(tmp_path / "page.xml"), str(tmp_path / "page.png"))
+
+    assert pagelineseg_helper.serialize_page(pagelineseg_helper.segment_tree(root, image)) == expected
+    assert pagelineseg_helper.serialize_page(pagelineseg_helper.segment_tree(root, np.asarray(image))) == expected
+
+
+def test_segment_tree_copies_document():
+    root, image = synthetic_page()
+    document = etree.tostring(root)
+
+    segmented = pagelineseg_helper.segment_tree(root, image)
+
+    assert segmented is not root and etree.tostring(root) == document
+    assert len(list(pagexml.iter_lines(segmented))) == 12
+    assert pagelineseg_helper.segment_tree(root, image, copy=False) is root
+    assert etree.tostring(root) == etree.tostring(segmented)
+
+
+def test_segment_tree_keeps_image_when_removing_image_regions():
+    root, image = synthetic_page(image_region=(0, 0, 400, 135))
+    pixels = image.tobytes()
+
+    segmented = pagelineseg_helper.segment_tree(root, image, remove_images=True)
+
+    assert image.tobytes() == pixels
+    assert [len(list(pagexml.children(region, "TextLine"))) for region in pagexml.iter_regions(segmented)] == [0, 4, 4]
+
+
+def test_segment_lines():
+    root, image = synthetic_page(orientations={"r2": 0.5})
+    document = etree.tostring(root)
+
+    lines = pagelineseg_helper.segment_lines(root, image)
+
+    assert etree.tostring(root) == document
+    segmented = pagelineseg_helper.segment_tree(root, image)
+    assert [line.id for line in lines] == [line.get("id") for line in pagexml.iter_lines(segmented)]
+    assert [line.points for line in lines] == \
+        [[tuple(point) for point in pagexml.coords_points(line)] for line in pagexml.iter_lines(segmented)]
+    assert {line.region: line.orientation for line in lines} == {"r1": None, "r2": 0.5, "r3": None}
+
+
+def test_cached_stage_is_bit_packed():
+    def compute():
+        calls.append(1)
+        return np.eye(9, dtype=np.uint8), Image.fromarray(np.eye(3, dtype=bool)), 2.5
+
+    calls = []
+    cache = {}
+    mask, image, value = pagelineseg_helper.cached(cache, ("stage",), compute, packed=True)
+    hit = pagelineseg_helper.cached(cache, ("stage",), compute, packed=True)
+
+    assert len(calls) == 1
+    assert isinstance(cache[("stage",)][0], imageutils.PackedBits)
+    assert isinstance(cache[("stage",)][1], imageutils.PackedBits)
+    # Hits are new copies, so changing them doesn't change the cache
+    hit[0][0, 0] = 0
+    np.testing.assert_array_equal(pagelineseg_helper.cached(cache, ("stage",), compute, packed=True)[0], mask)
+    np.testing.assert_array_equal(np.asarray(hit[1]), np.asarray(image))
+    assert hit[2] == value
+
+
+@pytest.mark.parametrize("options", [{}, {"shared_preprocessing": True},
+                                     {"remove_images": True, "skewestimate": True}])
+def test_segment_tree_with_stage_cache_equals_uncached(options):
+    root, image = synthetic_page(image_region=(300, 300, 400, 400))
+    expected = pagelineseg_helper.serialize_page(pagelineseg_helper.segment_tree(root, image, **options))
+    cache = {}
+
+    for _ in range(2):
+        segmented = pagelineseg_helper.segment_tree(root, image, cache=cache, **options)
+        assert pagelineseg_helper.serialize_page(segmented) == expected
+    assert any(isinstance(value, imageutils.PackedBits) for entry in cache.values()
+               for value in (entry if isinstance(entry, tuple) else (entry,)))
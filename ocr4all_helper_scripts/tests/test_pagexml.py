@@ -0,0 +1,79 @@
+from copy import deepcopy
+
+import pytest
+from lxml import etree
+
+from ocr4all_helper_scripts.utils import pagexml
+
+NAMESPACE = "http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"
+
+DOCUMENT = """<PcGts{xmlns}>
+  <Page imageFilename="page.png">
+    <TextRegion id="r1">
+      <Coords points="1,2 3,4 5,6"/>
+      <TextLine id="r1_l1">
+        <Coords><Point x="7" y="8"/><Point x="9" y="10"/></Coords>
+        <TextEquiv index="0"><Unicode>ground truth</Unicode></TextEquiv>
+        <TextEquiv index="1"><Unicode>ocr</Unicode></TextEquiv>
+      </TextLine>
+    </TextRegion>
+    <ImageRegion id="i1"><Coords points="0,0 1,1"/></ImageRegion>
+    <TextRegion id="r2"><TextEquiv><Unicode/></TextEquiv></TextRegion>
+  </Page>
+</PcGts>
+"""
+
+
+@pytest.fixture(params=[NAMESPACE, None], ids=["namespaced", "namespace-less"])
+def root(request, tmp_path):
+    path = tmp_path / "page.xml"
+    path.write_text(DOCUMENT.format(xmlns=f' xmlns="{request.param}"' if request.param else ""))
+    return pagexml.parse(path)
+
+
+def test_namespace_and_tag(root):
+    ns = pagexml.namespace(root)
+    assert pagexml.tag(root, "TextLine") == (f"{{{ns}}}TextLine" if ns else "TextLine")
+
+
+def test_iter_regions_and_lines(root):
+    assert [region.get("id") for region in pagexml.iter_regions(root)] == ["r1", "r2"]
+    assert [region.get("id") for region in pagexml.iter_regions(root, "ImageRegion")] == ["i1"]
+    assert [line.get("id") for line in pagexml.iter_lines(root)] == ["r1_l1"]
+
+
+def test_iter_lines_includes_lines_added_without_namespace(root):
+    region = next(pagexml.iter_regions(root))
+    etree.SubElement(region, "TextLine", attrib={"id": "r1_l2"})
+
+    assert [line.get("id") for line in pagexml.iter_lines(root)] == ["r1_l1", "r1_l2"]
+
+
+def test_xpath(root):
+    lines = pagexml.xpath("//p:TextRegion[@id=$id]/p:TextLine", root)(root, id="r1")
+    assert [line.get("id") for line in lines] == ["r1_l1"]
+
+
+def test_children_and_text(root):
+    line = next(pagexml.iter_lines(root))
+    assert pagexml.child(line, "Missing") is None
+    assert [pagexml.unicode_text(equiv) for equiv in pagexml.text_equivs(line)] == ["ground truth", "ocr"]
+    assert [pagexml.unicode_text(equiv) for equiv in pagexml.text_equivs(line, 1)] == ["ocr"]
+    empty = pagexml.text_equivs(list(pagexml.iter_regions(root))[1])[0]
+    assert pagexml.unicode_text(empty) == ""
+
+
+def test_coords_points(root):
+    region = next(pagexml.iter_regions(root))
+    assert pagexml.coords_points(region) == [[1, 2], [3, 4], [5, 6]]
+    # older Point notation
+    assert pagexml.coords_points(next(pagexml.iter_lines(root))) == [[7, 8], [9, 10]]
+
+
+def test_as_root(root):
+    line = next(pagexml.iter_lines(root))
+    assert pagexml.as_root(line) is root
+    assert pagexml.as_root(root.getroottree()) is root
+
+    copy = pagexml.as_root(line, copy=True)
+    assert copy is not root and etree.tostring(copy) == etree.tostring(deepcopy(root))
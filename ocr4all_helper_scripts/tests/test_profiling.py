@@ -0,0 +1,89 @@
+import pstats
+import threading
+import time
+
+import numpy as np
+
+from ocr4all_helper_scripts.lib import kernels
+from ocr4all_helper_scripts.utils import profiling
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def smear(seconds):
+    # Python loops of the lib modules show up in the report of the hottest functions
+    binary = np.random.default_rng(0).random((60, 60)) < 0.1
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        kernels._smear_loops(binary, 4.0, 2.0)
+
+
+def profile(*workers):
+    """Profiles threads running the given functions, only while they are inside a page."""
+    profiler = profiling.RunProfiler(interval=0.002)
+
+    def work(function):
+        busy(0.1)
+        with profiling.page(profiler):
+            function()
+        busy(0.1)
+
+    threads = [threading.Thread(target=work, args=(function,)) for function in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.finish()
+    return profiler
+
+
+def sampled_functions(profiler):
+    return {key[2] for stack in profiler.samples for key in stack}
+
+
+def test_samples_only_pages():
+    profiler = profile(lambda: busy(0.2), lambda: busy(0.2))
+
+    assert len(profiler.workers) == 2
+    assert "<lambda>" in sampled_functions(profiler)
+    # busy outside of the page contexts is called from work, inside from the lambdas
+    assert all(stack[-2][2] == "<lambda>" for stack in profiler.samples)
+    assert 0.1 < sum(profiler.seconds.values()) < 1.0
+
+
+def test_page_without_profiler():
+    with profiling.page(None):
+        pass
+
+
+def test_stats():
+    profiler = profile(lambda: smear(0.2))
+
+    stats = profiler.stats()
+
+    smear_key = next(key for key in stats if key[2] == "smear")
+    loops_key = next(key for key in stats if key[2] == "_smear_loops")
+    calls, _, own, total, callers = stats[smear_key]
+    assert calls == sum(profiler.samples.values()) and own <= total
+    assert smear_key in stats[loops_key][4]
+    assert stats[loops_key][3] <= total
+
+
+def test_write(tmp_path):
+    profiler = profile(lambda: smear(0.2))
+
+    report = profiler.write(str(tmp_path))
+
+    stats = pstats.Stats(str(tmp_path / "profile.pstats"))
+    assert any(name == "_smear_loops" for _, _, name in stats.stats)
+    collapsed = (tmp_path / "profile.collapsed").read_text().splitlines()
+    assert collapsed and all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
+    assert any("_smear_loops (ocr4all_helper_scripts/lib/kernels.py:" in line for line in collapsed)
+    assert (tmp_path / "top.txt").read_text().splitlines() == report
+    assert report[0].startswith("Hottest functions of lib and helpers")
+    # Only functions of lib and helpers are reported
+    assert "_smear_loops" in report[2] and all("test_profiling" not in line for line in report)
@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+import click
+import pytest
+
+from ocr4all_helper_scripts.utils import runner
+
+
+def write_dataset(directory: Path, pages: int) -> str:
+    dataset = [[f"page{n}.png", f"page{n}.xml", str(Path(directory, f"out{n}.xml"))] for n in range(pages)]
+    path = Path(directory, "dataset.json")
+    path.write_text(json.dumps(dataset))
+    return str(path)
+
+
+def test_parse_entry():
+    assert runner.parse_entry(["a.png", "a.xml", "b.xml"]) == ("a.png", "a.xml", "b.xml")
+    assert runner.parse_entry(["a.png", "a.xml"]) == ("a.png", "a.xml", "a.xml")
+    with pytest.raises(ValueError):
+        runner.parse_entry(["a.png"])
+
+
+@pytest.mark.parametrize("prefetch, write_buffer", [(0, 0), (2, 0), (0, 1), (2, 1)])
+def test_run_dataset_writes_all_outputs(tmp_path, prefetch, write_buffer):
+    dataset = write_dataset(tmp_path, 5)
+
+    def process(image, pagexml, path_out, page):
+        yield path_out, f"{image} {pagexml} {page}"
+
+    runner.run_dataset(dataset, 3, process, lambda image, pagexml: "loaded", prefetch=prefetch,
+                       write_buffer=write_buffer)
+
+    loaded = "loaded" if prefetch else "None"
+    for n in range(5):
+        assert Path(tmp_path, f"out{n}.xml").read_text() == f"page{n}.png page{n}.xml {loaded}"
+
+
+def test_run_dataset_reports_failed_pages(tmp_path):
+    dataset = write_dataset(tmp_path, 4)
+
+    def process(image, pagexml, path_out, page):
+        if image == "page2.png":
+            raise RuntimeError("broken page")
+        yield path_out, image
+
+    with pytest.raises(click.ClickException, match="1 of 4 pages failed: page2.png"):
+        runner.run_dataset(dataset, 2, process)
+    assert sorted(path.name for path in tmp_path.glob("out*.xml")) == ["out0.xml", "out1.xml", "out3.xml"]
+
+
+@pytest.mark.parametrize("write_buffer", [0, 1])
+def test_run_dataset_logs_tracebacks(tmp_path, caplog, write_buffer):
+    dataset = write_dataset(tmp_path, 2)
+
+    def process(image, pagexml, path_out, page):
+        if image == "page0.png":
+            raise RuntimeError("broken page")
+        yield str(Path(tmp_path, "missing", "out.xml")), image
+
+    with pytest.raises(click.ClickException, match="2 of 2 pages failed"):
+        runner.run_dataset(dataset, 1, process, write_buffer=write_buffer)
+
+    errors = [record for record in caplog.records if record.levelname == "ERROR"]
+    assert [record.exc_info[0] for record in errors] == [RuntimeError, FileNotFoundError]
+    assert "in process" in caplog.text and "Traceback" in caplog.text
@@ -0,0 +1,167 @@
+import threading
+from pathlib import Path
+
+import click
+import pytest
+from PIL import Image
+
+from ocr4all_helper_scripts.utils import scheduling
+
+
+def write_pages(directory: Path, sizes, regions) -> list:
+    """Writes a page (image and PAGE XML) per size and region count and returns their dataset entries."""
+    dataset = []
+    for n, (size, count) in enumerate(zip(sizes, regions)):
+        image = Path(directory, f"{n}.png")
+        Image.new("L", size).save(image)
+        pagexml = Path(directory, f"{n}.xml")
+        pagexml.write_text('<PcGts xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"><Page>'
+                           + '<TextRegion id="r"/>' * count + '</Page></PcGts>')
+        dataset.append([str(image), str(pagexml)])
+    return dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    sizes = [(10 + 7 * n % 40, 10 + 13 * n % 30) for n in range(17)]
+    regions = [n % 4 for n in range(17)]
+    return write_pages(tmp_path, sizes, regions)
+
+
+def test_estimate_cost(tmp_path):
+    (image, pagexml), = write_pages(tmp_path, [(20, 30)], [3])
+
+    assert scheduling.estimate_cost(image, pagexml) == 20 * 30 * 3
+    assert scheduling.estimate_cost(str(Path(tmp_path, "missing.png")), pagexml) == 0
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 20])
+def test_shards_partition_dataset(dataset, count):
+    shards = [scheduling.shard_dataset(dataset, index, count) for index in range(1, count + 1)]
+
+    assert sorted(entry for shard in shards for entry in shard) == sorted(dataset)
+    # Entries keep their dataset order within a shard
+    for shard in shards:
+        assert shard == [entry for entry in dataset if entry in shard]
+
+
+def test_shards_are_deterministic(dataset):
+    assert [scheduling.shard_dataset(dataset, index, 3) for index in (1, 2, 3)] == \
+        [scheduling.shard_dataset(list(dataset), index, 3) for index in (1, 2, 3)]
+
+
+def test_shards_are_balanced(dataset):
+    costs = dict(zip(map(tuple, dataset), scheduling.estimate_costs(dataset)))
+    loads = [sum(costs[tuple(entry)] for entry in scheduling.shard_dataset(dataset, index, 3)) for index in (1, 2, 3)]
+
+    # Greedy assignment keeps the difference of the shards below the cost of the largest page
+    assert max(loads) - min(loads) <= max(costs.values())
+
+
+def test_select_shard(dataset):
+    assert scheduling.select_shard(dataset, None) == dataset
+    assert scheduling.select_shard(dataset, (2, 4)) == scheduling.shard_dataset(dataset, 2, 4)
+
+
+def test_order_dataset(dataset):
+    costs = scheduling.estimate_costs(dataset)
+    ordered = scheduling.order_dataset(dataset, "largest-first")
+
+    assert scheduling.order_dataset(dataset) == dataset
+    assert sorted(ordered) == sorted(dataset)
+    assert scheduling.estimate_costs(ordered) == sorted(costs, reverse=True)
+
+
+@pytest.mark.parametrize("value, expected", [(None, None), ("1/1", (1, 1)), ("2/4", (2, 4))])
+def test_parse_shard(value, expected):
+    assert scheduling.parse_shard(None, None, value) == expected
+
+
+@pytest.mark.parametrize("value", ["2", "a/b", "0/3", "4/3", "1/2/3"])
+def test_parse_shard_rejects_invalid_values(value):
+    with pytest.raises(click.BadParameter):
+        scheduling.parse_shard(None, None, value)
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    """Stubs the resident set size of the process and the footprints of pages by their image name."""
+    state = {"rss": 100, "footprints": {}}
+    monkeypatch.setattr(scheduling, "resident_memory", lambda: state["rss"])
+    monkeypatch.setattr(scheduling, "estimate_footprint",
+                        lambda image, bytes_per_pixel: state["footprints"][image] * bytes_per_pixel)
+    return state
+
+
+def start(gate, image, admitted, release):
+    """Starts a thread entering the gate with the page of image, which stays admitted until release is set."""
+    def work():
+        with gate.admit(image):
+            admitted.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_memory_gate_admits_oversized_page_into_empty_gate(memory):
+    memory["footprints"] = {"huge": 10000}
+    gate = scheduling.MemoryGate(1000, 1)
+
+    with gate.admit("huge"):
+        assert (gate.running, gate.reserved) == (1, 10000)
+    assert (gate.running, gate.reserved) == (0, 0)
+
+
+def test_memory_gate_admits_pages_fitting_the_budget(memory):
+    memory["footprints"] = {"a": 300, "b": 300}
+    gate = scheduling.MemoryGate(1000, 1)
+
+    with gate.admit("a"), gate.admit("b"):
+        assert (gate.running, gate.reserved) == (2, 600)
+
+
+def test_memory_gate_blocks_until_release(memory):
+    memory["footprints"] = {"a": 600, "b": 600}
+    gate = scheduling.MemoryGate(1000, 1, poll_interval=0.01)
+    first, second, release = threading.Event(), threading.Event(), threading.Event()
+
+    start(gate, "a", first, release)
+    assert first.wait(5)
+    waiting = start(gate, "b", second, threading.Event())
+    assert not second.wait(0.2)
+    assert gate.running == 1
+
+    release.set()
+    assert second.wait(5)
+    assert gate.reserved == 600
+    waiting.join(0)
+
+
+def test_memory_gate_accounts_resident_memory(memory):
+    memory["footprints"] = {"a": 100, "b": 100}
+    gate = scheduling.MemoryGate(1000, 1, poll_interval=0.01)
+    first, second, release = threading.Event(), threading.Event(), threading.Event()
+
+    # The first page uses far more memory than estimated
+    start(gate, "a", first, release)
+    assert first.wait(5)
+    memory["rss"] = 950
+    start(gate, "b", second, release)
+    assert not second.wait(0.2)
+
+    # Shrinking memory is noticed by polling without a release
+    memory["rss"] = 300
+    assert second.wait(5)
+    release.set()
+
+
+def test_memory_gate_releases_failed_pages(memory):
+    memory["footprints"] = {"a": 600}
+    gate = scheduling.MemoryGate(1000, 1)
+
+    with pytest.raises(RuntimeError):
+        with gate.admit("a"):
+            raise RuntimeError("broken page")
+    assert (gate.running, gate.reserved) == (0, 0)
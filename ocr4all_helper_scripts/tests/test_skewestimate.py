@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from lxml import etree
+
+from ocr4all_helper_scripts.helpers import skewestimate_helper
+from ocr4all_helper_scripts.tests.pages import synthetic_page
+
+
+def test_skewestimate_tree_equals_file_based_helper(tmp_path):
+    root, image = synthetic_page(rotation=1)
+    etree.ElementTree(root).write(str(tmp_path / "page.xml"))
+    image.save(tmp_path / "page.png")
+
+    expected, _ = skewestimate_helper.pagexmlskewestimate(str(tmp_path / "page.xml"), str(tmp_path / "page.png"))
+
+    assert etree.tounicode(skewestimate_helper.skewestimate_tree(root, image)) == expected
+    assert etree.tounicode(skewestimate_helper.skewestimate_tree(root, np.asarray(image))) == expected
+
+
+@pytest.mark.parametrize("rotation", [-1.5, -1, 0, 1, 1.5])
+def test_skewestimate_tree_estimates_rotation(rotation):
+    root, image = synthetic_page(rotation=rotation)
+
+    orientations = skewestimate_helper.region_orientations(skewestimate_helper.skewestimate_tree(root, image))
+
+    assert sorted(orientations) == ["r1", "r2", "r3"]
+    for orientation in orientations.values():
+        assert orientation == pytest.approx(rotation, abs=0.75)
+
+
+def test_skewestimate_tree_keeps_stored_orientations():
+    root, image = synthetic_page(rotation=1, orientations={"r2": -2.0})
+    document = etree.tostring(root)
+
+    kept = skewestimate_helper.region_orientations(skewestimate_helper.skewestimate_tree(root, image))
+    estimated = skewestimate_helper.region_orientations(
+        skewestimate_helper.skewestimate_tree(root, image, from_scratch=True))
+
+    assert etree.tostring(root) == document
+    assert kept["r2"] == -2.0 and estimated["r2"] == pytest.approx(1, abs=0.75)
+    assert kept["r1"] == estimated["r1"]
+
+
+def test_region_orientations():
+    root, _ = synthetic_page(orientations={"r1": 0.25})
+
+    assert skewestimate_helper.region_orientations(root) == {"r1": 0.25, "r2": None, "r3": None}
+
+    skewestimate_helper.skewestimate_tree(root, np.asarray(synthetic_page()[1]), copy=False)
+    assert None not in skewestimate_helper.region_orientations(root).values()
@@ -0,0 +1,21 @@
+import os
+from pathlib import Path
+from typing import Dict
+
+
+def index_directory(path: Path) -> Dict[str, Dict[str, Path]]:
+    """Indexes the files of a directory in a single os.scandir pass.
+
+    :param path: Directory to index.
+    :return: Mapping of file base names (part before the first dot) to their suffixes (part after the first dot) and
+    paths. Missing directories result in an empty index.
+    """
+    index = dict()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                base, _, suffix = entry.name.partition(".")
+                index.setdefault(base, dict())[suffix] = Path(entry.path)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return index
@@ -1,10 +1,185 @@
+from ocr4all_helper_scripts.utils import pagexml
+
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
 from lxml import etree
 from PIL import Image, ImageDraw
 
 
+# Pixel layouts of raw image data which can be memory mapped without any decoding
+RAW_LAYOUTS = {
+    "L": (np.uint8, 1),
+    "RGB": (np.uint8, 3),
+    "RGBA": (np.uint8, 4),
+    "CMYK": (np.uint8, 4),
+    "I;16": (np.dtype("<u2"), 1),
+    "I;16B": (np.dtype(">u2"), 1),
+}
+
+
+def map_raw_image(image: Image) -> Optional[np.ndarray]:
+    """Memory maps the pixel data of an opened but not yet loaded image into a read-only NumPy array, if it is stored
+    uncompressed in one or more contiguous strips (e.g. uncompressed TIFF or binary PNM files).
+
+    :param image: Image as returned by Image.open.
+    :return: Array of shape (height, width[, bands]) backed by the file or None if the data can't be mapped.
+    """
+    if not getattr(image, "filename", None) or not image.tile or image.mode not in RAW_LAYOUTS:
+        return None
+
+    dtype, bands = RAW_LAYOUTS[image.mode]
+    width, height = image.size
+    row_bytes = width * bands * np.dtype(dtype).itemsize
+
+    expected_offset, expected_row = image.tile[0][2], 0
+    for codec, extents, offset, args in image.tile:
+        args = args if isinstance(args, tuple) else (args,)
+        rawmode, stride, orientation = (args + (0, 1))[:3]
+        if codec != "raw" or rawmode != image.mode or stride not in (0, row_bytes) or orientation != 1:
+            return None
+        x0, y0, x1, y1 = extents
+        if x0 != 0 or x1 != width or y0 != expected_row or offset != expected_offset:
+            return None
+        expected_offset, expected_row = offset + (y1 - y0) * row_bytes, y1
+    if expected_row != height:
+        return None
+
+    shape = (height, width) if bands == 1 else (height, width, bands)
+    return np.memmap(image.filename, dtype=dtype, mode="r", offset=image.tile[0][2], shape=shape)
+
+
+def load_image(imgpath: str, preload: bool = False) -> Image:
+    """Opens an image for processing while avoiding unnecessary decoding work and copies. Uncompressed images stored
+    in contiguous strips are memory mapped (zero-copy for the modes PIL can map), bilevel images (e.g. group 4
+    compressed TIFF) are kept in mode '1' and all other images are returned unloaded as by Image.open.
+
+    :param imgpath: Path to the image.
+    :param preload: Read the whole pixel data into memory right away (e.g. to prefetch it from slow storage).
+    :return: Opened image.
+    """
+    im = Image.open(imgpath)
+    pixels = map_raw_image(im)
+    if pixels is not None:
+        mapped = Image.fromarray(np.array(pixels) if preload else pixels)
+        im.close()
+        return mapped
+    if preload:
+        im.load()
+    return im
+
+
+def draft(image: Image, reduce: int) -> Tuple[float, float]:
+    """Configures a not yet loaded JPEG image to be decoded at a reduced resolution (1/2, 1/4 or 1/8). Other images are
+    left untouched.
+
+    :param image: Image as returned by load_image.
+    :param reduce: Factor the resolution may be reduced by.
+    :return: Factors between the original and the reduced size in x and y direction.
+    """
+    width, height = image.size
+    if reduce > 1 and image.format == "JPEG":
+        image.draft(image.mode, (width // reduce, height // reduce))
+    return width / image.width, height / image.height
+
+
+def as_image(image: Union[Image.Image, np.ndarray]) -> Image.Image:
+    """Returns an image given as PIL image or as array of the layout returned by np.asarray(image), i.e. of shape
+    (height, width[, bands]) with boolean values for bi-level images (True for white) and uint8 values otherwise.
+    Images are returned as they are.
+    """
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(np.ascontiguousarray(image))
+
+
+def is_bilevel(image: Image) -> bool:
+    """Returns whether an image is bi-level, i.e. of mode '1' or holding exactly two colors."""
+    if image.mode == "1":
+        return True
+    colors = image.getcolors(2)
+    return colors is not None and len(colors) == 2
+
+
+class PackedBits(object):
+    """A bi-level image (mode '1') or an array of 0/1 values stored with one bit per pixel, rows padded to full bytes
+    as by np.packbits(..., axis=-1). This is the layout PIL uses for the raw data of mode '1' images, so images are
+    packed and unpacked without any intermediate copy.
+    """
+
+    def __init__(self, bits: np.ndarray, shape: Tuple[int, int], dtype: Optional[np.dtype] = None):
+        self.bits = bits
+        self.shape = shape
+        # None for images
+        self.dtype = dtype
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "PackedBits":
+        """Packs a 2D array, whose values must all be 0 or 1."""
+        return cls(np.packbits(array, axis=-1), array.shape, array.dtype)
+
+    @classmethod
+    def from_image(cls, image: Image) -> "PackedBits":
+        """Packs an image of mode '1'."""
+        width, height = image.size
+        return cls(np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(height, -1), (height, width))
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def unpack(self) -> Union[np.ndarray, Image.Image]:
+        """Returns a new copy of the packed array or image."""
+        if self.dtype is None:
+            height, width = self.shape
+            return Image.frombytes("1", (width, height), self.bits.tobytes())
+        return np.unpackbits(self.bits, axis=-1, count=self.shape[1]).astype(self.dtype, copy=False)
+
+
+def pack_bits(value: Any) -> Any:
+    """Replaces all arrays and images of mode '1' in value (recursing into tuples and lists) by PackedBits. All arrays
+    must hold only 0/1 values, images of other modes and other values are left untouched. Objects occurring several
+    times are packed once, so they are unpacked as a single object as well.
+    """
+    packed = {}
+
+    def pack(item):
+        if isinstance(item, (tuple, list)):
+            return type(item)(pack(element) for element in item)
+        if id(item) not in packed:
+            if isinstance(item, np.ndarray):
+                packed[id(item)] = PackedBits.from_array(item)
+            elif isinstance(item, Image.Image) and item.mode == "1":
+                packed[id(item)] = PackedBits.from_image(item)
+            else:
+                return item
+        return packed[id(item)]
+
+    return pack(value)
+
+
+def unpack_bits(value: Any) -> Any:
+    """Reverts pack_bits, returning new copies of all packed arrays and images."""
+    unpacked = {}
+
+    def unpack(item):
+        if isinstance(item, (tuple, list)):
+            return type(item)(unpack(element) for element in item)
+        if not isinstance(item, PackedBits):
+            return item
+        if id(item) not in unpacked:
+            unpacked[id(item)] = item.unpack()
+        return unpacked[id(item)]
+
+    return unpack(value)
+
+
 def remove_images(image: Image, tree: etree.Element):
     """Draw white over ImageRegions
     """
+    image_regions = list(pagexml.iter_regions(tree, "ImageRegion"))
+    if not image_regions:
+        return
     white = {
         "1": 1, "L": 255, "P": 255,
         "RGB": (255, 255, 255), "RGBA": (255, 255, 255, 255),
@@ -12,8 +187,8 @@ def remove_images(image: Image, tree: etree.Element):
         "Lab": (100, 0, 0), "HSV": (0, 0, 100)
     }[image.mode]
     draw = ImageDraw.Draw(image)
-    for image_region in tree.findall('.//{*}ImageRegion'):
-        coords = image_region.find("./{*}Coords")
+    for image_region in image_regions:
+        coords = pagexml.child(image_region, "Coords")
         coordstrings = [x.split(",") for x in coords.get("points").split()]
         poly = [(int(x[0]), int(x[1])) for x in coordstrings]
         draw.polygon(poly, fill=white)
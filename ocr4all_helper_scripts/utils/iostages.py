@@ -0,0 +1,81 @@
+import queue
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+
+class Prefetcher(object):
+    """Loads (reads, decodes and parses) the inputs of upcoming pages in background threads while the workers compute.
+
+    feed wraps the entries handed to the worker pool into (entry, future) tuples and blocks once depth pages are loaded
+    ahead of the pages in progress. Workers have to call release when they are done with a page.
+    """
+
+    def __init__(self, load: Callable[[Any], Any], depth: int, workers: int, threads: int = 1):
+        self.load = load
+        self.slots = threading.Semaphore(depth + workers)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def feed(self, entries: Iterable) -> Iterator[Tuple[Any, Future]]:
+        for entry in entries:
+            self.slots.acquire()
+            yield entry, self.executor.submit(self.load, entry)
+
+    def release(self):
+        self.slots.release()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class AsyncWriter(object):
+    """Writes text files in a background thread, so workers can continue with the next page right away.
+
+    Writers block while the queued contents hold more than max_bytes of memory (a single content larger than the limit
+    is still accepted if nothing else is queued). Failed writes are collected and returned by close.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.queue = queue.Queue()
+        self.errors: List[Tuple[Any, Exception]] = []
+        self.thread = threading.Thread(target=self._run, name="AsyncWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, path: str, content: str, tag: Any = None, on_write: Callable[[], None] = None):
+        """Queues content to be written to path. tag identifies the write in the errors returned by close, on_write
+        is called after the file has been written.
+        """
+        size = sys.getsizeof(content)
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending == 0 or self.pending + size <= self.max_bytes)
+            self.pending += size
+        self.queue.put((path, content, size, tag, on_write))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, content, size, tag, on_write = item
+            try:
+                with Path(path).open("w+") as output_file:
+                    output_file.write(content)
+                if on_write is not None:
+                    on_write()
+            except Exception as e:
+                self.errors.append((tag if tag is not None else path, e))
+            finally:
+                with self.condition:
+                    self.pending -= size
+                    self.condition.notify_all()
+
+    def close(self) -> List[Tuple[Any, Exception]]:
+        """Waits until all queued contents are written and returns the failed writes as (tag, exception) tuples."""
+        self.queue.put(None)
+        self.thread.join()
+        return self.errors
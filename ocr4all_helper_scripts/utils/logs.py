@@ -0,0 +1,100 @@
+"""Logging of the commands.
+
+Workers only put their log records into a queue, from which a single listener thread formats and writes them, so
+workers never wait for each other or for the console. Records of warnings and errors are written to stderr, all others
+to stdout, either as text or as one JSON object per line. Fields passed with extra (e.g. page or region) and those of
+the enclosing context blocks are kept as attributes of the records and written as fields of the JSON objects.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+# Log levels selectable on the command line
+LEVELS = ("debug", "info", "warning", "error")
+
+PACKAGE_LOGGER = "ocr4all_helper_scripts"
+
+# Attributes of every log record. All others are fields passed with extra or by context.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_context = threading.local()
+
+
+@contextmanager
+def context(**fields):
+    """Adds fields (e.g. page or region) to all records logged by the current thread while the context is active."""
+    previous = getattr(_context, "fields", {})
+    _context.fields = dict(previous, **fields)
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class ContextFilter(logging.Filter):
+    """Sets the fields of the active context on records which weren't given them with extra."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in getattr(_context, "fields", {}).items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Formats records as their message, prefixed by their page and region and the level of warnings and errors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        location = ":".join(str(value) for value in (getattr(record, "page", None), getattr(record, "region", None))
+                            if value is not None)
+        if location:
+            message = f"[{location}] {message}"
+        if record.levelno >= logging.WARNING:
+            message = f"{record.levelname}: {message}"
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON objects with time, level, logger, thread, message and the fields of the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": record.created,
+                 "level": record.levelname.lower(),
+                 "logger": record.name,
+                 "thread": record.threadName,
+                 "message": record.getMessage()}
+        entry.update((name, value) for name, value in vars(record).items() if name not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(level: str = "info", json_output: bool = False) -> logging.handlers.QueueListener:
+    """Routes the records of the package loggers of at least the given level through a queue to a single listener
+    thread writing them. The returned listener has to be stopped to write the remaining records.
+    """
+    formatter = JsonFormatter() if json_output else TextFormatter()
+    stdout = logging.StreamHandler(sys.stdout)
+    stdout.addFilter(lambda record: record.levelno < logging.WARNING)
+    stderr = logging.StreamHandler(sys.stderr)
+    stderr.setLevel(logging.WARNING)
+    for handler in (stdout, stderr):
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(PACKAGE_LOGGER)
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(records, stdout, stderr, respect_handler_level=True)
+    listener.start()
+    return listener
+
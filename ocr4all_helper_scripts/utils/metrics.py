@@ -0,0 +1,256 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# Number of slowest pages listed in the summary
+SLOWEST_PAGES = 10
+
+# Per-page latency percentiles listed in the summary
+PERCENTILES = (50, 90, 95, 99)
+
+_current = threading.local()
+
+
+class PageMetrics(object):
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.counts = {"regions": 0, "lines": 0}
+        self.error = None
+
+
+class RunMetrics(object):
+    """Collects throughput, latency, cache and utilisation metrics of a batch run, which are written as a JSON or
+    Prometheus textfile summary afterwards.
+    """
+
+    def __init__(self, command: str, workers: int = 1, shard: Optional[str] = None):
+        self.command = command
+        self.workers = workers
+        self.shard = shard
+        self.pages: List[PageMetrics] = []
+        self.caches: Dict[str, Dict[str, int]] = {}
+        self.phases: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @contextmanager
+    def page(self, name: str):
+        """Measures the processing of a single page in the current thread. Counts and cache lookups reported via the
+        module level functions while the context is active are attributed to this page and run. Exceptions are
+        recorded as failure of the page and re-raised.
+        """
+        page = PageMetrics(name)
+        previous = getattr(_current, "state", None)
+        _current.state = (self, page)
+        start = time.perf_counter()
+        try:
+            yield page
+        except Exception as e:
+            page.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            page.seconds = time.perf_counter() - start
+            _current.state = previous
+            with self.lock:
+                self.pages.append(page)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measures the wall time of a phase of the run which isn't attributable to single pages.
+        """
+        previous = getattr(_current, "state", None)
+        _current.state = (self, None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current.state = previous
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def fail(self, name: str, error: Exception):
+        """Records a failure of an already measured page, e.g. if writing its result failed afterwards.
+        """
+        with self.lock:
+            for page in self.pages:
+                if page.name == name:
+                    page.error = f"{type(error).__name__}: {error}"
+
+    def record_cache(self, cache: str, hit: bool):
+        with self.lock:
+            stats = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def summary(self) -> dict:
+        wall = (self.end or time.perf_counter()) - self.start
+        totals = {key: sum(page.counts.get(key, 0) for page in self.pages) for key in TOTALS}
+        totals["pages"] = len(self.pages)
+        return summarize(command=self.command,
+                         workers=self.workers,
+                         wall=wall,
+                         capacity=wall * self.workers,
+                         totals=totals,
+                         page_seconds=[page.seconds for page in self.pages],
+                         slowest_pages=[{"page": page.name, "seconds": page.seconds, **page.counts}
+                                        for page in self.pages],
+                         caches=self.caches,
+                         phases=self.phases,
+                         failures=[{"page": page.name, "error": page.error} for page in self.pages if page.error],
+                         shards=[{"shard": self.shard, "wall_seconds": wall, "pages": len(self.pages)}])
+
+    def write(self, path: str):
+        """Writes the summary to path, as Prometheus textfile if it ends with .prom and as JSON otherwise.
+        """
+        write_summary(self.summary(), path)
+
+
+# Totals summed up over the pages of a run
+TOTALS = ("regions", "lines", "degraded_regions")
+
+
+def summarize(command: str, workers: int, wall: float, capacity: float, totals: Dict[str, int],
+              page_seconds: Sequence[float], slowest_pages: List[dict], caches: Dict[str, Dict[str, int]],
+              phases: Dict[str, float], failures: List[dict], shards: List[dict]) -> dict:
+    """Builds a run summary. capacity is the total worker time available (wall time times workers).
+    """
+    latencies = np.array(page_seconds)
+
+    def rate(count):
+        return count / wall if wall > 0 else 0.0
+
+    return {
+        "command": command,
+        "workers": workers,
+        "wall_seconds": wall,
+        "pages": totals["pages"],
+        **{key: totals[key] for key in TOTALS},
+        "failed_pages": len(failures),
+        "pages_per_second": rate(totals["pages"]),
+        "regions_per_second": rate(totals["regions"]),
+        "lines_per_second": rate(totals["lines"]),
+        "page_latency_seconds": {
+            f"p{p}": float(np.percentile(latencies, p)) if len(latencies) else None for p in PERCENTILES
+        },
+        "slowest_pages": sorted(slowest_pages, key=lambda page: page["seconds"], reverse=True)[:SLOWEST_PAGES],
+        "caches": {
+            cache: {"hits": stats["hits"], "misses": stats["misses"],
+                    "hit_rate": stats["hits"] / max(1, stats["hits"] + stats["misses"])}
+            for cache, stats in caches.items()
+        },
+        "phases_seconds": dict(phases),
+        "worker_utilisation": float(latencies.sum()) / capacity if capacity > 0 else 0.0,
+        "failures": failures,
+        "shards": shards,
+        "page_seconds": [float(seconds) for seconds in page_seconds],
+    }
+
+
+def merge(summaries: Sequence[dict]) -> dict:
+    """Merges the JSON summaries of several runs, e.g. the shards of a dataset processed on different nodes, into the
+    summary of a single run which took as long as the slowest of them.
+    """
+    caches = {}
+    phases = {}
+    for summary in summaries:
+        for cache, stats in summary["caches"].items():
+            merged = caches.setdefault(cache, {"hits": 0, "misses": 0})
+            merged["hits"] += stats["hits"]
+            merged["misses"] += stats["misses"]
+        for phase, seconds in summary["phases_seconds"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    return summarize(command=summaries[0]["command"],
+                     workers=sum(summary["workers"] for summary in summaries),
+                     wall=max(summary["wall_seconds"] for summary in summaries),
+                     capacity=sum(summary["wall_seconds"] * summary["workers"] for summary in summaries),
+                     totals={key: sum(summary[key] for summary in summaries) for key in ("pages",) + TOTALS},
+                     page_seconds=[seconds for summary in summaries for seconds in summary["page_seconds"]],
+                     slowest_pages=[page for summary in summaries for page in summary["slowest_pages"]],
+                     caches=caches,
+                     phases=phases,
+                     failures=[failure for summary in summaries for failure in summary["failures"]],
+                     shards=[shard for summary in summaries for shard in summary["shards"]])
+
+
+def write_summary(summary: dict, path: str):
+    """Writes a summary to path, as Prometheus textfile if it ends with .prom and as JSON otherwise.
+    """
+    with Path(path).open("w") as outfile:
+        if Path(path).suffix == ".prom":
+            outfile.write(to_prometheus(summary))
+        else:
+            json.dump(summary, outfile, indent=2)
+
+
+def to_prometheus(summary: dict) -> str:
+    """Formats a run summary in the Prometheus textfile exposition format.
+    """
+    command = summary["command"]
+    lines = []
+
+    def metric(name: str, help_text: str, samples: list):
+        lines.append(f"# HELP ocr4all_{name} {help_text}")
+        lines.append(f"# TYPE ocr4all_{name} gauge")
+        for labels, value in samples:
+            labels = {"command": command, **labels}
+            label_str = ",".join('{}="{}"'.format(key, str(val).replace('"', '\\"')) for key, val in labels.items())
+            lines.append(f"ocr4all_{name}{{{label_str}}} {value}")
+
+    metric("wall_seconds", "Wall time of the run.", [({}, summary["wall_seconds"])])
+    for unit in ("pages", "regions", "lines"):
+        metric(f"{unit}_processed", f"Number of processed {unit}.", [({}, summary[unit])])
+        metric(f"{unit}_per_second", f"Processed {unit} per second.", [({}, summary[f"{unit}_per_second"])])
+    metric("degraded_regions", "Number of regions which exceeded their time budget.",
+           [({}, summary["degraded_regions"])])
+    metric("failed_pages", "Number of pages which failed.", [({}, summary["failed_pages"])])
+    metric("page_latency_seconds", "Per-page latency percentiles.",
+           [({"quantile": str(int(p[1:]) / 100)}, value) for p, value in summary["page_latency_seconds"].items()
+            if value is not None])
+    metric("slowest_page_seconds", "Latency of the slowest pages.",
+           [({"page": page["page"], "regions": page["regions"]}, page["seconds"])
+            for page in summary["slowest_pages"]])
+    metric("cache_hit_ratio", "Hit rate of caches.",
+           [({"cache": cache}, stats["hit_rate"]) for cache, stats in summary["caches"].items()])
+    metric("phase_seconds", "Wall time of run phases.",
+           [({"phase": phase}, seconds) for phase, seconds in summary["phases_seconds"].items()])
+    metric("worker_utilisation", "Busy time of the workers relative to the wall time.",
+           [({}, summary["worker_utilisation"])])
+    return "\n".join(lines) + "\n"
+
+
+def count(key: str, amount: int = 1):
+    """Adds amount to a counter (e.g. "regions" or "lines") of the page processed in the current thread, if any.
+    """
+    state = getattr(_current, "state", None)
+    if state is not None and state[1] is not None:
+        state[1].counts[key] = state[1].counts.get(key, 0) + amount
+
+
+def cache_lookup(cache: str, hit: bool):
+    """Records a cache hit or miss for the run active in the current thread, if any.
+    """
+    state = getattr(_current, "state", None)
+    if state is not None:
+        state[0].record_cache(cache, hit)
+
+
+@contextmanager
+def page(run: Optional[RunMetrics], name: str):
+    """Measures a page if run metrics are collected, otherwise does nothing.
+    """
+    if run is None:
+        yield None
+    else:
+        with run.page(name) as page_metrics:
+            yield page_metrics
@@ -1,9 +1,16 @@
+from ocr4all_helper_scripts.utils import pagexml
+
+import logging
+
 from lxml import etree
 from shapely.errors import TopologicalError
 from shapely.geometry import Polygon, MultiPolygon, GeometryCollection
 from shapely.ops import unary_union
 
 
+logger = logging.getLogger(__name__)
+
+
 def sanitize(polygon: Polygon,
              parent: Polygon,
              page_width: int,
@@ -11,7 +18,7 @@ def sanitize(polygon: Polygon,
     try:
         sanitized_polygon = parent.intersection(polygon)
     except TopologicalError as e:
-        print("Couldn't create intersection of polygon and parent polygon...")
+        logger.warning("Couldn't create intersection of polygon and parent polygon...")
         return [(x, y) for x, y in polygon.exterior.coords]
     # If intersection leads to more than one element build the convex hull of all polygons
     if isinstance(sanitized_polygon, GeometryCollection) or isinstance(sanitized_polygon, MultiPolygon):
@@ -24,19 +31,16 @@ def sanitize(polygon: Polygon,
 
 
 def get_root(xmlfile: str) -> etree.Element:
-    try:
-        return etree.parse(xmlfile).getroot()
-    except etree.ParseError as e:
-        raise e
+    return pagexml.parse(xmlfile)
 
 
 def convert_point_notation(tree: etree.Element):
     """Converts point notation from older PAGE XML versions to latest coords attribute notation
 
     """
-    for coord in [c for c in tree.findall(".//{*}Coords") if not c.attrib.get("points")]:
+    for coord in pagexml.xpath(".//p:Coords[not(@points) or @points='']", tree)(tree):
         cc = []
-        for point in coord.find("./{*}Point"):
+        for point in list(pagexml.children(coord, "Point")):
             cx = point.attrib["x"]
             cy = point.attrib["y"]
             coord.remove(point)
@@ -49,12 +53,12 @@ def construct_coordmap(tree: etree.Element) -> dict:
     TextRegion element"""
     coordmap = {}
 
-    for text_region in tree.findall('.//{*}TextRegion'):
+    for text_region in pagexml.iter_regions(tree):
         region_id = text_region.attrib["id"]
         coordmap[region_id] = {"type": text_region.attrib.get("type", "TextRegion")}
         coordmap[region_id]["coords"] = []
 
-        for coord in text_region.findall("./{*}Coords"):
+        for coord in pagexml.children(text_region, "Coords"):
             coordmap[region_id]["coordstring"] = coord.attrib["points"]
             coordstrings = [x.split(",") for x in coord.attrib["points"].split()]
             coordmap[region_id]["coords"] += [[int(x[0]), int(x[1])] for x in coordstrings]
@@ -65,5 +69,14 @@ def construct_coordmap(tree: etree.Element) -> dict:
 
 
 def remove_existing_textlines(tree: etree.Element):
-    for textline in tree.findall(".//{*}TextLine"):
+    for textline in list(pagexml.iter_lines(tree)):
         textline.getparent().remove(textline)
+
+
+def add_custom(element: etree.Element, key: str, **properties):
+    """Appends an entry in the PAGE XML custom attribute notation (e.g. 'lineseg {fallback:bbox;}') to the custom
+    attribute of an element."""
+    entry = "{} {{{}}}".format(key, "".join(f"{name.replace('_', '-')}:{value};"
+                                            for name, value in properties.items()))
+    custom = element.get("custom")
+    element.set("custom", f"{custom} {entry}" if custom else entry)
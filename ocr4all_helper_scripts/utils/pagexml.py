@@ -0,0 +1,115 @@
+"""Shared access to PAGE XML documents.
+
+Documents are parsed with a shared, tuned parser (one per thread, as lxml parsers mustn't be used concurrently).
+Descendant searches use exact tag names resolved against the namespace of the document, so a single C level traversal
+replaces the wildcard namespace searches of findall(".//{*}..."). XPath expressions are compiled once per namespace
+and reused for all documents.
+"""
+import threading
+from copy import deepcopy
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+from lxml import etree
+
+
+_parsers = threading.local()
+
+
+def parser() -> etree.XMLParser:
+    """Returns the PAGE XML parser of the current thread. Entity resolution and network access are disabled and huge
+    documents are accepted.
+    """
+    if not hasattr(_parsers, "parser"):
+        _parsers.parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+    return _parsers.parser
+
+
+def parse(xmlfile: Union[str, Path]) -> etree.Element:
+    """Parses a PAGE XML file and returns its root element."""
+    return etree.parse(str(xmlfile), parser()).getroot()
+
+
+def as_root(page: Union[etree._Element, etree._ElementTree], copy: bool = False) -> etree.Element:
+    """Returns the root element of an already parsed PAGE XML document given as element tree or any of its elements,
+    or of a deep copy of the document if copy is set.
+    """
+    root = page.getroot() if isinstance(page, etree._ElementTree) else page.getroottree().getroot()
+    return deepcopy(root) if copy else root
+
+
+def namespace(element: etree.Element) -> Optional[str]:
+    """Returns the namespace of an element (i.e. the PAGE XML version of its document)."""
+    return etree.QName(element).namespace
+
+
+def tag(element: etree.Element, name: str) -> str:
+    """Returns the fully qualified tag of a PAGE XML element name in the namespace of element."""
+    ns = namespace(element)
+    return f"{{{ns}}}{name}" if ns else name
+
+
+@lru_cache(maxsize=None)
+def _compile(expression: str, ns: Optional[str]) -> etree.XPath:
+    return etree.XPath(expression, namespaces={"p": ns} if ns else None)
+
+
+def xpath(expression: str, element: etree.Element) -> etree.XPath:
+    """Returns the compiled XPath expression for the namespace of element. PAGE XML elements are referenced with the
+    prefix p, e.g. "./p:TextEquiv[@index=$index]". Variables are passed as keyword arguments when calling the result.
+    """
+    ns = namespace(element)
+    if not ns:
+        expression = expression.replace("p:", "")
+    return _compile(expression, ns)
+
+
+def iter_elements(element: etree.Element, name: str) -> Iterator[etree.Element]:
+    """Iterates over all descendant PAGE XML elements of the given name in document order. Elements added without
+    namespace (e.g. by etree.SubElement(parent, "TextLine")) are included.
+    """
+    qualified = tag(element, name)
+    return element.iter(qualified, name) if qualified != name else element.iter(name)
+
+
+def iter_regions(element: etree.Element, name: str = "TextRegion") -> Iterator[etree.Element]:
+    return iter_elements(element, name)
+
+
+def iter_lines(element: etree.Element) -> Iterator[etree.Element]:
+    return iter_elements(element, "TextLine")
+
+
+def children(element: etree.Element, name: str) -> Iterator[etree.Element]:
+    """Iterates over the direct children of the given name, in any namespace."""
+    return element.iterchildren("{*}" + name)
+
+
+def child(element: etree.Element, name: str) -> Optional[etree.Element]:
+    """Returns the first direct child of the given name, in any namespace."""
+    return next(children(element, name), None)
+
+
+def text_equivs(element: etree.Element, index: Optional[str] = None) -> List[etree.Element]:
+    """Returns the TextEquiv children of element, only those with the given index attribute if index is given."""
+    if index is None:
+        return list(children(element, "TextEquiv"))
+    return [equiv for equiv in children(element, "TextEquiv") if equiv.get("index") == str(index)]
+
+
+def unicode_text(text_equiv: etree.Element) -> Optional[str]:
+    """Returns the text content of the Unicode element of a TextEquiv or None if it has none."""
+    unicode = child(text_equiv, "Unicode")
+    return None if unicode is None else "".join(unicode.itertext())
+
+
+def coords_points(element: etree.Element) -> List[List[int]]:
+    """Returns the points of the Coords child of element, in the points attribute or the older Point notation."""
+    points = []
+    for coords in children(element, "Coords"):
+        if "points" in coords.attrib:
+            points += [[int(x) for x in point.split(",")] for point in coords.attrib["points"].split()]
+        else:
+            points += [[int(point.attrib["x"]), int(point.attrib["y"])] for point in children(coords, "Point")]
+    return points
@@ -0,0 +1,176 @@
+import marshal
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Seconds between two samples of the worker stacks
+SAMPLE_INTERVAL = 0.01
+
+# Number of functions listed in the report of the hottest functions
+TOP_FUNCTIONS = 20
+
+# Package whose lib and helpers modules are listed in the report
+_PACKAGE = Path(__file__).resolve().parents[1]
+_REPORTED = tuple(str(Path(_PACKAGE, module)) for module in ("lib", "helpers"))
+
+# (filename, first line, function name) as used by pstats
+FunctionKey = Tuple[str, int, str]
+
+
+def function_key(code) -> FunctionKey:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def function_label(key: FunctionKey) -> str:
+    """Returns a short readable name of a function, with its path relative to the package if it is part of it."""
+    filename, line, name = key
+    path = Path(filename)
+    try:
+        path = path.relative_to(_PACKAGE.parent)
+    except ValueError:
+        path = Path(path.name)
+    return f"{name} ({path}:{line})"
+
+
+class RunProfiler(object):
+    """Sampling profiler for the workers of a batch run.
+
+    A background thread samples the Python stacks of all threads that are processing a page every interval seconds.
+    Each sample is weighted with the wall time since the previous one, so stalls of the sampling thread (e.g. while a
+    worker holds the GIL) don't skew the results. Time spent in C extensions (NumPy, SciPy, PIL) is attributed to the
+    Python function calling them. Samples of all workers are merged and written as pstats file, as collapsed stacks
+    for flame graphs and as report of the hottest functions of the lib and helpers modules, where the time spent in
+    other libraries counts towards the innermost function of these modules calling them.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.active = set()
+        self.workers = set()
+        # Number of samples and wall time in seconds per stack of function keys (outermost first)
+        self.samples: Dict[Tuple[FunctionKey, ...], int] = Counter()
+        self.seconds: Dict[Tuple[FunctionKey, ...], float] = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="RunProfiler", daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def page(self):
+        """Samples the current thread while the context is active."""
+        ident = threading.get_ident()
+        with self.lock:
+            self.active.add(ident)
+            self.workers.add(ident)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active.discard(ident)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            with self.lock:
+                active = set(self.active)
+            if not active:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident not in active:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(function_key(frame.f_code))
+                    frame = frame.f_back
+                stack = tuple(reversed(stack))
+                self.samples[stack] += 1
+                self.seconds[stack] += weight
+
+    def finish(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def stats(self) -> Dict[FunctionKey, tuple]:
+        """Returns the samples in the format of pstats (marshalled by cProfile.Profile.dump_stats). Call counts are
+        the numbers of samples a function (or a call from a caller) occurs in.
+        """
+        counts = Counter()
+        own = Counter()
+        total = Counter()
+        callers = defaultdict(lambda: defaultdict(lambda: [0, 0, 0.0, 0.0]))
+        for stack, seconds in self.seconds.items():
+            samples = self.samples[stack]
+            own[stack[-1]] += seconds
+            # Recursive functions are only counted once per sample
+            for key in set(stack):
+                counts[key] += samples
+                total[key] += seconds
+            for caller, callee in set(zip(stack, stack[1:])):
+                edge = callers[callee][caller]
+                edge[0] += samples
+                edge[1] += samples
+                edge[3] += seconds
+                if callee == stack[-1]:
+                    edge[2] += seconds
+        return {key: (counts[key], counts[key], own[key], total[key],
+                      {caller: tuple(edge) for caller, edge in callers[key].items()})
+                for key in counts}
+
+    def collapsed(self) -> List[str]:
+        """Returns the samples as collapsed stacks (one "outer;...;inner weight" line per stack) as read by
+        flamegraph.pl or speedscope. Weights are microseconds of wall time.
+        """
+        lines = Counter()
+        for stack, seconds in self.seconds.items():
+            lines[";".join(function_label(key) for key in stack)] += seconds
+        return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(lines.items()) if seconds >= 5e-7]
+
+    def top(self, limit: int = TOP_FUNCTIONS) -> List[str]:
+        """Returns a report of the functions of the lib and helpers modules with the highest own time, i.e. the time
+        they are the innermost of these functions on the stack.
+        """
+        own = Counter()
+        total = Counter()
+        for stack, seconds in self.seconds.items():
+            reported = [key for key in stack if key[0].startswith(_REPORTED)]
+            if reported:
+                own[reported[-1]] += seconds
+            for key in set(reported):
+                total[key] += seconds
+        sampled = sum(self.seconds.values()) or 1.0
+        lines = [f"Hottest functions of lib and helpers ({sum(self.samples.values())} samples of "
+                 f"{len(self.workers)} workers, {sampled:.1f} s sampled):",
+                 f"{'own s':>9} {'own %':>6} {'total s':>9} {'total %':>7}  function"]
+        for key, seconds in own.most_common(limit):
+            lines.append(f"{seconds:9.3f} {100 * seconds / sampled:5.1f}% {total[key]:9.3f} "
+                         f"{100 * total[key] / sampled:6.1f}%  {function_label(key)}")
+        return lines
+
+    def write(self, directory: str) -> List[str]:
+        """Writes profile.pstats, profile.collapsed and top.txt into directory and returns the report of top."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with Path(directory, "profile.pstats").open("wb") as stats_file:
+            marshal.dump(self.stats(), stats_file)
+        with Path(directory, "profile.collapsed").open("w") as collapsed_file:
+            collapsed_file.writelines(line + "\n" for line in self.collapsed())
+        report = self.top()
+        with Path(directory, "top.txt").open("w") as top_file:
+            top_file.writelines(line + "\n" for line in report)
+        return report
+
+
+@contextmanager
+def page(profiler: Optional[RunProfiler]):
+    """Samples the current thread while processing a page if the run is profiled, otherwise does nothing."""
+    if profiler is None:
+        yield
+    else:
+        with profiler.page():
+            yield
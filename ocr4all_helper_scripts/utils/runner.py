@@ -0,0 +1,150 @@
+"""Batch runs of a per-page function over the entries of a dataset file.
+
+The dataset is a JSON list of [image, PAGE XML, optional output] entries. run_dataset takes care of everything around
+the processing of the single pages which the commands have in common: sharding and ordering the dataset, prefetching
+the inputs, admitting pages into a memory budget, writing the results in the background, collecting metrics and
+profiles and reporting failed pages at the end of the run.
+"""
+from ocr4all_helper_scripts.utils import iostages, metrics, profiling, scheduling
+
+from contextlib import nullcontext
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+import click
+
+
+logger = logging.getLogger(__name__)
+
+# Processes a page given its image path, PAGE XML path, output path and the inputs returned by the load function (None
+# if they weren't prefetched) and yields the (path, content) tuples of the files to write
+ProcessFunction = Callable[[str, str, str, Any], Iterable[Tuple[str, str]]]
+
+
+def run_options(func):
+    """Adds the options of run_dataset shared by the batch commands."""
+    options = [
+        click.option("--shard", type=str, default=None, callback=scheduling.parse_shard,
+                     help="Only process shard INDEX/COUNT (e.g. 2/4) of the dataset. The dataset is split "
+                          "deterministically into COUNT shards of about the same estimated cost (pixels times "
+                          "regions)."),
+        click.option("--order", type=click.Choice(scheduling.ORDERS), default="dataset",
+                     help="Order pages are dispatched to the workers in. 'largest-first' starts with the pages of the "
+                          "highest estimated cost (pixels times regions) to avoid a single worker finishing a big "
+                          "page last."),
+        click.option("--prefetch", type=int, default=0,
+                     help="Number of pages whose images and PAGE XML files are read and decoded ahead of the "
+                          "processing in a background thread. Keeps the workers busy on slow storage."),
+        click.option("--write-buffer", type=int, default=0,
+                     help="Write the results in a background thread, buffering up to this many MB of results. "
+                          "Results are written by the workers themselves if 0."),
+        click.option("--max-memory", type=int, default=0,
+                     help="Memory budget of the process in MB. New pages are only started once their footprint "
+                          "estimated from the image size fits next to the pages in progress and the measured memory "
+                          "usage. Unlimited if 0."),
+        click.option("--profile", "profile_dir", type=str, default=None,
+                     help="Profile the workers by sampling their stacks and write the merged profile into this "
+                          "directory: profile.pstats (pstats format), profile.collapsed (collapsed stacks for flame "
+                          "graphs) and top.txt (hottest functions of the lib and helpers modules, also printed at the "
+                          "end of the run)."),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def parse_entry(data: list) -> Tuple[str, str, str]:
+    """Returns image, PAGE XML and output path of a dataset entry. The output defaults to the PAGE XML file."""
+    if len(data) == 3:
+        return data[0], data[1], data[2]
+    if len(data) == 2:
+        return data[0], data[1], data[1]
+    raise ValueError(f"Invalid data line with length {len(data)} instead of 2 or 3")
+
+
+def run_dataset(dataset: str, parallel: int, process: ProcessFunction, load: Optional[Callable[[str, str], Any]] = None,
+                command: str = "run", bytes_per_pixel: int = scheduling.PAGELINESEG_BYTES_PER_PIXEL,
+                metrics_file: str = None, shard: Tuple[int, int] = None, order: str = "dataset", prefetch: int = 0,
+                write_buffer: int = 0, max_memory: int = 0, profile_dir: str = None):
+    """Runs process on every entry of a dataset file (or the given (index, count) shard of it) with parallel worker
+    threads and writes the files it yields. Failing pages are reported after all other pages are processed.
+
+    If prefetch is set, load(image, pagexml) is called for this many pages ahead in a background thread and its result
+    is passed to process. If write_buffer is set, results are written in a background thread which buffers up to
+    write_buffer MB. If max_memory is set, workers only start pages which fit into a memory budget of max_memory MB
+    with the given footprint per image pixel (see scheduling.MemoryGate). If metrics_file is set, a summary of the run
+    is written to it (see metrics.RunMetrics). If profile_dir is set, the workers are profiled and the merged profile
+    is written to it (see profiling.RunProfiler).
+    """
+    with Path(dataset).open("r") as data_file:
+        dataset = scheduling.select_shard(json.load(data_file), shard)
+
+    workers = max(1, min(parallel, len(dataset)))
+    run_metrics = metrics.RunMetrics(command, workers, "/".join(map(str, shard)) if shard else None) \
+        if metrics_file else None
+    failures = []
+    prefetcher = iostages.Prefetcher(lambda data: load(data[0], data[1]), prefetch, workers) \
+        if prefetch and load is not None else None
+    writer = iostages.AsyncWriter(write_buffer * 2 ** 20) if write_buffer else None
+    gate = scheduling.MemoryGate(max_memory * 2 ** 20, bytes_per_pixel) if max_memory else None
+    profiler = profiling.RunProfiler() if profile_dir else None
+
+    def parallel_proc(data):
+        loading = None
+        if prefetcher is not None:
+            data, loading = data
+        try:
+            with gate.admit(data[0]) if gate is not None and data else nullcontext(), profiling.page(profiler):
+                run_page(data, loading)
+        finally:
+            if prefetcher is not None:
+                prefetcher.release()
+
+    def run_page(data, loading):
+        image, pagexml, path_out = parse_entry(data)
+        try:
+            with metrics.page(run_metrics, image):
+                page = loading.result() if loading is not None else None
+                for path, content in process(image, pagexml, path_out, page):
+                    if writer is not None:
+                        writer.write(path, content, tag=image,
+                                     on_write=lambda path=path: logger.info("Saved annotations into '%s'", path,
+                                                                            extra={"image": image, "output": path}))
+                    else:
+                        with Path(path).open("w+") as output_file:
+                            logger.info("Save annotations into '%s'", path, extra={"image": image, "output": path})
+                            output_file.write(content)
+        except Exception as e:
+            logger.error("Processing '%s' failed: %s: %s", image, type(e).__name__, e, exc_info=True,
+                         extra={"image": image})
+            failures.append(image)
+
+    logger.info("Process %s images, with %s in parallel", len(dataset), parallel)
+
+    with ThreadPool(processes=workers) as pool:
+        scheduling.dispatch(pool, parallel_proc, dataset, order, prefetcher)
+
+    if prefetcher is not None:
+        prefetcher.close()
+    if writer is not None:
+        for image, e in writer.close():
+            logger.error("Writing the result of '%s' failed: %s: %s", image, type(e).__name__, e, exc_info=e,
+                         extra={"image": image})
+            if image not in failures:
+                failures.append(image)
+            if run_metrics is not None:
+                run_metrics.fail(image, e)
+
+    if run_metrics is not None:
+        run_metrics.finish()
+        run_metrics.write(metrics_file)
+
+    if profiler is not None:
+        profiler.finish()
+        logger.info("\n".join(profiler.write(profile_dir)))
+
+    if failures:
+        raise click.ClickException(f"{len(failures)} of {len(dataset)} pages failed: {', '.join(failures)}")
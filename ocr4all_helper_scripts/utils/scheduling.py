@@ -0,0 +1,172 @@
+import heapq
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import click
+from lxml import etree
+from PIL import Image
+
+
+def parse_shard(ctx, param, value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Click callback parsing a shard given as INDEX/COUNT (1-based) into a (index, count) tuple."""
+    if value is None:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not of the form INDEX/COUNT")
+    if not 1 <= index <= count:
+        raise click.BadParameter(f"Shard index {index} is not between 1 and {count}")
+    return index, count
+
+
+def count_text_regions(pagexml: str) -> int:
+    """Counts the TextRegions of a PAGE XML file without building the tree."""
+    count = 0
+    for _, element in etree.iterparse(pagexml, events=("end",), tag="{*}TextRegion"):
+        count += 1
+        element.clear()
+    return count
+
+
+def image_pixels(image: str) -> int:
+    """Returns the pixel count of an image, reading only its header."""
+    with Image.open(image) as im:
+        width, height = im.size
+    return width * height
+
+
+def estimate_cost(image: str, pagexml: str) -> int:
+    """Estimates the processing cost of a page as pixel count times TextRegion count, reading only the image header.
+    Pages whose files can't be read are estimated at zero cost.
+    """
+    try:
+        return image_pixels(image) * max(1, count_text_regions(pagexml))
+    except (OSError, etree.XMLSyntaxError):
+        return 0
+
+
+def estimate_costs(dataset: Sequence[list]) -> List[int]:
+    return [estimate_cost(entry[0], entry[1]) if len(entry) >= 2 else 0 for entry in dataset]
+
+
+def shard_dataset(dataset: Sequence[list], index: int, count: int) -> List[list]:
+    """Deterministically partitions a dataset into count shards of about the same estimated cost and returns the
+    entries of shard index (1-based) in dataset order.
+
+    Entries are assigned largest first to the shard with the lowest total cost so far (ties broken by dataset position
+    and shard number), so every node computes the same partition from the same dataset.
+    """
+    costs = estimate_costs(dataset)
+    loads = [(0, shard) for shard in range(count)]
+    assignment = [0] * len(dataset)
+    for position in sorted(range(len(dataset)), key=lambda i: (-costs[i], i)):
+        load, shard = heapq.heappop(loads)
+        assignment[position] = shard
+        heapq.heappush(loads, (load + costs[position], shard))
+    return [entry for entry, shard in zip(dataset, assignment) if shard == index - 1]
+
+
+def select_shard(dataset: Sequence[list], shard: Optional[Tuple[int, int]]) -> List[list]:
+    """Returns the entries of the given (index, count) shard of the dataset, or the whole dataset if shard is None."""
+    if shard is None:
+        return list(dataset)
+    return shard_dataset(dataset, *shard)
+
+
+# Orders the entries of a dataset can be dispatched to the workers in
+ORDERS = ("dataset", "largest-first")
+
+
+def order_dataset(dataset: Sequence[list], order: str = "dataset") -> List[list]:
+    """Returns the dataset entries in the given dispatch order. "largest-first" sorts them by descending estimated
+    cost (stable for equal costs), so big pages don't end up last on a single worker.
+    """
+    if order == "largest-first":
+        costs = estimate_costs(dataset)
+        return [dataset[i] for i in sorted(range(len(dataset)), key=lambda i: -costs[i])]
+    return list(dataset)
+
+
+def dispatch(pool, func: Callable, dataset: Sequence[list], order: str = "dataset", prefetcher=None):
+    """Applies func to all dataset entries with the worker pool. Entries are handed out one at a time in the given
+    order, instead of in chunks in dataset order. With an iostages.Prefetcher, func receives (entry, future) tuples of
+    the entries and their loaded inputs.
+    """
+    if prefetcher is not None:
+        for _ in pool.imap_unordered(func, prefetcher.feed(order_dataset(dataset, order)), chunksize=1):
+            pass
+    elif order == "dataset":
+        pool.map(func, dataset)
+    else:
+        for _ in pool.imap_unordered(func, order_dataset(dataset, order), chunksize=1):
+            pass
+
+
+# Peak memory of a page in progress in bytes per image pixel, measured on large pages (float64 gradient maps,
+# distance transform indices and crops of the regions for the line segmentation, a few 8 bit copies for the skew
+# estimation)
+PAGELINESEG_BYTES_PER_PIXEL = 32
+SKEWESTIMATE_BYTES_PER_PIXEL = 8
+
+
+def estimate_footprint(image: str, bytes_per_pixel: int) -> int:
+    """Estimates the peak memory of processing a page from its image dimensions. Pages whose image can't be read are
+    estimated at zero bytes.
+    """
+    try:
+        return image_pixels(image) * bytes_per_pixel
+    except OSError:
+        return 0
+
+
+def resident_memory() -> Optional[int]:
+    """Returns the resident set size of the process in bytes or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryGate(object):
+    """Admission control keeping the memory of the process below max_bytes.
+
+    A worker may only start a page once the estimated footprint of the page fits into the budget next to the pages in
+    progress. Their memory is accounted as the larger of their estimated footprints and the measured resident set size,
+    so underestimated pages reduce the concurrency as well. A single page is always admitted if no other page is in
+    progress.
+    """
+
+    def __init__(self, max_bytes: int, bytes_per_pixel: int, poll_interval: float = 0.5):
+        self.max_bytes = max_bytes
+        self.bytes_per_pixel = bytes_per_pixel
+        self.poll_interval = poll_interval
+        self.baseline = resident_memory() or 0
+        self.reserved = 0
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def usage(self) -> int:
+        """Returns the memory currently accounted for the process in bytes."""
+        return max(self.baseline + self.reserved, resident_memory() or 0)
+
+    @contextmanager
+    def admit(self, image: str):
+        """Blocks until the page of the given image fits into the budget and accounts it until the context is left."""
+        footprint = estimate_footprint(image, self.bytes_per_pixel)
+        with self.condition:
+            # The resident set size shrinks without notification, so it is polled while waiting
+            while self.running and self.usage() + footprint > self.max_bytes:
+                self.condition.wait(self.poll_interval)
+            self.running += 1
+            self.reserved += footprint
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.reserved -= footprint
+                self.condition.notify_all()
@@ -0,0 +1,30 @@
+import time
+from typing import Optional
+
+
+class BudgetExceeded(Exception):
+    """Raised by Deadline.check if the time budget of a page or region is used up."""
+
+
+class Deadline(object):
+    """Cooperative time budget. Long running loops poll it and stop or degrade once it expired.
+
+    A deadline without seconds never expires. If a parent deadline is given, the deadline expires with the parent at
+    the latest.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        self.end = time.perf_counter() + seconds if seconds else None
+        if parent is not None and parent.end is not None:
+            self.end = parent.end if self.end is None else min(self.end, parent.end)
+        self.exceeded = False
+
+    def expired(self) -> bool:
+        """Returns whether the budget is used up. Stays True once it expired."""
+        if not self.exceeded and self.end is not None and time.perf_counter() >= self.end:
+            self.exceeded = True
+        return self.exceeded
+
+    def check(self):
+        if self.expired():
+            raise BudgetExceeded()
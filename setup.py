@@ -31,6 +31,9 @@ setup(name='ocr4all_helper_scripts',
             "scikit-image",
             "Pillow"
       ],
+      extras_require={
+            "numba": ["numba"]
+      },
       keywords=["OCR", "optical character recognition"],
       zip_safe=False
       )